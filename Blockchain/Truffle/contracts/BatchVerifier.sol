@@ -0,0 +1,58 @@
+pragma solidity ^0.8.0;
+
+import "./verifier.sol";
+pragma experimental ABIEncoderV2;
+
+// Verifies many Groth16 proofs of the same circuit with one multi pairing.
+// Every proof i is weighted with a pseudo random scalar r_i derived from all proofs and inputs,
+// the batch holds iff prod e(r_i*A_i,B_i) * e(-sum r_i*vk_x_i,gamma) * e(-sum r_i*C_i,delta) * e(-sum r_i*alpha,beta) == 1.
+// That costs n+3 pairings instead of 4n, and since vk_x is linear in the inputs the 183 input
+// columns are combined first so only 183 scalar multiplications are needed for the whole batch.
+contract BatchVerifier is Verifier {
+    uint256 constant snark_scalar_field = 21888242871839275222246405745257275088548364400416034343698204186575808495617;
+
+    function batchScalars(Proof[] memory proofs, uint[183][] memory inputs) internal pure returns (uint[] memory r, uint r_sum) {
+        uint256 seed = uint256(keccak256(abi.encode(proofs, inputs)));
+        r = new uint[](proofs.length);
+        for (uint i = 0; i < proofs.length; i++) {
+            // 128 bit scalars are enough for a soundness error of 2^-128
+            r[i] = uint256(keccak256(abi.encode(seed, i))) >> 128;
+            r_sum = addmod(r_sum, r[i], snark_scalar_field);
+        }
+    }
+
+    function combinedInput(VerifyingKey memory vk, uint[183][] memory inputs, uint[] memory r, uint r_sum) internal view returns (Pairing.G1Point memory vk_x) {
+        require(vk.gamma_abc.length == 184);
+        vk_x = Pairing.scalar_mul(vk.gamma_abc[0], r_sum);
+        for (uint j = 0; j < 183; j++) {
+            uint256 s = 0;
+            for (uint i = 0; i < inputs.length; i++) {
+                require(inputs[i][j] < snark_scalar_field);
+                s = addmod(s, mulmod(r[i], inputs[i][j], snark_scalar_field), snark_scalar_field);
+            }
+            vk_x = Pairing.addition(vk_x, Pairing.scalar_mul(vk.gamma_abc[j + 1], s));
+        }
+    }
+
+    function verifyTxBatch(Proof[] memory proofs, uint[183][] memory inputs) public view returns (bool) {
+        require(proofs.length > 0 && proofs.length == inputs.length);
+        VerifyingKey memory vk = verifyingKey();
+        (uint[] memory r, uint r_sum) = batchScalars(proofs, inputs);
+        uint n = proofs.length;
+        Pairing.G1Point[] memory p1 = new Pairing.G1Point[](n + 3);
+        Pairing.G2Point[] memory p2 = new Pairing.G2Point[](n + 3);
+        Pairing.G1Point memory c = Pairing.G1Point(0, 0);
+        for (uint i = 0; i < n; i++) {
+            p1[i] = Pairing.scalar_mul(proofs[i].a, r[i]);
+            p2[i] = proofs[i].b;
+            c = Pairing.addition(c, Pairing.scalar_mul(proofs[i].c, r[i]));
+        }
+        p1[n] = Pairing.negate(combinedInput(vk, inputs, r, r_sum));
+        p2[n] = vk.gamma;
+        p1[n + 1] = Pairing.negate(c);
+        p2[n + 1] = vk.delta;
+        p1[n + 2] = Pairing.negate(Pairing.scalar_mul(vk.alpha, r_sum));
+        p2[n + 2] = vk.beta;
+        return Pairing.pairing(p1, p2);
+    }
+}
@@ -1,6 +1,7 @@
 pragma solidity ^0.8.0;
 
 import "./verifier.sol";
+import "./BatchVerifier.sol";
 pragma experimental ABIEncoderV2;
 
 contract FederatedModel{
@@ -16,22 +17,49 @@ contract FederatedModel{
     //  mapping(address => int256[]) private localWeightsMappings;
     //    mapping(address => int256) private localBiasMappings;
 
-    int256[][] private temp_global_weights;
-    int256[] private temp_global_bias;
-    int256[][] private global_weights;
-    int256[] private global_bias;
+    // The model is stored packed: weights row by row followed by the bias, four int64 fixed point
+    // values per slot with value v in bits 64*(v%4) of slot v/4. packed_models is a double buffer,
+    // packed_models[global_index] holds the global model and the other one the model of the
+    // running round, so finishing a round only flips global_index instead of copying.
+    uint256 constant LANES=4;
+    uint256 constant LANE_BITS=64;
+    uint256[][2] private packed_models;
+    uint256 private global_index;
+    bool private model_updated;
+    // In commitment mode only the sha256 of the packed model (as 32 byte big endian words) is kept
+    // on chain, the models themselves are in an off-chain content addressed blob store.
+    // pending_commitment is the average of the running round committed by the aggregator.
+    bytes32 private global_commitment;
+    bytes32 private pending_commitment;
     int256 private precision;
     uint256 private round_Number;
     int256 private learning_rate;
     uint256 private outputDimension;
     uint256 private inputDimension;
     bool private isTraining=true;
-    address[] private participating_devices;
+    // devices that submitted an update, keyed by round so nothing has to be deleted when a round ends
+    mapping(uint256 => mapping(address => bool)) private participated;
+    uint256 private participants;
     uint256 private intervalEnd;
     uint256 private updateInterval;
     uint256 private batchSize;
     Verifier private verifier;
+    BatchVerifier private batchVerifier;
     bool private initialized = false;
+    // once set, only the round coordinator may end rounds
+    address public coordinator;
+    // besides the administrator only the aggregator may submit the updates of other devices or
+    // commit the global model
+    address public aggregator;
+    // a round may end before intervalEnd once quorum updates are in, 0 only ends at intervalEnd.
+    // In commitment mode it also needs the average committed by the aggregator, it would be lost
+    // otherwise.
+    uint256 private quorum;
+
+    event RoundStarted(uint256 round, uint256 intervalEnd);
+    event RoundEnded(uint256 round, uint256 participants);
+    event UpdateCommitted(uint256 indexed round, address device, bytes32 modelHash);
+    event ModelCommitted(uint256 indexed round, bytes32 modelHash);
 
 
     constructor(uint256 id,uint256 od,int256 learning_rate_,int256 precision_,uint256 batchSize_,uint256 updateInterval_)public{
@@ -51,18 +79,25 @@ contract FederatedModel{
         verifier=Verifier(verifier_address);
     }
 
-    function initModel(int256[][] calldata local_weights, int256[] calldata local_bias)external{
-        delete temp_global_weights;
-        delete temp_global_bias;
-        temp_global_bias =new int256[](outputDimension);
-        for(uint256 i=0;i< outputDimension;i++){
-            temp_global_bias[i]=local_bias[i];
-        }
-        for(uint256 i=0;i< outputDimension;i++){
-            int256[] memory temp_row=new int256[](inputDimension);
-            temp_row=local_weights[i];
-            temp_global_weights.push(temp_row);
-        }
+    function updateBatchVerifier(address verifier_address) external {
+        batchVerifier=BatchVerifier(verifier_address);
+    }
+
+    function setCoordinator(address coordinator_) external onlyAdmin {
+        coordinator=coordinator_;
+    }
+
+    function setAggregator(address aggregator_) external onlyAdmin {
+        aggregator=aggregator_;
+    }
+
+    function setQuorum(uint256 quorum_) external onlyAdmin {
+        quorum=quorum_;
+    }
+
+    function initModel(uint256[] calldata packed_model)external{
+        require(packed_model.length==slotCount(),"invalid model");
+        packed_models[1-global_index]=packed_model;
         initialized=true;
     }
 
@@ -101,26 +136,42 @@ contract FederatedModel{
 //    }
 
     function map_temp_to_global() external onlyAdmin{
-        delete global_bias;
-        delete global_weights;
+        global_index=1-global_index;
+        emit RoundStarted(round_Number,intervalEnd);
+    }
 
-           for(uint256 i=0;i<temp_global_weights.length;i++){
-                    int256[] memory temp= new int256[](temp_global_weights[i].length);
-                    temp=temp_global_weights[i];
-                    global_weights.push(temp);
-                }
-            for(uint256 i=0;i<temp_global_bias.length;i++){
-                    int256 temp=temp_global_bias[i];
-                    global_bias.push(temp);
-                }
+    function initModelCommitment(bytes32 model_hash) external onlyAdmin{
+        global_commitment=model_hash;
+        initialized=true;
+    }
+
+    function get_global_commitment() view external returns(bytes32){
+        return global_commitment;
+    }
+
+    function get_global_model() view external returns(uint256[] memory){
+        return packed_models[global_index];
     }
 
     function get_global_weights() view external returns(int256[][] memory){
-        return global_weights;
+        uint256[] memory packed=packed_models[global_index];
+        int256[][] memory weights=new int256[][](packed.length>0 ? outputDimension : 0);
+        for(uint256 i=0;i<weights.length;i++){
+            weights[i]=new int256[](inputDimension);
+            for(uint256 j=0;j<inputDimension;j++){
+                weights[i][j]=unpackValue(packed,i*inputDimension+j);
+            }
+        }
+        return weights;
     }
 
     function get_global_bias() view external returns(int256[] memory){
-        return global_bias;
+        uint256[] memory packed=packed_models[global_index];
+        int256[] memory bias=new int256[](packed.length>0 ? outputDimension : 0);
+        for(uint256 i=0;i<bias.length;i++){
+            bias[i]=unpackValue(packed,outputDimension*inputDimension+i);
+        }
+        return bias;
     }
 
     function time_until_next_update_round() external returns(int256){
@@ -128,21 +179,22 @@ contract FederatedModel{
     }
     //
     function end_update_round() external{
-        if(block.timestamp>=intervalEnd){
-            for(uint256 i=0;i<temp_global_weights.length;i++){
-                    int256[] memory temp= new int256[](temp_global_weights[i].length);
-                    temp=temp_global_weights[i];
-                    global_weights[i]=temp;
-                }
-            for(uint256 i=0;i<temp_global_bias.length;i++){
-                    int256 temp=temp_global_bias[i];
-                    global_bias[i]=temp;
-                }
-            intervalEnd=block.timestamp+updateInterval;
-            delete participating_devices;
-            round_Number=round_Number+1;
+        require(coordinator==address(0) || tx.origin==coordinator,"only coordinator");
+        require(block.timestamp>=intervalEnd || (quorum>0 && participants>=quorum && (global_commitment==bytes32(0) || pending_commitment!=bytes32(0))),"round not over");
+        // without updates the running model still equals the global one
+        if(model_updated){
+            global_index=1-global_index;
+            model_updated=false;
         }
-
+        if(pending_commitment!=bytes32(0)){
+            global_commitment=pending_commitment;
+            pending_commitment=bytes32(0);
+        }
+        emit RoundEnded(round_Number,participants);
+        intervalEnd=block.timestamp+updateInterval;
+        participants=0;
+        round_Number=round_Number+1;
+        emit RoundStarted(round_Number,intervalEnd);
     }
 
     function is_Training() external returns (bool) {
@@ -151,128 +203,212 @@ contract FederatedModel{
 
     function roundUpdateOutstanding() external returns (bool) {
         if(initialized){
-        address  user = tx.origin;
-        bool new_user=true;
-        for(uint256 i=0;i<this.participantsCount();i++){
-            if(user==participating_devices[i]){
-                new_user=false;
-            }
-        }
-        return new_user;}
+        return !isParticipant(tx.origin);}
         else{
             return false;
         }
     }
     //
-    //
-   function update_with_proof(int256[][] calldata local_weights, int256[] calldata local_bias,uint[2] calldata a,uint[2][2] calldata b, uint[2] calldata c, uint[183] calldata input) external TrainingMode {
-        require(this.checkZKP(a,b,c,input));
-        bool newUser=true;
-        bool firstUser=true;
-        address user=tx.origin;
-        if(this.participantsCount()==0){
-            participating_devices.push(user);
-            this.movingAverageWeights(local_weights);
-            this.movingAverageBias(local_bias);
-        }
-        else{
-            for(uint256 i=0;i<this.participantsCount();i++){
-                if(user==participating_devices[i]){
-                    newUser=false;
-                }
-            }
-            if(newUser){
-                participating_devices.push(user);
-                this.movingAverageWeights(local_weights);
-                this.movingAverageBias(local_bias);
+    // every update names the round it was trained for, an update mined after that round ended
+    // reverts instead of counting for the next one
+   function update_with_proof(uint256 round,uint256[] calldata local_model,uint[2] calldata a,uint[2][2] calldata b, uint[2] calldata c, uint[183] calldata input) external TrainingMode {
+        require(round==round_Number,"round ended");
+        require(this.checkZKP(a,b,c,input),"invalid proof");
+        require(registerParticipant(tx.origin),"already participated");
+        movingAverage(local_model);
+    }
+
+function update_without_proof(uint256 round,uint256[] calldata local_model) external TrainingMode {
+        require(round==round_Number,"round ended");
+        require(registerParticipant(tx.origin),"already participated");
+        movingAverage(local_model);
+    }
+
+
+
+
+    // Commitment mode: the device stores its model in the blob store and only its hash goes on chain
+    function commit_update(uint256 round,bytes32 model_hash) external TrainingMode {
+        require(round==round_Number,"round ended");
+        require(registerParticipant(tx.origin),"already participated");
+        emit UpdateCommitted(round_Number,tx.origin,model_hash);
+    }
+
+    // the committed hash is computed from the proven w_new and b_new, so the blob has to hold
+    // exactly the model of the proof
+    function commit_update_with_proof(uint256 round,uint[2] calldata a,uint[2][2] calldata b, uint[2] calldata c, uint[183] calldata input) external TrainingMode {
+        require(round==round_Number,"round ended");
+        require(this.checkZKP(a,b,c,input),"invalid proof");
+        require(registerParticipant(tx.origin),"already participated");
+        uint256[] memory model=new uint256[](slotCount());
+        foldUpdate(model,input,1);
+        emit UpdateCommitted(round_Number,tx.origin,sha256(abi.encodePacked(model)));
+    }
+
+    // average of the committed updates of the running round, computed off chain by the aggregator
+    function commit_global_model(uint256 round, bytes32 model_hash) external onlyAggregator {
+        require(round==round_Number,"round ended");
+        pending_commitment=model_hash;
+        emit ModelCommitted(round,model_hash);
+    }
+
+    // Updates of many devices proven in one batch verification and folded into the model with one
+    // write per parameter, submitted by an off-chain aggregator. The new weights and bias are taken
+    // from the public inputs of each proof, so they are exactly the values that were proven.
+    // The proofs do not name a device, so every device signs its update (see updateHash) and an
+    // update only counts for the device that signed it.
+    function update_aggregated(uint256 round,address[] calldata devices,bytes[] calldata signatures,uint[2][] calldata a,uint[2][2][] calldata b, uint[2][] calldata c, uint[183][] calldata input) external TrainingMode onlyAggregator {
+        require(round==round_Number,"round ended");
+        require(devices.length==input.length && signatures.length==input.length,"invalid input");
+        require(verifySigners(round,devices,signatures,input),"invalid signature");
+        require(verifyAggregated(a,b,c,input),"invalid proof");
+        averageAggregated(devices,input);
+    }
+
+    // what a device signs with eth_sign to hand its proven update of round to the aggregator
+    function updateHash(uint256 round,uint[183] calldata input) public view returns (bytes32) {
+        return keccak256(abi.encodePacked(address(this),round,input));
+    }
+
+    function verifySigners(uint256 round,address[] calldata devices,bytes[] calldata signatures,uint[183][] calldata input) internal view returns (bool) {
+        for(uint256 i=0;i<devices.length;i++){
+            bytes32 digest=keccak256(abi.encodePacked("\x19Ethereum Signed Message:\n32",updateHash(round,input[i])));
+            if(devices[i]==address(0) || recoverSigner(digest,signatures[i])!=devices[i]){
+                return false;
             }
         }
+        return true;
+    }
 
+    // signer of a 65 byte r,s,v signature, address(0) if it is malformed
+    function recoverSigner(bytes32 digest,bytes memory signature) internal pure returns (address) {
+        if(signature.length!=65){
+            return address(0);
+        }
+        bytes32 r;
+        bytes32 s;
+        uint8 v;
+        assembly {
+            r:=mload(add(signature,32))
+            s:=mload(add(signature,64))
+            v:=byte(0,mload(add(signature,96)))
+        }
+        // some nodes return the recovery id as 0 or 1
+        if(v<27){
+            v+=27;
+        }
+        return ecrecover(digest,v,r,s);
+    }
 
+    function verifyAggregated(uint[2][] calldata a,uint[2][2][] calldata b, uint[2][] calldata c, uint[183][] calldata input) internal view returns (bool) {
+        require(a.length==input.length && b.length==input.length && c.length==input.length);
+        Verifier.Proof[] memory proofs=new Verifier.Proof[](input.length);
+        uint[183][] memory inputs=new uint[183][](input.length);
+        for(uint256 i=0;i<input.length;i++){
+            // the last public input is the value returned by main
+            require(input[i][182]==1);
+            proofs[i]=Verifier.Proof(Pairing.G1Point(a[i][0],a[i][1]),Pairing.G2Point(b[i][0],b[i][1]),Pairing.G1Point(c[i][0],c[i][1]));
+            inputs[i]=input[i];
+        }
+        return batchVerifier.verifyTxBatch(proofs,inputs);
     }
 
-function update_without_proof(int256[][] calldata local_weights, int256[] calldata local_bias) external TrainingMode {
-        bool newUser=true;
-        bool firstUser=true;
-        address user=tx.origin;
-        if(this.participantsCount()==0){
-            participating_devices.push(user);
-            this.movingAverageWeights(local_weights);
-            this.movingAverageBias(local_bias);
+    function averageAggregated(address[] calldata devices, uint[183][] calldata input) internal {
+        uint256[] memory model=new uint256[](slotCount());
+        if(participants>0){
+            model=packed_models[1-global_index];
         }
-        else{
-            for(uint256 i=0;i<this.participantsCount();i++){
-                if(user==participating_devices[i]){
-                    newUser=false;
-                }
-            }
-            if(newUser){
-                participating_devices.push(user);
-                this.movingAverageWeights(local_weights);
-                this.movingAverageBias(local_bias);
-            }
+        for(uint256 i=0;i<devices.length;i++){
+            require(registerParticipant(devices[i]),"already participated");
+            foldUpdate(model,input[i],int256(participants));
         }
+        if(participants>0){
+            packed_models[1-global_index]=model;
+            model_updated=true;
+        }
+    }
 
-
+    // same moving average as movingAverage for the k-th participant
+    function foldUpdate(uint256[] memory model,uint[183] calldata input,int256 k) internal view {
+        // public inputs: w, w_sign, b, b_sign, learning_rate, precision, w_new, b_new, result.
+        // w_new and b_new are in the same order as the packed model
+        uint256 offset=2*outputDimension*inputDimension+2*outputDimension+2;
+        for(uint256 v=0;v<parameterCount();v++){
+            int256 x=fieldToInt(input[offset+v]);
+            int256 old=unpackValue(model,v);
+            int256 res= k==1 ? x : old+(x-old)/k;
+            uint256 shift=LANE_BITS*(v%LANES);
+            model[v/LANES]=(model[v/LANES]&~(uint256(type(uint64).max)<<shift))|packLane(res,v%LANES);
+        }
     }
 
+    function fieldToInt(uint256 x) internal pure returns (int256) {
+        uint256 p=21888242871839275222246405745257275088548364400416034343698204186575808495617;
+        return x>p/2 ? -int256(p-x) : int256(x);
+    }
 
+    function isParticipant(address user) internal view returns (bool) {
+        return participated[round_Number][user];
+    }
 
+    // returns false if the user already submitted an update this round
+    function registerParticipant(address user) internal returns (bool) {
+        if(participated[round_Number][user]){
+            return false;
+        }
+        participated[round_Number][user]=true;
+        participants=participants+1;
+        return true;
+    }
 
     function participantsCount(
     ) external view returns(uint)  {
-        uint x = participating_devices.length;
-        return x;
+        return participants;
     }
     //
     //
-    function movingAverageWeights(int256[][] calldata new_weights) external {
-        int256 k = int256(this.participantsCount());
-        if(k>0){
-            if(k==1){
-                for(uint256 i=0;i<new_weights.length;i++){
-                    int256[] memory temp= new int256[](new_weights[i].length);
-                    temp=new_weights[i];
-                    temp_global_weights[i]=temp;
-                }
-            }
-            else{
-                for(uint256 i=0;i<new_weights.length;i++){
-                    int256[] memory res= new int256[](new_weights[i].length);
-                    int256[] memory row_new= new int256[](new_weights[i].length);
-                    row_new=new_weights[i];
-                    int256[] memory row_old= new int256[](temp_global_weights[i].length);
-                    row_old=temp_global_weights[i];
-                    for(uint256 j=0;j<row_old.length;j++){
-                        res[j]=row_old[j]+(row_new[j]-row_old[j])/k;
-                    }
-                    temp_global_weights[i]=res;
+    // folds the k-th update of the round into the running model, a whole slot at a time
+    function movingAverage(uint256[] calldata new_model) internal {
+        require(new_model.length==slotCount(),"invalid model");
+        int256 k = int256(participants);
+        model_updated=true;
+        if(k==1){
+            packed_models[1-global_index]=new_model;
+        }
+        else{
+            uint256[] storage model=packed_models[1-global_index];
+            for(uint256 s=0;s<new_model.length;s++){
+                uint256 old_slot=model[s];
+                uint256 new_slot=new_model[s];
+                uint256 res=0;
+                for(uint256 l=0;l<LANES;l++){
+                    int256 old_value=laneValue(old_slot,l);
+                    res|=packLane(old_value+(laneValue(new_slot,l)-old_value)/k,l);
                 }
+                model[s]=res;
             }
-
         }
+    }
 
+    function parameterCount() internal view returns(uint256){
+        return outputDimension*inputDimension+outputDimension;
     }
-    //
-    function movingAverageBias(int256[] calldata new_bias) external {
-        int256 k = int256(this.participantsCount());
-        if(k>0){
-            if(k==1){
-                for(uint256 i=0;i<new_bias.length;i++){
-                    int256 temp=new_bias[i];
-                    temp_global_bias[i]=temp;
-                }
-            }
-            else{
-                for(uint256 i=0;i<new_bias.length;i++){
-                    int256 old_bias_i=temp_global_bias[i];
-                    int256 new_bias_i=new_bias[i];
-                    int256 res=old_bias_i+(new_bias_i-old_bias_i)/k;
-                    temp_global_bias[i]=res;
-                }
-            }
 
-        }
+    function slotCount() internal view returns(uint256){
+        return (parameterCount()+LANES-1)/LANES;
+    }
+
+    function laneValue(uint256 slot,uint256 lane) internal pure returns(int256){
+        return int256(int64(uint64(slot>>(LANE_BITS*lane))));
+    }
+
+    function unpackValue(uint256[] memory packed,uint256 v) internal pure returns(int256){
+        return laneValue(packed[v/LANES],v%LANES);
+    }
+
+    function packLane(int256 x,uint256 lane) internal pure returns(uint256){
+        require(x>=type(int64).min && x<=type(int64).max);
+        return uint256(uint64(int64(x)))<<(LANE_BITS*lane);
     }
 
     function changeLearningRate(int256 newLearnignRate) external onlyAdmin{
@@ -327,12 +463,17 @@ function update_without_proof(int256[][] calldata local_weights, int256[] callda
     }
     //
     modifier onlyAdmin {
-        require(tx.origin == administrator);
+        require(tx.origin == administrator,"only admin");
+        _;
+    }
+
+    modifier onlyAggregator {
+        require(tx.origin == administrator || tx.origin == aggregator,"only aggregator");
         _;
     }
 
     modifier TrainingMode {
-        require(isTraining);
+        require(isTraining,"not training");
         _;
     }
     modifier RoundFinished {
@@ -1,6 +1,7 @@
 const Migrations = artifacts.require("Migrations");
 const FederatedModel = artifacts.require("FederatedModel")
 const verifier = artifacts.require("Verifier")
+const batchVerifier = artifacts.require("BatchVerifier")
 const fs = require('fs');
 const yaml = require('js-yaml');
 
@@ -10,6 +11,7 @@ module.exports = function (deployer) {
   deployer.deploy(Migrations);
   deployer.deploy(FederatedModel,data.DEFAULT.InputDimension,data.DEFAULT.OutputDimension,data.DEFAULT.LearningRate,data.DEFAULT.Precision,data.DEFAULT.BatchSize,data.DEFAULT.IntervalTime);
   deployer.deploy(verifier,{gas:data.DEFAULT.Gas});
+  deployer.deploy(batchVerifier,{gas:data.DEFAULT.Gas});
 };
 
 
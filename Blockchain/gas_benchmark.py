@@ -0,0 +1,72 @@
+import json
+import sys
+
+import numpy as np
+from web3 import Web3
+
+from Devices.MiddleWare.BlockChainClient import update_hash
+from Devices.MiddleWare.FieldEncoding import decode_field_elements
+from Devices.MiddleWare.ParameterPacking import pack_model
+from Devices.utils.utils import read_yaml
+
+# Gas of submitting the proven updates of one round device by device (update_with_proof) against
+# one update_aggregated transaction. Runs against ganache, every variant starts from the same
+# evm_snapshot and is reverted afterwards so the chain state is left untouched.
+#   python -m Blockchain.gas_benchmark CONFIG.yaml proof_1.json proof_2.json ...
+# The proofs must be for the current round of the deployed FederatedModel, proof i is
+# submitted from account i.
+
+config=read_yaml(sys.argv[1])
+proofs=[]
+for path in sys.argv[2:]:
+    with open(path,"r") as f:
+        proofs.append(json.load(f))
+
+web3=Web3(Web3.HTTPProvider(config["DEFAULT"]["EtheriumRPCServer"]))
+with open(config["DEFAULT"]["FLContractABIPAth"]) as f:
+    contract=web3.eth.contract(address=config["DEFAULT"]["FLContractAddress"],abi=json.load(f)["abi"])
+accounts=web3.eth.accounts
+round=contract.functions.getRoundNumber().call()
+od=config["DEFAULT"]["OutputDimension"]
+id=config["DEFAULT"]["InputDimension"]
+
+
+def proof_args(proof):
+    a=[Web3.toInt(hexstr=x) for x in proof["proof"]["a"]]
+    b=[[Web3.toInt(hexstr=x) for x in y] for y in proof["proof"]["b"]]
+    c=[Web3.toInt(hexstr=x) for x in proof["proof"]["c"]]
+    inputs=[Web3.toInt(hexstr=x) for x in proof["inputs"]]
+    return a,b,c,inputs
+
+
+# w_new and b_new are public inputs of root.zok, right after w, w_sign, b, b_sign, lr and pr
+def new_model(inputs):
+    offset=2*od*id+2*od+2
+    weights=decode_field_elements(inputs[offset:offset+od*id]).reshape(od,id)
+    bias=decode_field_elements(inputs[offset+od*id:offset+od*id+od])
+    return pack_model(weights,bias)
+
+
+def gas_of(transactions):
+    snapshot=web3.provider.make_request("evm_snapshot",[])["result"]
+    try:
+        return [web3.eth.wait_for_transaction_receipt(send())["gasUsed"] for send in transactions]
+    finally:
+        web3.provider.make_request("evm_revert",[snapshot])
+
+
+per_device=[]
+for i,proof in enumerate(proofs):
+    a,b,c,inputs=proof_args(proof)
+    model=new_model(inputs)
+    per_device.append(lambda i=i,model=model,a=a,b=b,c=c,inputs=inputs:
+                      contract.functions.update_with_proof(round,model,a,b,c,inputs).transact({"from":accounts[i]}))
+args=[proof_args(proof) for proof in proofs]
+signatures=[bytes(web3.eth.sign(accounts[i],data=update_hash(contract.address,round,proof))) for i,proof in enumerate(proofs)]
+aggregated=[lambda:contract.functions.update_aggregated(round,accounts[:len(proofs)],signatures,*[list(column) for column in zip(*args)]).transact({"from":accounts[0]})]
+
+per_device_gas=gas_of(per_device)
+aggregated_gas=gas_of(aggregated)[0]
+print(f"{len(proofs)} devices")
+print(f"update_with_proof: {sum(per_device_gas)} gas in total, {np.mean(per_device_gas):.0f} per device")
+print(f"update_aggregated: {aggregated_gas} gas in total, {aggregated_gas/len(proofs):.0f} per device")
@@ -0,0 +1,54 @@
+import json
+import sys
+
+import numpy as np
+from web3 import Web3
+
+from Devices.MiddleWare.ParameterPacking import pack_model
+from Devices.utils.utils import read_yaml
+
+# Gas of update_without_proof and end_update_round for rounds with 2 to 64 participants.
+# With round-scoped membership both should stay flat as the number of participants grows.
+# Runs against ganache started with at least 64 accounts (ganache -a 64) and an initialized
+# FederatedModel, every round size starts from the same evm_snapshot and is reverted afterwards.
+#   python -m Blockchain.participant_gas_benchmark CONFIG.yaml [results.json]
+
+config=read_yaml(sys.argv[1])
+web3=Web3(Web3.HTTPProvider(config["DEFAULT"]["EtheriumRPCServer"]))
+with open(config["DEFAULT"]["FLContractABIPAth"]) as f:
+    contract=web3.eth.contract(address=config["DEFAULT"]["FLContractAddress"],abi=json.load(f)["abi"])
+accounts=web3.eth.accounts
+od=config["DEFAULT"]["OutputDimension"]
+id=config["DEFAULT"]["InputDimension"]
+precision=config["DEFAULT"]["Precision"]
+np.random.seed(0)
+
+
+def gas_used(txhash):
+    return web3.eth.wait_for_transaction_receipt(txhash)["gasUsed"]
+
+
+results=[]
+for participants in [2,4,8,16,32,64]:
+    if participants>len(accounts):
+        print(f"Skipping {participants} participants, ganache only has {len(accounts)} accounts")
+        break
+    snapshot=web3.provider.make_request("evm_snapshot",[])["result"]
+    try:
+        updates=[]
+        round=contract.functions.getRoundNumber().call()
+        for account in accounts[:participants]:
+            model=pack_model(np.random.randn(od,id)*precision,np.random.randn(od)*precision)
+            updates.append(gas_used(contract.functions.update_without_proof(round,model).transact({"from":account})))
+        # move past the end of the update interval so the round can be closed
+        web3.provider.make_request("evm_increaseTime",[config["DEFAULT"]["IntervalTime"]+1])
+        web3.provider.make_request("evm_mine",[])
+        end_round=gas_used(contract.functions.end_update_round().transact({"from":accounts[0]}))
+    finally:
+        web3.provider.make_request("evm_revert",[snapshot])
+    results.append({"Participants":participants,"UpdateGasMean":float(np.mean(updates)),"UpdateGasLast":updates[-1],"EndRoundGas":end_round})
+    print(f"{participants} participants: update {np.mean(updates):.0f} gas on average, {updates[-1]} for the last one, end_update_round {end_round} gas")
+
+if len(sys.argv)>2:
+    with open(sys.argv[2],"w") as f:
+        json.dump(results,f,indent=2)
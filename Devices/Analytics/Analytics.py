@@ -1,65 +1,82 @@
 import os.path
 
-import pandas as pd
-
+from Devices.Analytics.MetricsRecorder import MetricsRecorder, flusher
 from Devices.utils.utils import read_yaml
 
+# series name, columns and the file name of the csv export
+SERIES=[
+    ("round_time",['Round-Number','Time-Taken'],"Round_Time"),
+    ("round_gas",['Round-Number','Gas-Costs'],"Round_Gas"),
+    ("round_proof_times",['Round-Number','Time-Taken'],"Round_Proof_Time"),
+    ("round_witness_time",['Round-Number','Time-Taken'],"Round_Witness_Time"),
+    ("round_generate_proof_time",['Round-Number','Time-Taken'],"Round_Generate_Proof_Time"),
+    ("round_proof_queue",['Round-Number','Queue-Depth','Time-Waited'],"Round_Proof_Queue"),
+    ("round_training_local_time",['Round-Number','Time-Taken'],"Round_Training_Local_Time"),
+    ("round_score",['Round-Number','Score'],"Round_Score"),
+    ("round_update_blockchain_time",['Round-Number','Time-Taken'],"Round_Update_Blockchain_Time"),
+    ("round_data_wait_time",['Round-Number','Time-Taken'],"Round_Data_Wait_Time"),
+    ("round_transactions",['Round-Number','Function','Submit-To-Receipt','Status'],"Round_Transactions"),
+]
+
 
 class Analytics:
+    # Metrics are appended to a MetricsRecorder and flushed to npz files in the background every
+    # AnalyticsFlushInterval seconds, write_data flushes the rest and exports the csv files.
     def __init__(self,deviceName,config_file):
         self.config=config_file
         self.deviceName=deviceName
-        self.round_time=pd.DataFrame()
-        self.round_gas = pd.DataFrame()
-        self.round_proof_times = pd.DataFrame()
-        self.round_training_local_time=pd.DataFrame()
-        self.round_update_blockchain_time=pd.DataFrame()
-        self.round_score=pd.DataFrame()
-        self.round_classification_report=pd.DataFrame()
+        base_path=self.config["DEFAULT"]["AnalyticsOutBase"]
+        self.path = os.path.join(os.path.join(os.path.join(base_path,"NumberOfParticipants_"+str(self.config["DEFAULT"]["NumberOfParticipants"])),"BatchSize_"+str(self.config["DEFAULT"]["BatchSize"])),self.deviceName)
+        self.recorder=MetricsRecorder(self.path)
+        for name,columns,_ in SERIES:
+            self.recorder.add_series(name,columns)
+        self.targets=self.config["DEFAULT"]["ActivitiesEncoded"]
+        self.recorder.add_series("round_classification_report",['Round-Number']+[str(target) for target in self.targets])
+        flusher.register(self.recorder,self.config["DEFAULT"]["AnalyticsFlushInterval"])
 
 
     def add_round_time(self,round,time):
-        df=pd.DataFrame([{'Round-Number':round,'Time-Taken':time}])
-        self.round_time=pd.concat([self.round_time,df])
+        self.recorder.record("round_time",round,time)
 
     def add_round_update_blockchain_time(self,round,time):
-        df=pd.DataFrame([{'Round-Number':round,'Time-Taken':time}])
-        self.round_update_blockchain_time=pd.concat([self.round_update_blockchain_time,df])
+        self.recorder.record("round_update_blockchain_time",round,time)
+
+    def add_round_data_wait_time(self,round,time):
+        self.recorder.record("round_data_wait_time",round,time)
+
+    # status is mined, failed or the revert class, see TransactionManager
+    def add_round_transaction(self,round,function,latency,status):
+        self.recorder.record("round_transactions",round,function,float("nan") if latency is None else latency,status)
 
     def add_round_gas(self,round,gas):
-        df=pd.DataFrame([{'Round-Number':round,'Gas-Costs':gas}])
-        self.round_gas=pd.concat([self.round_gas,df])
+        self.recorder.record("round_gas",round,float(gas))
 
     def add_round_proof_times(self,round,time):
-        df=pd.DataFrame([{'Round-Number':round,'Time-Taken':time}])
-        self.round_proof_times=pd.concat([self.round_proof_times,df])
+        self.recorder.record("round_proof_times",round,time)
+
+    def add_round_witness_time(self,round,time):
+        self.recorder.record("round_witness_time",round,time)
+
+    def add_round_generate_proof_time(self,round,time):
+        self.recorder.record("round_generate_proof_time",round,time)
+
+    def add_round_proof_queue(self,round,depth,time):
+        self.recorder.record("round_proof_queue",round,depth,time)
 
     def add_round_training_local_time(self,round,time):
-        df=pd.DataFrame([{'Round-Number':round,'Time-Taken':time}])
-        self.round_training_local_time=pd.concat([self.round_training_local_time,df])
+        self.recorder.record("round_training_local_time",round,time)
 
     def add_round_score(self,round,score):
-        df=pd.DataFrame([{'Round-Number':round,'Score':score}])
-        self.round_score=pd.concat([self.round_score,df])
+        self.recorder.record("round_score",round,score)
 
     def add_round_classification_report(self, round, report):
-        targets=self.config["DEFAULT"]["ActivitiesEncoded"]
-        dic={'Round-Number': round}
-        for target in targets:
-            dic[target] = report[str(target)]['precision']
-        df = pd.DataFrame([dic])
-        self.round_classification_report = pd.concat([self.round_classification_report, df])
+        self.recorder.record("round_classification_report",round,*[report[str(target)]['precision'] for target in self.targets])
 
     def write_data(self):
-        base_path=self.config["DEFAULT"]["AnalyticsOutBase"]
-        path = os.path.join(os.path.join(os.path.join(base_path,"NumberOfParticipants_"+str(self.config["DEFAULT"]["NumberOfParticipants"])),"BatchSize_"+str(self.config["DEFAULT"]["BatchSize"])),self.deviceName)
-        if not os.path.exists(path):
-            os.makedirs(path)
-        self.round_time.to_csv(path_or_buf=os.path.join(path,"Round_Time"))
-        self.round_gas.to_csv(path_or_buf=os.path.join(path,"Round_Gas"))
-        self.round_proof_times.to_csv(path_or_buf=os.path.join(path,"Round_Proof_Time"))
-        self.round_training_local_time.to_csv(path_or_buf=os.path.join(path,"Round_Training_Local_Time"))
-        self.round_score.to_csv(path_or_buf=os.path.join(path,"Round_Score"))
-        self.round_classification_report.to_csv(path_or_buf=os.path.join(path,"Round_Classification_Report"))
-        self.round_update_blockchain_time.to_csv(path_or_buf=os.path.join(path,"Round_Update_Blockchain_Time"))
-        print(f"Values written for device : {self.deviceName}")
\ No newline at end of file
+        flusher.unregister(self.recorder)
+        self.recorder.flush()
+        if self.config["DEFAULT"]["AnalyticsCSVExport"]:
+            for name,_,file_name in SERIES:
+                self.recorder.export_csv(name,file_name)
+            self.recorder.export_csv("round_classification_report","Round_Classification_Report")
+        print(f"Values written for device : {self.deviceName}")
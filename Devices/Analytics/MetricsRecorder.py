@@ -0,0 +1,93 @@
+import glob
+import os
+import shutil
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+class MetricsRecorder:
+    # Append only store for rows of named series. Recording appends a tuple to a deque, which is
+    # thread safe without a lock, the rows are turned into columns and written to
+    # <path>/npz/<series>/part-<n>.npz by the shared background flusher.
+    def __init__(self,path):
+        self.path=path
+        # a new run replaces the metrics of an earlier one with the same partition, as the csv files did
+        shutil.rmtree(os.path.join(self.path,"npz"),ignore_errors=True)
+        self.columns={}
+        self.rows={}
+        self.parts={}
+        self.lock_flush=threading.Lock()
+
+    def add_series(self,name,columns):
+        self.columns[name]=list(columns)
+        self.rows[name]=deque()
+        self.parts[name]=0
+
+    def record(self,name,*values):
+        self.rows[name].append(values)
+
+    def flush(self):
+        with self.lock_flush:
+            for name,rows in self.rows.items():
+                # only the rows present now are taken, rows recorded meanwhile go to the next part
+                chunk=[rows.popleft() for _ in range(len(rows))]
+                if not chunk:
+                    continue
+                directory=os.path.join(self.path,"npz",name)
+                os.makedirs(directory,exist_ok=True)
+                columns={column:np.asarray(values) for column,values in zip(self.columns[name],zip(*chunk))}
+                np.savez(os.path.join(directory,f"part-{self.parts[name]:05d}.npz"),**columns)
+                self.parts[name]+=1
+
+    # all flushed rows of a series
+    def read(self,name):
+        parts=sorted(glob.glob(os.path.join(self.path,"npz",name,"part-*.npz")))
+        frames=[]
+        for part in parts:
+            with np.load(part) as data:
+                frames.append(pd.DataFrame({column:data[column] for column in self.columns[name]}))
+        if not frames:
+            return pd.DataFrame(columns=self.columns[name])
+        return pd.concat(frames,ignore_index=True)
+
+    def export_csv(self,name,file_name):
+        self.read(name).to_csv(path_or_buf=os.path.join(self.path,file_name))
+
+
+class Flusher:
+    # one background thread flushes every recorder of the process
+    def __init__(self):
+        self.recorders=set()
+        self.lock=threading.Lock()
+        self.thread=None
+        self.interval=None
+
+    def register(self,recorder,interval):
+        with self.lock:
+            self.recorders.add(recorder)
+            self.interval=interval if self.interval is None else min(self.interval,interval)
+            if self.thread is None:
+                self.thread=threading.Thread(target=self.__run,daemon=True)
+                self.thread.start()
+
+    def unregister(self,recorder):
+        with self.lock:
+            self.recorders.discard(recorder)
+
+    def __run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                recorders=list(self.recorders)
+            for recorder in recorders:
+                try:
+                    recorder.flush()
+                except Exception as e:
+                    print(f"Flushing metrics to {recorder.path} failed: {e}")
+
+
+flusher=Flusher()
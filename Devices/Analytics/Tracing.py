@@ -0,0 +1,140 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class LatencyHistogram:
+    # HDR style histogram of durations in microseconds: values below 2*SUB_BUCKETS are counted
+    # exactly, larger ones in buckets of at most 1/SUB_BUCKETS relative width, so every percentile
+    # is within 1% of the true value with a fixed number of buckets per power of two
+    SUB_BUCKETS=128
+
+    def __init__(self):
+        self.counts={}
+        self.count=0
+        self.min=None
+        self.max=None
+
+    def shift(self,value):
+        return max(value.bit_length()-self.SUB_BUCKETS.bit_length(),0)
+
+    def bucket(self,value):
+        shift=self.shift(value)
+        return (value>>shift)<<shift
+
+    def record(self,microseconds):
+        value=int(microseconds)
+        bucket=self.bucket(value)
+        self.counts[bucket]=self.counts.get(bucket,0)+1
+        self.count+=1
+        self.min=value if self.min is None else min(self.min,value)
+        self.max=value if self.max is None else max(self.max,value)
+
+    # the upper bound of the bucket holding the q-th percentile, within the observed min and max
+    def percentile(self,q):
+        rank=q/100*self.count
+        seen=0
+        for bucket in sorted(self.counts):
+            seen+=self.counts[bucket]
+            if seen>=rank:
+                upper=bucket+(1<<self.shift(bucket))-1
+                return min(max(upper,self.min),self.max)
+        return self.max
+
+    def summary(self):
+        return {"Count":self.count,"Min":self.min,"P50":self.percentile(50),"P90":self.percentile(90),
+                "P99":self.percentile(99),"Max":self.max}
+
+
+class Tracer:
+    # Spans of the round loop on the monotonic perf_counter clock. The device and round of a span
+    # come from the context of the calling thread or asyncio task unless they are given explicitly,
+    # so code deeper down (BlockChainConnection, the model) needs no extra arguments. Every span
+    # also goes into a latency histogram per device and phase. write exports a Chrome trace (chrome://tracing,
+    # Perfetto) and the histogram summaries to TracePath.
+    def __init__(self):
+        self.enabled=False
+        self.path=None
+        self.origin=time.perf_counter()
+        self.events=deque()
+        self.histograms={}
+        self.lock=threading.Lock()
+        self.current=contextvars.ContextVar("trace_context",default=(None,None))
+
+    # drops all spans and histograms, for running several configurations in one process
+    def reset(self):
+        with self.lock:
+            self.origin=time.perf_counter()
+            self.events=deque()
+            self.histograms={}
+
+    def configure(self,config_file):
+        self.enabled=config_file["DEFAULT"]["Tracing"]
+        self.path=config_file["DEFAULT"]["TracePath"]
+
+    @contextmanager
+    def context(self,device,round):
+        token=self.current.set((device,round))
+        try:
+            yield
+        finally:
+            self.current.reset(token)
+
+    @contextmanager
+    def span(self,name,**args):
+        if not self.enabled:
+            yield
+            return
+        start=time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name,start,time.perf_counter(),**args)
+
+    # start and end are perf_counter values
+    def record(self,name,start,end,device=None,round=None,**args):
+        if not self.enabled:
+            return
+        context_device,context_round=self.current.get()
+        device=device or context_device or threading.current_thread().name
+        round=context_round if round is None else round
+        self.events.append((name,device,round,start,end,args))
+        with self.lock:
+            if (device,name) not in self.histograms:
+                self.histograms[(device,name)]=LatencyHistogram()
+            self.histograms[(device,name)].record((end-start)*1e6)
+
+    def chrome_trace(self):
+        devices={}
+        events=[]
+        for name,device,round,start,end,args in list(self.events):
+            tid=devices.setdefault(device,len(devices)+1)
+            events.append({"name":name,"cat":"round","ph":"X","pid":os.getpid(),"tid":tid,
+                           "ts":(start-self.origin)*1e6,"dur":(end-start)*1e6,"args":dict(args,round=round)})
+        for device,tid in devices.items():
+            events.append({"name":"thread_name","ph":"M","pid":os.getpid(),"tid":tid,"args":{"name":device}})
+        return {"traceEvents":events,"displayTimeUnit":"ms"}
+
+    def latency_summary(self):
+        with self.lock:
+            summary={}
+            for (device,name),histogram in sorted(self.histograms.items()):
+                summary.setdefault(device,{})[name]=histogram.summary()
+            return summary
+
+    def write(self):
+        if not self.enabled:
+            return
+        os.makedirs(self.path,exist_ok=True)
+        with open(os.path.join(self.path,f"trace_{os.getpid()}.json"),"w") as f:
+            json.dump(self.chrome_trace(),f)
+        with open(os.path.join(self.path,f"latency_{os.getpid()}.json"),"w") as f:
+            json.dump(self.latency_summary(),f,indent=2)
+        print(f"Trace written to {self.path}")
+
+
+tracer=Tracer()
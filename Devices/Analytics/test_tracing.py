@@ -0,0 +1,23 @@
+import numpy as np
+
+from Devices.Analytics.Tracing import LatencyHistogram
+
+
+def test_percentiles_within_observed_range():
+    rng = np.random.default_rng(0)
+    for values in [[27096, 27500, 31000], rng.integers(1000, 10**7, size=1000), [5], [300, 300, 300]]:
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+        summary = histogram.summary()
+        assert summary["Min"] <= summary["P50"] <= summary["P90"] <= summary["P99"] <= summary["Max"]
+
+
+def test_percentiles_within_one_percent():
+    values = np.random.default_rng(1).integers(1000, 10**6, size=10000)
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    for q in [50, 90, 99]:
+        exact = np.percentile(values, q)
+        assert abs(histogram.percentile(q) - exact) <= 0.01 * exact
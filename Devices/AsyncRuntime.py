@@ -0,0 +1,198 @@
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Devices.Analytics.Analytics import Analytics
+from Devices.Analytics.Tracing import tracer
+from Devices.Edge_Device.EdgeDevice import EdgeDevice
+from Devices.MessageBroker.AsyncBroker import AsyncBroker
+from Devices.MessageBroker.Consumer import Consumer
+from Devices.MiddleWare.Aggregator import ModelAggregator
+from Devices.MiddleWare.AsyncBlockChainClient import AsyncBlockChainConnection
+from Devices.MiddleWare.BlockChainClient import BlockChainConnection
+from Devices.MiddleWare.CircuitArtifacts import get_circuit
+from Devices.MiddleWare.Middleware import (FederatedLearningModel, callback, drop_late_update, prepare_round, proof_args,
+                                           record_proof_job, record_round, record_update, train_round)
+from Devices.MiddleWare.Prover import get_prover
+from Devices.MiddleWare.RoundCoordinator import RoundCoordinator
+from Devices.MiddleWare.Witness import parse_main_signature
+
+# DeviceRunner "asyncio": all devices of the process are tasks of one event loop. Chain requests
+# (AsyncBlockChainConnection) and broker messages (AsyncBroker) are awaited on the loop, training,
+# evaluation and witness encoding run on one executor of ComputeWorkers threads and proofs on the
+# ProofScheduler. The threads of the process stay fixed, a device only adds a few tasks and its
+# sample buffer. Rounds are always followed by the round watcher, as with RoundDetection "events".
+
+
+class AsyncMiddleWare:
+
+    def __init__(self,blockchain_connection,deviceName,accountNR,configFile,broker,executor):
+        self.accountNR=accountNR
+        self.analytics=Analytics(deviceName=deviceName,config_file=configFile)
+        self.blockChainConnection=blockchain_connection
+        self.deviceName=deviceName
+        self.model=FederatedLearningModel(config_file=configFile,deviceName=self.deviceName)
+        self.config=configFile
+        self.executor=executor
+        self.samples_added=asyncio.Event()
+        self.consumer=Consumer(connection_manager=broker)
+        queueName=self.config["DEFAULT"]["QueueBase"]+deviceName
+        self.consumer.declare_queue(queueName)
+        self.consumer.consume_data(queueName,self.__on_message)
+        self.prover=None
+        self.signature=None
+        self.precision=None
+        self.batchSize=None
+        self.round=0
+        self.updates=set()
+
+    def __on_message(self,ch,method,properties,body):
+        callback(ch,method,properties,body,args=self.model)
+        self.samples_added.set()
+
+    # runs fn on the compute executor, the trace context of the task goes along
+    async def compute(self,fn,*args):
+        context=contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.executor,functools.partial(context.run,fn,*args))
+
+    async def __wait_for_batch(self,batchSize):
+        while True:
+            self.samples_added.clear()
+            if self.model.batch_available(batchSize):
+                return
+            try:
+                await asyncio.wait_for(self.samples_added.wait(),self.config["DEFAULT"]["WaitingTime"])
+            except asyncio.TimeoutError:
+                print(f"{self.deviceName}: Waiting for {batchSize} samples")
+
+    async def __generate_Proof(self,w,b,w_new,b_new,x_train,y_train,learning_rate):
+        if self.signature is None:
+            self.signature=await self.compute(parse_main_signature,get_circuit(self.config).zok_path)
+        args=await self.compute(proof_args,self.config,self.signature,self.round,self.precision,w,b,w_new,b_new,x_train,y_train,learning_rate)
+        job=self.prover.submit(args,self.deviceName,self.round)
+        loop=asyncio.get_running_loop()
+        done=loop.create_future()
+        job.add_done_callback(lambda job: loop.call_soon_threadsafe(done.set_result,job))
+        await done
+        if job.error is not None:
+            raise job.error
+        record_proof_job(self.analytics,job)
+        return job.proof
+
+    async def update(self,w,b,p,r,balance):
+        if drop_late_update(self.analytics,self.deviceName,r,await self.blockChainConnection.get_RoundNumber(self.accountNR)):
+            return
+        with tracer.context(self.deviceName,r):
+            tu = time.perf_counter()
+            with tracer.span("update"):
+                transaction=await self.blockChainConnection.update(w, b, self.accountNR, r, p)
+            record_update(self.analytics,r,time.perf_counter()-tu,transaction,balance-await self.blockChainConnection.get_account_balance(self.accountNR))
+
+    async def __run_round(self):
+        t=time.perf_counter()
+        with tracer.span("rpc_read"):
+            balance,global_weights,global_bias=await self.blockChainConnection.get_round_state(self.accountNR,self.round)
+            constants=await self.blockChainConnection.get_constants(self.accountNR)
+        lr=constants["getLearningRate"]
+        self.precision=constants["getPrecision"]
+        self.batchSize=constants["getBatchSize"]
+        prepare_round(self.model,global_weights,global_bias,lr,self.precision)
+        tw=time.perf_counter()
+        with tracer.span("data_wait"):
+            await self.__wait_for_batch(self.batchSize)
+        self.analytics.add_round_data_wait_time(self.round,time.perf_counter()-tw)
+        self.model.set_batchSize(self.batchSize)
+        w,b=await self.compute(train_round,self.model,self.analytics,self.deviceName,self.round)
+        proof=None
+        if self.config["DEFAULT"]["PerformProof"]:
+            tp=time.perf_counter()
+            proof=await self.__generate_Proof(global_weights,global_bias,w,b,self.model.x_train,self.model.y_train,lr)
+            self.analytics.add_round_proof_times(self.round, time.perf_counter() - tp)
+        self.model.reset_batch()
+        # the device already waits for the next round while the update is mined
+        update=asyncio.create_task(self.update(w,b,proof,self.round,balance))
+        self.updates.add(update)
+        update.add_done_callback(self.updates.discard)
+        print(f"{self.deviceName}:Round {self.round} update took {time.perf_counter()-t} seconds")
+        return t
+
+    async def start_Middleware(self):
+        verifier_address=self.config["DEFAULT"]["VerifierContractAddress"]
+        if self.config["DEFAULT"]["PerformProof"]:
+            # compiles the circuit of the configured batch size unless it is cached already
+            verifier_address=(await self.compute(get_circuit,self.config)).verifier_address
+            self.prover=await self.compute(get_prover,self.config)
+        await self.blockChainConnection.init_contract(self.accountNR,verifier_address)
+        self.round=await self.blockChainConnection.get_RoundNumber(self.accountNR)
+        self.blockChainConnection.start_round_watcher(self.accountNR)
+        last_round=0
+        while self.config["DEFAULT"]["Rounds"]>self.round:
+            new_round=await self.blockChainConnection.wait_for_round(last_round,timeout=self.config["DEFAULT"]["WaitingTime"])
+            outstanding_update=new_round is not None
+            if outstanding_update:
+                self.round=new_round
+            print(f"{self.deviceName}: Round {self.round} Has update outstanding: ",outstanding_update)
+            if outstanding_update:
+                with tracer.context(self.deviceName,self.round):
+                    t=await self.__run_round()
+                    last_round=self.round
+                    self.round+=1
+                    record_round(self.analytics,self.round,t)
+        await asyncio.gather(*self.updates)
+        self.analytics.write_data()
+
+
+async def run_edge_device(edgeDevice):
+    while edgeDevice.running:
+        edgeDevice.publish_next_batch()
+        await asyncio.sleep(float(edgeDevice.config["DEFAULT"]["IntervalDataGenerator"]))
+
+
+async def run_devices(config_file):
+    if config_file["DEFAULT"]["UpdateMode"]=="aggregated":
+        raise ValueError("UpdateMode aggregated is not supported by DeviceRunner asyncio, use DeviceRunner threads")
+    loop=asyncio.get_running_loop()
+    executor=ThreadPoolExecutor(max_workers=config_file["DEFAULT"]["ComputeWorkers"] or os.cpu_count(),thread_name_prefix="compute")
+    broker=AsyncBroker(config_file["DEFAULT"]["MessageBrokerHost"])
+    await broker.start()
+    blockchain_connection=AsyncBlockChainConnection(config_file=config_file)
+    await blockchain_connection.connect()
+    model_aggregator=None
+    coordinator=None
+    if config_file["DEFAULT"]["UpdateMode"]=="commitment" or config_file["DEFAULT"]["RoundClosing"]=="coordinator":
+        # aggregator and round coordinator keep their own threads and a blocking connection
+        service_connection=BlockChainConnection(config_file=config_file)
+        service_connection.connect()
+        if config_file["DEFAULT"]["UpdateMode"]=="commitment":
+            model_aggregator=ModelAggregator(service_connection,config_file)
+        if config_file["DEFAULT"]["RoundClosing"]=="coordinator":
+            coordinator=RoundCoordinator(service_connection,config_file)
+    edge_devices=[]
+    middlewares=[]
+    for i in range(config_file["DEFAULT"]["NumberOfParticipants"]):
+        deviceName="Device_"+str(i+1)
+        # reading the device data is blocking, the loop keeps serving the devices already started
+        edge_devices.append(await loop.run_in_executor(executor,functools.partial(EdgeDevice,deviceName,config_file=config_file,connection_manager=broker)))
+        middlewares.append(AsyncMiddleWare(blockchain_connection,deviceName,i,config_file,broker,executor))
+    generators=[asyncio.create_task(run_edge_device(edgeDevice)) for edgeDevice in edge_devices]
+    results=await asyncio.gather(*[middleware.start_Middleware() for middleware in middlewares],return_exceptions=True)
+    for middleware,result in zip(middlewares,results):
+        if isinstance(result,Exception):
+            print(f"{middleware.deviceName}: failed: {result!r}")
+    for edgeDevice in edge_devices:
+        edgeDevice.stop()
+    await asyncio.gather(*generators)
+    if model_aggregator is not None:
+        model_aggregator.close()
+    if coordinator is not None:
+        coordinator.close()
+    await blockchain_connection.close()
+    await broker.close()
+    executor.shutdown()
+
+
+def run_asyncio(config_file):
+    asyncio.run(run_devices(config_file))
@@ -0,0 +1,246 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from Devices.MiddleWare.Aggregator import truncated_division
+from Devices.MiddleWare.CircuitArtifacts import CircuitArtifacts, Circuit
+from Devices.MiddleWare.Prover import ProofJob
+
+
+class FakeFederatedModel:
+    # Round and averaging semantics of FederatedModel.sol in plain python: one update per account
+    # and round folded into the running model with the truncating moving average, the running
+    # model becomes the global one when the round ends. A round ends once IntervalTime passed or,
+    # as with the quorum of the contract, as soon as RoundQuorum participants updated. Updates for
+    # a round that already ended are rejected.
+    def __init__(self,config_file):
+        self.config=config_file
+        self.quorum=self.config["DEFAULT"]["RoundQuorum"]
+        self.lock=threading.Lock()
+        self.round_number=1
+        self.interval_end=None
+        self.initialized=False
+        self.global_model=([],[])
+        self.temp_model=None
+        self.participated=set()
+        self.round_started={}
+        self.round_latencies=[]
+        self.transactions=0
+
+    def init_model(self,weights,bias):
+        with self.lock:
+            self.temp_model=(np.asarray(weights,dtype=np.int64),np.asarray(bias,dtype=np.int64))
+            self.global_model=self.temp_model
+            self.initialized=True
+            self.__start_round()
+
+    def __start_round(self):
+        self.interval_end=time.time()+self.config["DEFAULT"]["IntervalTime"]
+        self.round_started[self.round_number]=time.perf_counter()
+
+    def update(self,account,round,weights,bias):
+        with self.lock:
+            self.transactions+=1
+            if round!=self.round_number or account in self.participated:
+                return
+            self.participated.add(account)
+            k=len(self.participated)
+            # the contract receives the model flattened, whatever shape the device keeps it in
+            weights=np.asarray(weights,dtype=np.int64).reshape(self.config["DEFAULT"]["OutputDimension"],self.config["DEFAULT"]["InputDimension"])
+            bias=np.asarray(bias,dtype=np.int64).reshape(-1)
+            if k==1:
+                self.temp_model=(weights,bias)
+            else:
+                old_weights,old_bias=self.temp_model
+                self.temp_model=(old_weights+truncated_division(weights-old_weights,k),old_bias+truncated_division(bias-old_bias,k))
+            if self.quorum>0 and k>=self.quorum:
+                self.__end_round()
+
+    # returns True if a new round was started
+    def end_round(self):
+        with self.lock:
+            if not self.initialized or time.time()<self.interval_end:
+                return False
+            self.__end_round()
+            return True
+
+    def __end_round(self):
+        if self.participated:
+            self.global_model=self.temp_model
+        self.round_latencies.append(time.perf_counter()-self.round_started[self.round_number])
+        self.participated=set()
+        self.round_number+=1
+        self.__start_round()
+
+    def outstanding(self,account):
+        with self.lock:
+            return self.initialized and account not in self.participated
+
+
+class FakeBlockChainConnection:
+    # Stands in for BlockChainConnection with the methods MiddleWare uses. rpc_latency seconds are
+    # slept for every read and transaction to model a remote node.
+    def __init__(self,config_file,rpc_latency=0):
+        self.config=config_file
+        self.chain=FakeFederatedModel(config_file)
+        self.rpc_latency=rpc_latency
+        self.round_changed=threading.Condition()
+        self.round_watcher=None
+        self.stopped=threading.Event()
+        self.balance=1000
+
+    def __rpc(self):
+        if self.rpc_latency:
+            time.sleep(self.rpc_latency)
+
+    def __notify(self):
+        with self.round_changed:
+            self.round_changed.notify_all()
+
+    def init_contract(self,accountNR,verifier_address=None,batch_verifier_address=None):
+        if accountNR==0:
+            np.random.seed(4)
+            weights = np.random.randn(self.config["DEFAULT"]["OutputDimension"],self.config["DEFAULT"]["InputDimension"])*self.config["DEFAULT"]["Precision"]/5
+            bias = np.random.randn(self.config["DEFAULT"]["OutputDimension"],)*self.config["DEFAULT"]["Precision"]/5
+            self.__rpc()
+            self.chain.init_model(weights.astype(np.int64),bias.astype(np.int64))
+            self.__notify()
+
+    def start_round_watcher(self,accountNR):
+        with self.round_changed:
+            if self.round_watcher is None:
+                self.round_watcher=threading.Thread(target=self.__watch_rounds,daemon=True)
+                self.round_watcher.start()
+
+    def __watch_rounds(self):
+        while not self.stopped.wait(self.config["DEFAULT"]["BlockPollInterval"]):
+            if self.chain.end_round():
+                self.__notify()
+
+    def stop(self):
+        self.stopped.set()
+
+    def wait_for_round(self,after_round,timeout=None):
+        with self.round_changed:
+            started=self.round_changed.wait_for(lambda: self.chain.initialized and self.chain.round_number>after_round,timeout=timeout)
+            return self.chain.round_number if started else None
+
+    def roundUpdateOutstanding(self,accountNR):
+        self.__rpc()
+        if self.chain.end_round():
+            self.__notify()
+        return self.chain.outstanding(accountNR)
+
+    def get_RoundNumber(self,accountNR):
+        self.__rpc()
+        return self.chain.round_number
+
+    def get_round_state(self,accountNR,round):
+        self.__rpc()
+        weights,bias=self.chain.global_model
+        return self.balance,np.asarray(weights).tolist(),np.asarray(bias).tolist()
+
+    def get_LearningRate(self,accountNR):
+        return self.config["DEFAULT"]["LearningRate"]
+
+    def get_Precision(self,accountNR):
+        return self.config["DEFAULT"]["Precision"]
+
+    def get_BatchSize(self,accountNR):
+        return self.config["DEFAULT"]["BatchSize"]
+
+    def get_account_balance(self,accountNR):
+        return self.balance
+
+    def update(self,weights,bias,accountNR,round,proof=None):
+        self.__rpc()
+        self.chain.update(accountNR,round,weights,bias)
+        if self.chain.round_number!=round:
+            self.__notify()
+
+
+class FakeBroker:
+    # In-process replacement for ConnectionManager. Messages are handed to the consumer callbacks
+    # by one dispatcher thread, messages published before a consumer registered are kept.
+    def __init__(self):
+        self.messages=queue.Queue()
+        self.consumers={}
+        self.backlog={}
+        self.lock=threading.Lock()
+        self.delivered=0
+        self.thread=None
+
+    def start(self):
+        self.thread=threading.Thread(target=self.__run,daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.messages.put(None)
+
+    def declare_queue(self,name):
+        with self.lock:
+            self.backlog.setdefault(name,[])
+
+    def consume(self,name,callback):
+        with self.lock:
+            self.consumers[name]=callback
+            backlog=self.backlog.pop(name,[])
+        for body,properties in backlog:
+            self.messages.put((name,body,properties))
+
+    def publish(self,name,body,properties=None):
+        self.messages.put((name,body,properties))
+
+    def __run(self):
+        while True:
+            message=self.messages.get()
+            if message is None:
+                return
+            name,body,properties=message
+            with self.lock:
+                callback=self.consumers.get(name)
+                if callback is None:
+                    self.backlog.setdefault(name,[]).append((body,properties))
+                    continue
+            callback(None,None,properties,body)
+            self.delivered+=1
+
+
+class FakeProver:
+    # Takes the place of the ProofScheduler: sleeps witness_time and proof_time per job on at most
+    # workers jobs at a time and returns a proof of the right shape that the fake chain ignores
+    def __init__(self,witness_time=0,proof_time=0,workers=None):
+        self.witness_time=witness_time
+        self.proof_time=proof_time
+        self.slots=threading.Semaphore(workers or os.cpu_count())
+        self.jobs=0
+
+    def prove(self,args,deviceName,round):
+        job=ProofJob(args,deviceName,round)
+        job.queue_depth=0
+        with self.slots:
+            job.started=time.perf_counter()
+            job.wait_time=job.started-job.submitted
+            time.sleep(self.witness_time+self.proof_time)
+        job.witness_time=self.witness_time
+        job.proof_time=self.proof_time
+        zero="0x"+"0"*64
+        job.proof={"proof":{"a":[zero,zero],"b":[[zero,zero],[zero,zero]],"c":[zero,zero]},"inputs":[zero]*183}
+        self.jobs+=1
+        return job
+
+    def close(self):
+        pass
+
+
+# the circuit source for the configured shape, written to directory without compiling it, so the
+# witness arguments can be checked against its signature
+def fake_circuit(config_file,directory):
+    source=CircuitArtifacts(config_file).generate_source(config_file["DEFAULT"]["BatchSize"],config_file["DEFAULT"]["InputDimension"],config_file["DEFAULT"]["OutputDimension"])
+    zok_path=os.path.join(directory,"root.zok")
+    with open(zok_path,"w") as f:
+        f.write(source)
+    return Circuit(os.path.join(directory,""),zok_path,config_file["DEFAULT"]["VerifierContractAddress"],config_file["DEFAULT"]["BatchVerifierContractAddress"])
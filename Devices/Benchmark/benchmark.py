@@ -0,0 +1,167 @@
+import argparse
+import copy
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+import Devices.MiddleWare.CircuitArtifacts as CircuitArtifacts
+import Devices.MiddleWare.Prover as Prover
+from Devices.Analytics.Tracing import tracer
+from Devices.Benchmark.Fakes import FakeBlockChainConnection, FakeBroker, FakeProver, fake_circuit
+from Devices.Edge_Device.EdgeDevice import EdgeDevice
+from Devices.MiddleWare.FieldEncoding import global_model_encodings
+from Devices.MiddleWare.Middleware import MiddleWare
+from Devices.utils.utils import read_yaml
+
+# Runs MiddleWare and EdgeDevice end to end without ganache, RabbitMQ or ZoKrates: the chain, the
+# broker and the prover are replaced by the in-process fakes of Fakes.py. Every combination of
+# participants and batch size runs the configured number of rounds and the results are written
+# as JSON, e.g.
+#   python -m Devices.Benchmark.benchmark --config CONFIG.yaml --participants 2 6 --batch-sizes 10 40 --rounds 20 --out results.json
+# By default a round ends as soon as every participant updated, --quorum 0 waits for the round
+# timeout like a contract without quorum.
+
+REPOSITORY=os.path.abspath(os.path.join(os.path.dirname(__file__),"..",".."))
+
+COLUMNS=["T_xacc", "T_yacc", "T_zacc", "T_xgyro", "T_ygyro", "T_zgyro", "T_xmag", "T_ymag", "T_zmag",
+         "RA_xacc", "RA_yacc", "RA_zacc", "RA_xgyro", "RA_ygyro", "RA_zgyro", "RA_xmag", "RA_ymag", "RA_zmag",
+         "LA_xacc", "LA_yacc", "LA_zacc", "LA_xgyro", "LA_ygyro", "LA_zgyro", "LA_xmag", "LA_ymag", "LA_zmag",
+         "RL_xacc", "RL_yacc", "RL_zacc", "RL_xgyro", "RL_ygyro", "RL_zgyro", "RL_xmag", "RL_ymag", "RL_zmag",
+         "LL_xacc", "LL_yacc", "LL_zacc", "LL_xgyro", "LL_ygyro", "LL_zgyro", "LL_xmag", "LL_ymag", "LL_zmag"]
+
+
+# files in the layout of iot_data_merge_script.py with one gaussian cluster per activity
+def write_synthetic_data(directory,config_file,participants,samples=2000):
+    rng=np.random.default_rng(0)
+    activities=config_file["DEFAULT"]["Activities"]
+    centers=rng.normal(0,5,size=(len(activities),len(COLUMNS)))
+
+    def write(path,n):
+        labels=rng.integers(0,len(activities),size=n)
+        features=centers[labels]+rng.normal(0,2,size=(n,len(COLUMNS)))
+        rows=np.column_stack([features,np.asarray(activities)[labels]])
+        np.savetxt(path,rows,delimiter=",",fmt=["%.5f"]*len(COLUMNS)+["%d"])
+
+    write(os.path.join(directory,"test_file.txt"),samples)
+    for i in range(participants):
+        device_dir=os.path.join(directory,"Device_"+str(i+1))
+        os.makedirs(device_dir,exist_ok=True)
+        write(os.path.join(device_dir,"device_data.txt"),samples)
+
+
+def percentiles(values):
+    if len(values)==0:
+        return None
+    values=np.asarray(values)
+    return {"P50":float(np.percentile(values,50)),"P90":float(np.percentile(values,90)),
+            "P99":float(np.percentile(values,99)),"Max":float(values.max()),"Mean":float(values.mean())}
+
+
+def run(config_file,args,participants,batch_size,work_dir):
+    config=copy.deepcopy(config_file)
+    defaults=config["DEFAULT"]
+    defaults.update({"NumberOfParticipants":participants,"BatchSize":batch_size,"Rounds":args.rounds+1,
+                     "IntervalTime":args.round_timeout,"IntervalDataGenerator":args.data_interval,
+                     "WaitingTime":0.5,"RoundDetection":"events","UpdateMode":"per_device",
+                     "PerformProof":args.proofs,"Tracing":True,"TracePath":work_dir,
+                     "RoundQuorum":participants if args.quorum is None else args.quorum,
+                     "AnalyticsOutBase":work_dir,"AnalyticsCSVExport":False,
+                     "ZokratesPath":os.path.join(REPOSITORY,"Verification","ZoKrates","root.zok")})
+    if args.data=="synthetic":
+        data_dir=os.path.join(work_dir,"data")
+        os.makedirs(data_dir,exist_ok=True)
+        write_synthetic_data(data_dir,config,participants)
+        defaults["TrainFilePath"]=data_dir
+        defaults["TestFilePath"]=os.path.join(data_dir,"test_file.txt")
+    elif args.data!="config":
+        defaults["TrainFilePath"]=args.data
+        defaults["TestFilePath"]=os.path.join(args.data,"test_file.txt")
+
+    # the process wide prover and circuit are replaced by the fakes for this run
+    prover=FakeProver(witness_time=args.witness_time,proof_time=args.proof_time,workers=defaults["ProofWorkers"])
+    Prover.scheduler=prover
+    CircuitArtifacts.circuit=fake_circuit(config,work_dir)
+    global_model_encodings.clear()
+    tracer.configure(config)
+    tracer.reset()
+
+    broker=FakeBroker()
+    broker.start()
+    connection=FakeBlockChainConnection(config,rpc_latency=args.rpc_latency)
+    edge_devices=[]
+    middlewares=[]
+    for i in range(participants):
+        name="Device_"+str(i+1)
+        edge_devices.append(EdgeDevice(name,config_file=config,connection_manager=broker))
+        middlewares.append(MiddleWare(blockchain_connection=connection,deviceName=name,accountNR=i,configFile=config,connection_manager=broker))
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    start=time.perf_counter()
+    threads=[threading.Thread(target=edge.start_EdgeDevice,daemon=True) for edge in edge_devices]
+    threads+=[threading.Thread(target=middleware.start_Middleware) for middleware in middlewares]
+    for thread in threads:
+        thread.start()
+    for thread in threads[participants:]:
+        thread.join()
+    elapsed=time.perf_counter()-start
+    peak=tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+    for edge in edge_devices:
+        edge.stop()
+    connection.stop()
+    broker.stop()
+
+    # throughput counts the rounds the devices completed, from their round_time series, the chain
+    # may end rounds nobody trained in or not yet have ended the last one
+    device_rounds=[len(middleware.analytics.recorder.read("round_time")) for middleware in middlewares]
+    rounds=min(device_rounds)
+    return {"Participants":participants,"BatchSize":batch_size,"Rounds":rounds,"ProofsEnabled":args.proofs,"Quorum":defaults["RoundQuorum"],
+            "ElapsedSeconds":elapsed,"RoundsPerSecond":rounds/elapsed,
+            "SamplesTrainedPerSecond":sum(device_rounds)*batch_size/elapsed,
+            "DeviceRounds":sum(device_rounds),"ChainRounds":len(connection.chain.round_latencies),
+            "MessagesDelivered":broker.delivered,"Transactions":connection.chain.transactions,"Proofs":prover.jobs,
+            "RoundLatencySeconds":percentiles(connection.chain.round_latencies),
+            "PhaseLatencyMicroseconds":tracer.latency_summary(),
+            "MaxRSSKilobytes":resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "TracedPeakBytes":peak}
+
+
+if __name__ == '__main__':
+    parser=argparse.ArgumentParser(description="Offline benchmark of full federated rounds")
+    parser.add_argument("--config",default=os.path.join(REPOSITORY,"CONFIG.yaml"))
+    parser.add_argument("--participants",type=int,nargs="+",default=[2,6])
+    parser.add_argument("--batch-sizes",type=int,nargs="+",default=[10,40])
+    parser.add_argument("--rounds",type=int,default=10)
+    parser.add_argument("--data",default="synthetic",help="synthetic, config (the paths of the config) or a data directory")
+    parser.add_argument("--data-interval",type=float,default=0.01,help="seconds between two batches of an edge device")
+    parser.add_argument("--round-timeout",type=float,default=5,help="IntervalTime of the fake chain")
+    parser.add_argument("--quorum",type=int,default=None,help="updates that end a round early, all participants by default, 0 disables")
+    parser.add_argument("--rpc-latency",type=float,default=0,help="seconds added to every fake chain call")
+    parser.add_argument("--proofs",action="store_true",help="encode witnesses and run the fake prover")
+    parser.add_argument("--witness-time",type=float,default=0)
+    parser.add_argument("--proof-time",type=float,default=0)
+    parser.add_argument("--tracemalloc",action="store_true",help="also report the python heap peak, slows the run down")
+    parser.add_argument("--out",default="benchmark_results.json")
+    args=parser.parse_args()
+
+    config_file=read_yaml(args.config)
+    results=[]
+    for participants in args.participants:
+        for batch_size in args.batch_sizes:
+            with tempfile.TemporaryDirectory() as work_dir:
+                result=run(config_file,args,participants,batch_size,work_dir)
+            results.append(result)
+            latency=result["RoundLatencySeconds"] or {}
+            print(f"{participants} participants, batch size {batch_size}: {result['Rounds']} rounds in {result['ElapsedSeconds']:.2f} s, "
+                  f"round latency p50 {latency.get('P50',0)*1000:.1f} ms p99 {latency.get('P99',0)*1000:.1f} ms")
+    with open(args.out,"w") as f:
+        json.dump({"Arguments":vars(args),"Results":results},f,indent=2)
+    print(f"Results written to {args.out}")
@@ -0,0 +1,145 @@
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+
+from Devices.Analytics.Tracing import tracer
+from Devices.MessageBroker.ConnectionManager import ConnectionManager
+from Devices.MiddleWare.Aggregator import ModelAggregator
+from Devices.MiddleWare.BlockChainClient import BlockChainConnection
+from Devices.MiddleWare.RoundCoordinator import RoundCoordinator
+from Devices.MiddleWare.TestSet import SharedTestSet, read_test_set, use_shared_test_set
+
+# DeviceRunner "processes": the devices are spread over worker processes with DevicesPerProcess
+# devices each, so training, parsing and evaluation of different workers do not share a GIL.
+# Inside a worker the devices run as threads like in main.py. The supervisor reads the test set
+# once into shared memory, optionally pins every worker to its own CPUs and collects the result
+# of every device and the exit status of every worker.
+
+
+def run_device(deviceName,accountNR,blockchain_connection,config_file,connection_manager,results):
+    from Devices.Edge_Device.EdgeDevice import EdgeDevice
+    from Devices.MiddleWare.Middleware import MiddleWare
+    result={"Device":deviceName,"AccountNR":accountNR,"Pid":os.getpid(),"Status":"ok","Error":None}
+    t=time.perf_counter()
+    middleware=None
+    try:
+        edgeDevice = EdgeDevice(deviceName, config_file=config_file,connection_manager=connection_manager)
+        threading.Thread(target=edgeDevice.start_EdgeDevice,daemon=True).start()
+        middleware = MiddleWare(blockchain_connection=blockchain_connection,deviceName=deviceName, accountNR=accountNR,configFile=config_file,connection_manager=connection_manager)
+        middleware.start_Middleware()
+        edgeDevice.stop()
+    except Exception:
+        result["Status"]="failed"
+        result["Error"]=traceback.format_exc()
+    result["Seconds"]=time.perf_counter()-t
+    result["LastRound"]=middleware.round if middleware is not None else None
+    result["AnalyticsPath"]=middleware.analytics.path if middleware is not None else None
+    results.put(result)
+
+
+def run_worker(config_file,accountNRs,test_set_spec,cpus,results):
+    if cpus and hasattr(os,"sched_setaffinity"):
+        os.sched_setaffinity(0,cpus)
+    shared=use_shared_test_set(config_file,test_set_spec)
+    tracer.configure(config_file)
+    blockchain_connection=BlockChainConnection(config_file=config_file)
+    blockchain_connection.connect()
+    connection_manager=None
+    if config_file["DEFAULT"]["BrokerConnections"]>0:
+        connection_manager=ConnectionManager(config_file["DEFAULT"]["MessageBrokerHost"],connections=config_file["DEFAULT"]["BrokerConnections"])
+        connection_manager.start()
+    threads=[]
+    for accountNR in accountNRs:
+        thread=threading.Thread(target=run_device,args=["Device_"+str(accountNR+1),accountNR,blockchain_connection,config_file,connection_manager,results])
+        thread.start()
+        threads.append(thread)
+        time.sleep(1)
+    for thread in threads:
+        thread.join()
+    if connection_manager is not None:
+        connection_manager.stop()
+    tracer.write()
+    shared.close()
+
+
+# CPUs of worker index when every worker gets an equal share of the CPUs of this process
+def cpus_of(index,workers):
+    available=sorted(os.sched_getaffinity(0)) if hasattr(os,"sched_getaffinity") else list(range(os.cpu_count()))
+    share=max(1,len(available)//workers)
+    return [available[(index*share+i)%len(available)] for i in range(share)]
+
+
+# accounts the supervisor sends transactions from, nonces are counted per process
+def supervisor_accounts(config_file):
+    accounts={}
+    if config_file["DEFAULT"]["UpdateMode"]=="commitment":
+        accounts["AggregatorAccount"]=config_file["DEFAULT"]["AggregatorAccount"]
+    if config_file["DEFAULT"]["RoundClosing"]=="coordinator":
+        accounts["CoordinatorAccount"]=config_file["DEFAULT"]["CoordinatorAccount"]
+    return accounts
+
+
+def run_processes(config_file):
+    if config_file["DEFAULT"]["UpdateMode"]=="aggregated":
+        raise ValueError("UpdateMode aggregated needs all devices in one process, use DeviceRunner threads")
+    participants=config_file["DEFAULT"]["NumberOfParticipants"]
+    for key,accountNR in supervisor_accounts(config_file).items():
+        if accountNR<participants:
+            raise ValueError(f"{key} {accountNR} is the account of Device_{accountNR+1}, the supervisor and a worker "
+                             f"would count nonces of the same account, use an account from {participants} on")
+    per_process=config_file["DEFAULT"]["DevicesPerProcess"]
+    groups=[list(range(start,min(start+per_process,participants))) for start in range(0,participants,per_process)]
+    shared=SharedTestSet.create(*read_test_set(config_file))
+    # spawn instead of fork, the supervisor may already run threads (aggregator, web3)
+    context=multiprocessing.get_context("spawn")
+    results=context.Queue()
+    workers=[]
+    for index,group in enumerate(groups):
+        cpus=cpus_of(index,len(groups)) if config_file["DEFAULT"]["PinCPUs"] else None
+        worker=context.Process(target=run_worker,args=[config_file,group,shared.spec(),cpus,results],name=f"DeviceWorker_{index}")
+        worker.start()
+        workers.append((worker,group,cpus))
+    # aggregator and round coordinator run once, in the supervisor
+    model_aggregator=None
+    coordinator=None
+    if config_file["DEFAULT"]["UpdateMode"]=="commitment" or config_file["DEFAULT"]["RoundClosing"]=="coordinator":
+        blockchain_connection=BlockChainConnection(config_file=config_file)
+        blockchain_connection.connect()
+        if config_file["DEFAULT"]["UpdateMode"]=="commitment":
+            model_aggregator=ModelAggregator(blockchain_connection,config_file)
+        if config_file["DEFAULT"]["RoundClosing"]=="coordinator":
+            coordinator=RoundCoordinator(blockchain_connection,config_file)
+
+    devices={}
+    while any(worker.is_alive() for worker,_,_ in workers) or not results.empty():
+        try:
+            result=results.get(timeout=1)
+            devices[result["Device"]]=result
+            print(f"Supervisor: {result['Device']} finished with status {result['Status']}")
+        except queue.Empty:
+            pass
+    summary={"Workers":[],"Devices":[]}
+    for worker,group,cpus in workers:
+        worker.join()
+        summary["Workers"].append({"Name":worker.name,"Pid":worker.pid,"ExitCode":worker.exitcode,"CPUs":cpus,"Devices":["Device_"+str(nr+1) for nr in group]})
+        for accountNR in group:
+            name="Device_"+str(accountNR+1)
+            # devices of a worker that died never reported back
+            summary["Devices"].append(devices.get(name,{"Device":name,"AccountNR":accountNR,"Status":"lost","Error":f"worker exited with {worker.exitcode}"}))
+    if model_aggregator is not None:
+        model_aggregator.close()
+    if coordinator is not None:
+        coordinator.close()
+    shared.close()
+
+    path=os.path.join(os.path.join(config_file["DEFAULT"]["AnalyticsOutBase"],"NumberOfParticipants_"+str(participants)),"BatchSize_"+str(config_file["DEFAULT"]["BatchSize"]))
+    os.makedirs(path,exist_ok=True)
+    with open(os.path.join(path,"Supervisor.json"),"w") as f:
+        json.dump(summary,f,indent=2)
+    failed=[device["Device"] for device in summary["Devices"] if device["Status"]!="ok"]
+    print(f"Supervisor: {participants-len(failed)} of {participants} devices finished, summary written to {path}")
+    return summary
@@ -1,18 +1,21 @@
 import os
 import pandas as pd
 import time
+from Devices.MessageBroker.Codec import get_codec
 from Devices.MessageBroker.Publisher import Publisher
 from Devices.utils.utils import read_yaml
 
 
 class EdgeDevice:
-    def __init__(self,DeviceName,config_file):
+    def __init__(self,DeviceName,config_file,connection_manager=None):
         self.config=config_file
         self.datasource=os.path.join(os.path.join(self.config["DEFAULT"]["TrainFilePath"],DeviceName+"/device_data.txt"))
-        self.publisher=Publisher()
+        self.publisher=Publisher(connection_manager=connection_manager)
+        self.codec=get_codec(self.config["DEFAULT"]["MessageCodec"])
         self.queueName=self.config["DEFAULT"]["QueueBase"]+DeviceName
         self.publisher.declare_queue(self.queueName)
         self.data=None
+        self.running=True
         self.init_dataset()
 
     def init_dataset(self):
@@ -25,7 +28,7 @@ class EdgeDevice:
              "LL_xacc", "LL_yacc", "LL_zacc", "LL_xgyro", "LL_ygyro", "LL_zgyro", "LL_xmag", "LL_ymag", "LL_zmag",
              "Activity"]
                     )
-        self.data.fillna(inplace=True, method='backfill')
+        self.data.bfill(inplace=True)
         self.data.dropna(inplace=True)
         self.data.drop(columns= ["T_xacc", "T_yacc", "T_zacc", "T_xgyro","T_ygyro","T_zgyro","T_xmag", "T_ymag", "T_zmag","RA_xacc", "RA_yacc", "RA_zacc", "RA_xgyro","RA_ygyro","RA_zgyro","RA_xmag", "RA_ymag", "RA_zmag","RL_xacc", "RL_yacc", "RL_zacc", "RL_xgyro","RL_ygyro","RL_zgyro" ,"RL_xmag", "RL_ymag", "RL_zmag","LL_xacc", "LL_yacc", "LL_zacc", "LL_xgyro","LL_ygyro","LL_zgyro" ,"LL_xmag", "LL_ymag", "LL_zmag"],inplace=True)
         activity_mapping = self.config["DEFAULT"]["ActivityMappings"]
@@ -43,11 +46,20 @@ class EdgeDevice:
         batch=self.data.sample(p)
         return batch
 
+    def publish_next_batch(self):
+        nextbatch=self.next_batch()
+        features=nextbatch.drop(columns=self.y_name()).to_numpy()
+        labels=nextbatch[self.y_name()].to_numpy()
+        self.publisher.publish_batch(self.queueName,features,labels,self.codec)
+
     def start_EdgeDevice(self):
-        while True:
-            nextbatch=self.next_batch()
-            self.publisher.publish_data(self.queueName,nextbatch.to_csv())
+        while self.running:
+            self.publish_next_batch()
             time.sleep(float(self.config["DEFAULT"]["IntervalDataGenerator"]))
+
+    def stop(self):
+        self.running=False
+
     def y_name(self):
         return "Activity"
 
@@ -0,0 +1,62 @@
+import asyncio
+
+import aio_pika
+
+
+class AsyncBroker:
+    # ConnectionManager for devices that run on an asyncio event loop: one robust aio_pika
+    # connection and channel carry the queues of all devices of the loop. declare_queue, consume
+    # and publish keep the interface of ConnectionManager for Publisher and Consumer, they only
+    # schedule the work on the loop and can be called from the loop and from other threads.
+    def __init__(self,host):
+        self.url=f"amqp://guest:guest@{host}/"
+        self.loop=None
+        self.connection=None
+        self.channel=None
+        self.queues={}
+
+    async def start(self):
+        self.loop=asyncio.get_running_loop()
+        self.connection=await aio_pika.connect_robust(self.url)
+        self.channel=await self.connection.channel()
+
+    async def close(self):
+        await self.connection.close()
+
+    # declares every queue once, concurrent callers wait for the same declaration
+    async def get_queue(self,name):
+        if name not in self.queues:
+            self.queues[name]=asyncio.ensure_future(self.channel.declare_queue(name))
+        return await self.queues[name]
+
+    async def publish_message(self,name,body,headers=None):
+        if isinstance(body,str):
+            body=body.encode()
+        await self.get_queue(name)
+        await self.channel.default_exchange.publish(aio_pika.Message(body=body,headers=headers),routing_key=name)
+
+    # callback has the signature of a pika consumer callback, the aio_pika message stands in for
+    # the pika properties since it carries the headers as well
+    async def consume_messages(self,name,callback):
+        queue=await self.get_queue(name)
+
+        async def on_message(message):
+            callback(None,None,message,message.body)
+        await queue.consume(on_message,no_ack=True)
+
+    def declare_queue(self,name):
+        self.__schedule(self.get_queue(name))
+
+    def consume(self,name,callback):
+        self.__schedule(self.consume_messages(name,callback))
+
+    def publish(self,name,body,properties=None):
+        self.__schedule(self.publish_message(name,body,getattr(properties,"headers",None)))
+
+    def __schedule(self,coroutine):
+        future=asyncio.run_coroutine_threadsafe(coroutine,self.loop)
+        future.add_done_callback(self.__report)
+
+    def __report(self,future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Broker operation failed: {future.exception()}")
@@ -0,0 +1,81 @@
+import io
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# name of the AMQP message header that carries the codec a body was encoded with
+CODEC_HEADER = "codec"
+
+
+class CsvCodec:
+    # the original text format, features followed by the label in the last column
+    name = "csv"
+
+    def encode(self, features, labels):
+        df = pd.DataFrame(features)
+        df["label"] = labels
+        return df.to_csv()
+
+    def decode(self, body):
+        df = pd.read_csv(io.BytesIO(body), header=0, index_col=0)
+        df.dropna(inplace=True)
+        values = df.to_numpy()
+        return values[:, :-1].astype(np.float64), values[:, -1].astype(np.int64)
+
+
+class FrameCodec:
+    # little endian binary frame: header, float32 features (row major), int8 labels
+    # header = magic, schema version, flags, rows, columns
+    HEADER = struct.Struct("<4sBBII")
+    MAGIC = b"FLFR"
+    VERSION = 1
+    FLAG_ZLIB = 1
+
+    def __init__(self, compress=False, level=1):
+        self.compress = compress
+        self.level = level
+        self.name = "frame-zlib" if compress else "frame"
+
+    def encode(self, features, labels):
+        features = np.ascontiguousarray(features, dtype="<f4")
+        labels = np.ascontiguousarray(labels, dtype="i1")
+        rows, cols = features.shape
+        payload = features.tobytes() + labels.tobytes()
+        flags = 0
+        if self.compress:
+            payload = zlib.compress(payload, self.level)
+            flags |= self.FLAG_ZLIB
+        return self.HEADER.pack(self.MAGIC, self.VERSION, flags, rows, cols) + payload
+
+    def decode(self, body):
+        magic, version, flags, rows, cols = self.HEADER.unpack_from(body)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"Unsupported frame {magic} version {version}")
+        payload = memoryview(body)[self.HEADER.size:]
+        if flags & self.FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        features = np.frombuffer(payload, dtype="<f4", count=rows * cols).reshape(rows, cols)
+        labels = np.frombuffer(payload, dtype="i1", count=rows, offset=rows * cols * 4)
+        return features.astype(np.float64), labels.astype(np.int64)
+
+
+CODECS = {
+    "csv": CsvCodec(),
+    "frame": FrameCodec(),
+    "frame-zlib": FrameCodec(compress=True),
+}
+
+
+def get_codec(name):
+    return CODECS[name]
+
+
+# messages without a codec header are treated as csv so older publishers keep working
+def decode_message(properties, body):
+    headers = getattr(properties, "headers", None) or {}
+    name = headers.get(CODEC_HEADER, CsvCodec.name)
+    if isinstance(name, bytes):
+        name = name.decode()
+    return get_codec(name).decode(body)
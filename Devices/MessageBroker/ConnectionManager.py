@@ -0,0 +1,128 @@
+import collections
+import threading
+
+import pika
+from pika.adapters.select_connection import IOLoop
+
+
+class ConnectionManager:
+    # multiplexes the queues of all devices in this process over a few SelectConnections
+    # that share one IOLoop driven by a single I/O thread, with one channel per queue.
+    # All pika objects are only touched on the I/O thread, other threads hand work over
+    # through add_callback_threadsafe.
+    def __init__(self,host,connections=1,reconnect_delay=2,max_pending=1000):
+        self.parameters=pika.ConnectionParameters(host)
+        self.ioloop=IOLoop()
+        self.reconnect_delay=reconnect_delay
+        self.max_pending=max_pending
+        self.connections=[None]*max(1,connections)
+        self.assignment={}
+        self.channels={}
+        self.consumers={}
+        self.pending={}
+        self.running=False
+        self.thread=None
+
+    def start(self):
+        self.running=True
+        self.thread=threading.Thread(target=self.__run,daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.ioloop.add_callback_threadsafe(self.__close)
+
+    def declare_queue(self,name):
+        self.ioloop.add_callback_threadsafe(lambda: self.__declare(name))
+
+    def consume(self,name,callback):
+        self.ioloop.add_callback_threadsafe(lambda: self.__consume(name,callback))
+
+    def publish(self,name,body,properties=None):
+        self.ioloop.add_callback_threadsafe(lambda: self.__publish(name,body,properties))
+
+    def __run(self):
+        for index in range(len(self.connections)):
+            self.__connect(index)
+        self.ioloop.start()
+
+    def __close(self):
+        self.running=False
+        for connection in self.connections:
+            if connection is not None and connection.is_open:
+                connection.close()
+        if self.__all_closed():
+            self.ioloop.stop()
+
+    def __all_closed(self):
+        return all(connection is None or connection.is_closed for connection in self.connections)
+
+    def __connect(self,index):
+        self.connections[index]=pika.SelectConnection(
+            self.parameters,
+            on_open_callback=lambda connection: self.__on_connection_open(index),
+            on_open_error_callback=lambda connection,error: self.__on_connection_closed(index,error),
+            on_close_callback=lambda connection,reason: self.__on_connection_closed(index,reason),
+            custom_ioloop=self.ioloop)
+
+    def __queues_of(self,index):
+        return [name for name,assigned in self.assignment.items() if assigned==index]
+
+    def __on_connection_open(self,index):
+        for name in self.__queues_of(index):
+            self.__open_channel(name)
+
+    def __on_connection_closed(self,index,reason):
+        for name in self.__queues_of(index):
+            self.channels.pop(name,None)
+        if self.running:
+            print(f"Broker connection {index} closed ({reason}), reconnecting in {self.reconnect_delay} seconds")
+            self.ioloop.call_later(self.reconnect_delay,lambda: self.__connect(index))
+        elif self.__all_closed():
+            self.ioloop.stop()
+
+    def __declare(self,name):
+        if name not in self.assignment:
+            self.assignment[name]=len(self.assignment)%len(self.connections)
+            self.__open_channel(name)
+
+    def __open_channel(self,name):
+        connection=self.connections[self.assignment[name]]
+        # queues of a connection that is not open yet get their channel in __on_connection_open
+        if connection is not None and connection.is_open:
+            connection.channel(on_open_callback=lambda channel: self.__on_channel_open(name,channel))
+
+    def __on_channel_open(self,name,channel):
+        channel.add_on_close_callback(lambda closed_channel,reason: self.__on_channel_closed(name,closed_channel))
+        channel.queue_declare(queue=name,callback=lambda frame: self.__on_queue_declared(name,channel))
+
+    def __on_channel_closed(self,name,channel):
+        if self.channels.get(name) is channel:
+            del self.channels[name]
+        if self.running:
+            self.__open_channel(name)
+
+    def __on_queue_declared(self,name,channel):
+        self.channels[name]=channel
+        if name in self.consumers:
+            channel.basic_consume(queue=name,on_message_callback=self.consumers[name],auto_ack=True)
+        pending=self.pending.pop(name,[])
+        for body,properties in pending:
+            channel.basic_publish(exchange="",routing_key=name,body=body,properties=properties)
+
+    def __consume(self,name,callback):
+        self.consumers[name]=callback
+        if name in self.channels:
+            self.channels[name].basic_consume(queue=name,on_message_callback=callback,auto_ack=True)
+        else:
+            self.__declare(name)
+
+    def __publish(self,name,body,properties):
+        self.__declare(name)
+        channel=self.channels.get(name)
+        if channel is None:
+            # keep the newest messages until the channel is (re)opened
+            if name not in self.pending:
+                self.pending[name]=collections.deque(maxlen=self.max_pending)
+            self.pending[name].append((body,properties))
+        else:
+            channel.basic_publish(exchange="",routing_key=name,body=body,properties=properties)
@@ -1,22 +1,32 @@
 import pika, sys, os
 class Consumer:
-    def __init__(self):
+    def __init__(self,connection_manager=None):
         self.queue = None
-        self.connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
-        self.channel = self.connection.channel()
+        self.connection_manager=connection_manager
+        if connection_manager is None:
+            self.connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
+            self.channel = self.connection.channel()
 
     def declare_queue(self, name):
-        self.channel.queue_declare(queue=name)
+        if self.connection_manager is not None:
+            self.connection_manager.declare_queue(name)
+        else:
+            self.channel.queue_declare(queue=name)
 
     def consume_data(self, queueName, callbackFunction):
-        self.channel.basic_consume(queue=queueName, on_message_callback=callbackFunction, auto_ack=True)
+        if self.connection_manager is not None:
+            self.connection_manager.consume(queueName, callbackFunction)
+        else:
+            self.channel.basic_consume(queue=queueName, on_message_callback=callbackFunction, auto_ack=True)
 
+    # with a shared connection manager messages are dispatched on its I/O thread
     def start_consuming(self):
-        self.channel.start_consuming()
+        if self.connection_manager is None:
+            self.channel.start_consuming()
 
     def close_connection(self):
-        self.connection.close()
+        if self.connection_manager is None:
+            self.connection.close()
 
 def callback(ch, method, properties, body):
     print(" [x] Received %r" % body)
-
@@ -1,15 +1,28 @@
 import pika
 
+from Devices.MessageBroker.Codec import CODEC_HEADER
+
 class Publisher:
-    def __init__(self):
+    def __init__(self,connection_manager=None):
         self.queue=None
-        self.connection= pika.BlockingConnection(pika.ConnectionParameters('localhost'))
-        self.channel=self.connection.channel()
+        self.connection_manager=connection_manager
+        if connection_manager is None:
+            self.connection= pika.BlockingConnection(pika.ConnectionParameters('localhost'))
+            self.channel=self.connection.channel()
 
     def declare_queue(self,name):
-        self.channel.queue_declare(queue=name)
-    def publish_data(self,queueName,data):
-        self.channel.basic_publish(exchange="",routing_key=queueName,body=data)
+        if self.connection_manager is not None:
+            self.connection_manager.declare_queue(name)
+        else:
+            self.channel.queue_declare(queue=name)
+    def publish_data(self,queueName,data,headers=None):
+        properties=pika.BasicProperties(headers=headers) if headers else None
+        if self.connection_manager is not None:
+            self.connection_manager.publish(queueName,data,properties)
+        else:
+            self.channel.basic_publish(exchange="",routing_key=queueName,body=data,properties=properties)
+    def publish_batch(self,queueName,features,labels,codec):
+        self.publish_data(queueName,codec.encode(features,labels),headers={CODEC_HEADER:codec.name})
     def close_connection(self):
-        self.connection.close()
-
+        if self.connection_manager is None:
+            self.connection.close()
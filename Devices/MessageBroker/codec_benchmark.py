@@ -0,0 +1,28 @@
+import time
+
+import numpy as np
+
+from Devices.MessageBroker.Codec import CODECS
+
+# compares bytes per message and encode/decode time of every codec on a batch shaped like the
+# ones EdgeDevice publishes (NumberOfSamplesGenerated rows of InputDimension sensor readings)
+rows=50
+cols=9
+repetitions=1000
+
+np.random.seed(0)
+features=np.random.randn(rows,cols)*10
+labels=np.random.randint(1,7,size=rows)
+
+for name,codec in CODECS.items():
+    body=codec.encode(features,labels)
+    if isinstance(body,str):
+        body=body.encode()
+    t1=time.perf_counter()
+    for i in range(repetitions):
+        codec.encode(features,labels)
+    t2=time.perf_counter()
+    for i in range(repetitions):
+        codec.decode(body)
+    t3=time.perf_counter()
+    print(f"{name}: {len(body)} bytes per message, encode {(t2-t1)/repetitions*1e6:.1f} us, decode {(t3-t2)/repetitions*1e6:.1f} us")
@@ -0,0 +1,147 @@
+import threading
+import time
+
+import numpy as np
+
+from Devices.Analytics.Analytics import Analytics
+from Devices.MiddleWare.CircuitArtifacts import get_circuit
+
+
+class ProofAggregator:
+    # Collects the proven updates of all devices of a round and submits them with one
+    # update_aggregated transaction once every participant has submitted or
+    # AggregationDeadline seconds passed since the first proof of the round arrived.
+    # The contract only accepts them from the administrator or the AggregatorAccount, and every
+    # update only with the signature of its device, see BlockChainConnection.sign_update.
+    def __init__(self,blockchain_connection,config_file,accountNR=None):
+        self.config=config_file
+        # every aggregated update would revert, so a missing batch verifier fails right away
+        batch_verifier_address=get_circuit(config_file).batch_verifier_address
+        if batch_verifier_address is None or int(batch_verifier_address,16)==0:
+            raise ValueError("UpdateMode aggregated needs a deployed BatchVerifier, set BatchVerifierContractAddress")
+        self.blockChainConnection=blockchain_connection
+        self.accountNR=self.config["DEFAULT"]["AggregatorAccount"] if accountNR is None else accountNR
+        self.analytics=Analytics(deviceName="Aggregator",config_file=config_file)
+        self.expected=self.config["DEFAULT"]["NumberOfParticipants"]
+        self.deadline=self.config["DEFAULT"]["AggregationDeadline"]
+        self.submitted=threading.Condition()
+        self.rounds={}
+        self.running=True
+        self.thread=threading.Thread(target=self.__run,daemon=True)
+        self.thread.start()
+
+    def submit(self,round,accountNR,proof,signature):
+        with self.submitted:
+            if round not in self.rounds:
+                self.rounds[round]=(time.time(),[])
+            self.rounds[round][1].append((accountNR,proof,signature))
+            self.submitted.notify_all()
+
+    def __due_rounds(self):
+        now=time.time()
+        due=[round for round,(first,submissions) in self.rounds.items() if len(submissions)>=self.expected or now-first>=self.deadline or not self.running]
+        return [(round,self.rounds.pop(round)[1]) for round in sorted(due)]
+
+    def __run(self):
+        while True:
+            with self.submitted:
+                self.submitted.wait(timeout=1)
+                batches=self.__due_rounds()
+                running=self.running
+            for round,submissions in batches:
+                self.__submit(round,submissions)
+            if not running:
+                return
+
+    def __submit(self,round,submissions):
+        accounts=[accountNR for accountNR,_,_ in submissions]
+        proofs=[proof for _,proof,_ in submissions]
+        signatures=[signature for _,_,signature in submissions]
+        t=time.time()
+        try:
+            balance=self.blockChainConnection.get_account_balance(self.accountNR)
+            gas=self.blockChainConnection.update_aggregated(round,proofs,signatures,accounts,self.accountNR)
+            self.analytics.add_round_update_blockchain_time(round,time.time()-t)
+            self.analytics.add_round_gas(round,balance-self.blockChainConnection.get_account_balance(self.accountNR))
+            print(f"Aggregator: Round {round} submitted {len(proofs)} updates using {gas} gas")
+        except Exception as e:
+            print(f"Aggregator: Round {round} aggregated update failed: {e}")
+
+    # submits what is still pending and writes the analytics
+    def close(self):
+        with self.submitted:
+            self.running=False
+            self.submitted.notify_all()
+        self.thread.join()
+        self.analytics.write_data()
+
+
+def truncated_division(x,k):
+    return np.sign(x)*(np.abs(x)//k)
+
+
+# the moving average FederatedModel computes on chain, including its rounding towards zero
+def moving_average(models):
+    weights,bias=None,None
+    for k,(new_weights,new_bias) in enumerate(models,start=1):
+        new_weights=np.asarray(new_weights,dtype=np.int64)
+        new_bias=np.asarray(new_bias,dtype=np.int64)
+        if k==1:
+            weights,bias=new_weights,new_bias
+        else:
+            weights=weights+truncated_division(new_weights-weights,k)
+            bias=bias+truncated_division(new_bias-bias,k)
+    return weights,bias
+
+
+class ModelAggregator:
+    # Commitment mode: follows the UpdateCommitted events of the running round, averages the
+    # committed models from the blob store off chain and commits the hash of the average once all
+    # participants committed or AggregationDeadline seconds passed since the first update. With a
+    # RoundQuorum the contract only ends the round early once the average is committed, so it is
+    # committed as soon as the quorum is in. Updates that arrive later in the same round lead to a
+    # new commitment.
+    def __init__(self,blockchain_connection,config_file,accountNR=None):
+        self.config=config_file
+        self.blockChainConnection=blockchain_connection
+        self.accountNR=self.config["DEFAULT"]["AggregatorAccount"] if accountNR is None else accountNR
+        self.analytics=Analytics(deviceName="Aggregator",config_file=config_file)
+        self.expected=self.config["DEFAULT"]["NumberOfParticipants"]
+        if self.config["DEFAULT"]["RoundQuorum"]>0:
+            self.expected=min(self.expected,self.config["DEFAULT"]["RoundQuorum"])
+        self.deadline=self.config["DEFAULT"]["AggregationDeadline"]
+        self.from_block=self.blockChainConnection.web3Connection.eth.block_number
+        self.first_seen={}
+        self.committed={}
+        self.stopped=threading.Event()
+        self.thread=threading.Thread(target=self.__run,daemon=True)
+        self.thread.start()
+
+    def __run(self):
+        while not self.stopped.wait(self.config["DEFAULT"]["BlockPollInterval"]):
+            try:
+                self.__poll()
+            except Exception as e:
+                print(f"Aggregator: Polling commitments failed: {e}")
+
+    def __poll(self):
+        round=self.blockChainConnection.get_RoundNumber(self.accountNR)
+        commitments=self.blockChainConnection.get_update_commitments(round,self.from_block)
+        if len(commitments)==self.committed.get(round,0):
+            return
+        first=self.first_seen.setdefault(round,time.time())
+        if len(commitments)<self.expected and time.time()-first<self.deadline:
+            return
+        t=time.time()
+        balance=self.blockChainConnection.get_account_balance(self.accountNR)
+        weights,bias=moving_average([self.blockChainConnection.get_model_by_hash(model_hash) for _,model_hash in commitments])
+        model_hash,gas=self.blockChainConnection.commit_global_model(weights,bias,round,self.accountNR)
+        self.committed[round]=len(commitments)
+        self.analytics.add_round_update_blockchain_time(round,time.time()-t)
+        self.analytics.add_round_gas(round,balance-self.blockChainConnection.get_account_balance(self.accountNR))
+        print(f"Aggregator: Round {round} committed the average of {len(commitments)} updates as {model_hash[:10]} using {gas} gas")
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.analytics.write_data()
@@ -0,0 +1,230 @@
+import asyncio
+import contextvars
+import functools
+import json
+import time
+
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.eth import AsyncEth
+
+from Devices.Analytics.Tracing import tracer
+from Devices.MiddleWare.BlobStore import BlobStore, CommittedModels
+from Devices.MiddleWare.BlockChainClient import (decode_round_started, init_transactions, quorum_reached, round_due,
+                                                 unpack_global_model, update_call, update_message)
+from Devices.MiddleWare.TransactionManager import TransactionManager, TransactionReverted
+
+
+class AsyncBlockChainConnection:
+    # BlockChainConnection for devices that run as tasks of one asyncio event loop. Every request
+    # goes through web3's AsyncHTTPProvider, so a device waiting for the node holds no thread.
+    # Calls are encoded with the contract ABI locally and sent as eth_call. Transactions go
+    # through the same TransactionManager as in the threaded runtime, so nonces are counted locally
+    # and the receipts of all devices are confirmed by its one thread with batched requests, a
+    # device only awaits the outcome. One watcher task per connection follows the rounds and ends
+    # them unless a RoundCoordinator does.
+    def __init__(self,config_file):
+        self.config=config_file
+        self.web3Connection=None
+        self.FLcontractABI=None
+        self.FLcontract=None
+        self.FLcontractAddress=self.config["DEFAULT"]["FLContractAddress"]
+        self.accounts=None
+        self.lock_cache=None
+        self.constants=None
+        self.global_model_round=None
+        self.global_model=None
+        self.round_changed=None
+        self.round_watcher=None
+        self.current_round=None
+        self.interval_end=None
+        self.model_initialized=False
+        self.commitment_mode=self.config["DEFAULT"]["UpdateMode"]=="commitment"
+        self.blob_store=BlobStore(self.config["DEFAULT"]["BlobStorePath"]) if self.commitment_mode else None
+        self.committed_models=CommittedModels(self.blob_store,self.config) if self.commitment_mode else None
+        self.coordinated=self.config["DEFAULT"]["RoundClosing"]=="coordinator"
+        self.transactions=None
+
+    async def connect(self):
+        self.web3Connection=Web3(Web3.AsyncHTTPProvider(self.config["DEFAULT"]["EtheriumRPCServer"],request_kwargs={'timeout': 60*10}),
+                                 modules={"eth":(AsyncEth,)},middlewares=[])
+        with open(self.config["DEFAULT"]["FLContractABIPAth"]) as f:
+            self.FLcontractABI=json.load(f)["abi"]
+        # without a provider the contract object only encodes and decodes
+        self.FLcontract=Web3().eth.contract(address=self.FLcontractAddress,abi=self.FLcontractABI)
+        self.accounts=await self.web3Connection.eth.accounts
+        self.lock_cache=asyncio.Lock()
+        self.round_changed=asyncio.Condition()
+        self.transactions=TransactionManager(Web3(Web3.HTTPProvider(self.config["DEFAULT"]["EtheriumRPCServer"],request_kwargs={'timeout': 60*10})),self.config)
+
+    async def close(self):
+        if self.round_watcher is not None:
+            self.round_watcher.cancel()
+
+    def __account(self,accountNR):
+        return self.accounts[accountNR]
+
+    def __transaction(self,accountNR,fn_name,args):
+        return {"from":self.__account(accountNR),"to":self.FLcontractAddress,"data":self.FLcontract.encodeABI(fn_name=fn_name,args=args)}
+
+    async def __call(self,accountNR,fn_name,*args):
+        result=await self.web3Connection.eth.call(self.__transaction(accountNR,fn_name,list(args)))
+        output_types=[output["type"] for output in self.FLcontract.get_function_by_name(fn_name).abi["outputs"]]
+        values=self.web3Connection.codec.decode_abi(output_types,HexBytes(result))
+        return values[0] if len(values)==1 else values
+
+    # submits without waiting for the receipt. Gas estimation and sending block on the node, they
+    # run on the default executor of the loop with the trace context of the task.
+    async def __submit_transaction(self,accountNR,fn_name,*args):
+        function=self.FLcontract.get_function_by_name(fn_name)(*args)
+        submit=functools.partial(contextvars.copy_context().run,self.transactions.submit,function,self.__account(accountNR))
+        return await asyncio.get_running_loop().run_in_executor(None,submit)
+
+    # waits until the transaction is mined or TransactionTimeout passed and returns it, its result()
+    # raises TransactionReverted for a revert
+    async def __await_Transaction(self,pending):
+        loop=asyncio.get_running_loop()
+        done=loop.create_future()
+        pending.add_done_callback(lambda pending: loop.call_soon_threadsafe(done.set_result,pending))
+        with tracer.span("tx_receipt"):
+            try:
+                await asyncio.wait_for(asyncio.shield(done),self.transactions.timeout)
+            except asyncio.TimeoutError:
+                self.transactions.expire(pending)
+        return pending
+
+    async def __transact(self,accountNR,fn_name,*args):
+        return await self.__await_Transaction(await self.__submit_transaction(accountNR,fn_name,*args))
+
+    async def get_constants(self,accountNR):
+        async with self.lock_cache:
+            if self.constants is None:
+                names=["getPrecision","getLearningRate","getBatchSize","getInputDimension","getOutputDimension"]
+                values=await asyncio.gather(*[self.__call(accountNR,name) for name in names])
+                self.constants=dict(zip(names,values))
+            return self.constants
+
+    async def get_RoundNumber(self,accountNR):
+        return await self.__call(accountNR,"getRoundNumber")
+
+    async def get_account_balance(self,accountNR):
+        return self.web3Connection.fromWei(await self.web3Connection.eth.get_balance(self.__account(accountNR)),"ether")
+
+    # balance of the account plus the global model of the round, the model is only read once per
+    # round number and shared by all devices of this connection
+    async def get_round_state(self,accountNR,round):
+        async with self.lock_cache:
+            if self.global_model_round!=round or round is None:
+                model_call="get_global_commitment" if self.commitment_mode else "get_global_model"
+                round,model=await asyncio.gather(self.get_RoundNumber(accountNR),self.__call(accountNR,model_call))
+                self.global_model_round=round
+                self.global_model=self.get_model_by_hash(model) if self.commitment_mode else unpack_global_model(self.config,model)
+            weights,bias=self.global_model
+        return await self.get_account_balance(accountNR),weights,bias
+
+    def get_model_by_hash(self,model_hash):
+        return self.committed_models.get(model_hash)
+
+    # submitted back to back with consecutive nonces and confirmed together
+    async def init_contract(self,accountNR,verifier_address=None,batch_verifier_address=None):
+        if accountNR!=0:
+            return
+        transactions=[await self.__submit_transaction(accountNR,fn_name,*args)
+                      for fn_name,args in init_transactions(self.config,self.__account,verifier_address,batch_verifier_address,self.blob_store)]
+        for transaction in transactions:
+            (await self.__await_Transaction(transaction)).result()
+        async with self.lock_cache:
+            self.global_model_round=None
+
+    def start_round_watcher(self,accountNR):
+        if self.round_watcher is None:
+            self.round_watcher=asyncio.create_task(self.__watch_rounds(accountNR))
+
+    # waits until a round after after_round has started, returns its number or None on timeout
+    async def wait_for_round(self,after_round,timeout=None):
+        async with self.round_changed:
+            try:
+                await asyncio.wait_for(self.round_changed.wait_for(lambda: self.model_initialized and self.current_round>after_round),timeout)
+            except asyncio.TimeoutError:
+                return None
+            return self.current_round
+
+    async def __set_round(self,round,interval_end,initialized):
+        async with self.round_changed:
+            if self.current_round is None or round>=self.current_round:
+                self.current_round=round
+                self.interval_end=interval_end
+            self.model_initialized=self.model_initialized or initialized
+            self.round_changed.notify_all()
+
+    async def __read_round(self,accountNR):
+        model_call="get_global_commitment" if self.commitment_mode else "get_global_model"
+        round,remaining,model=await asyncio.gather(self.get_RoundNumber(accountNR),
+                                                   self.__call(accountNR,"time_until_next_update_round"),
+                                                   self.__call(accountNR,model_call))
+        initialized=int(HexBytes(model).hex(),16)!=0 if self.commitment_mode else len(model)>0
+        await self.__set_round(round,time.time()+remaining,initialized)
+
+    async def __watch_rounds(self,accountNR):
+        topic=Web3.keccak(text="RoundStarted(uint256,uint256)").hex()
+        from_block=await self.web3Connection.eth.block_number
+        await self.__read_round(accountNR)
+        next_end_attempt=0
+        while True:
+            try:
+                latest=await self.web3Connection.eth.block_number
+                if latest>=from_block:
+                    logs=await self.web3Connection.eth.get_logs({"address":self.FLcontractAddress,"topics":[topic],"fromBlock":from_block,"toBlock":latest})
+                    if logs:
+                        round=decode_round_started(self.web3Connection.codec,logs[-1])
+                        # the event holds a block timestamp, the interval end is kept on the local clock
+                        remaining=await self.__call(accountNR,"time_until_next_update_round")
+                        await self.__set_round(round,time.time()+remaining,True)
+                    from_block=latest+1
+                if not self.coordinated and self.model_initialized and await self.__round_due(accountNR,next_end_attempt):
+                    await self.__end_round(accountNR)
+                    await self.__read_round(accountNR)
+                    next_end_attempt=time.time()+self.config["DEFAULT"]["WaitingTime"]
+            except Exception as e:
+                print(f"AccountNr = {accountNR}: Round watcher failed: {e}")
+            await asyncio.sleep(self.config["DEFAULT"]["BlockPollInterval"])
+
+    async def __round_due(self,accountNR,next_end_attempt):
+        due=round_due(self.config,self.interval_end,next_end_attempt)
+        if due is None:
+            return quorum_reached(self.config,await self.__call(accountNR,"participantsCount"))
+        return due
+
+    async def __end_round(self,accountNR):
+        transaction=await self.__transact(accountNR,"end_update_round")
+        try:
+            transaction.result()
+        except TransactionReverted:
+            print(f"AccountNr = {accountNR}: Update Ending Reverted: {transaction.status}")
+        except Exception as intx:
+            print(f"AccountNr = {accountNR}: Update Ending Failed")
+            print(intx)
+
+    async def __submit(self,weights,bias,accountNR,round,proof):
+        fn_name,args,model_hash=update_call(self.config,round,weights,bias,proof,self.blob_store)
+        transaction=await self.__transact(accountNR,fn_name,*args)
+        transaction.result()
+        print(update_message(accountNR,model_hash))
+        return transaction
+
+    # sends the update trained in round, returns the last transaction or None, only failures to
+    # reach the node are retried
+    async def update(self,weights,bias,accountNR,round,proof=None):
+        tries=5
+        while True:
+            try:
+                return await self.__submit(weights,bias,accountNR,round,proof)
+            except TransactionReverted as reverted:
+                print(f"AccountNr = {accountNR}: Update Reverted: {reverted.transaction.status}")
+                return reverted.transaction
+            except Exception:
+                tries-=1
+                if tries == 0:
+                    print(f"AccountNr = {accountNR}: Update Failed")
+                    return None
+                await asyncio.sleep(self.config["DEFAULT"]["WaitingTime"])
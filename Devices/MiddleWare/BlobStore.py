@@ -0,0 +1,57 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+from hexbytes import HexBytes
+
+from Devices.MiddleWare.ParameterPacking import model_from_blob
+
+
+class BlobStore:
+    # Content addressed store in a local directory, every blob is saved under the hex sha256 of
+    # its bytes, so a hash committed on chain identifies exactly one blob
+    def __init__(self,directory):
+        self.directory=directory
+        os.makedirs(self.directory,exist_ok=True)
+
+    def path(self,digest):
+        return os.path.join(self.directory,digest)
+
+    def put(self,data):
+        digest=hashlib.sha256(data).hexdigest()
+        path=self.path(digest)
+        if not os.path.exists(path):
+            # written to a temporary file first so readers never see a partial blob
+            fd,tmp=tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd,"wb") as f:
+                f.write(data)
+            os.replace(tmp,path)
+        return digest
+
+    def get(self,digest):
+        with open(self.path(digest),"rb") as f:
+            data=f.read()
+        if hashlib.sha256(data).hexdigest()!=digest:
+            raise ValueError(f"Blob {digest} is corrupted")
+        return data
+
+
+class CommittedModels:
+    # weights and bias of the models committed on chain, read from the blob store once and kept
+    # by hash. An all zero hash means nothing was committed yet.
+    def __init__(self,blob_store,config_file):
+        self.blob_store=blob_store
+        self.config=config_file
+        self.lock=threading.Lock()
+        self.models={}
+
+    def get(self,model_hash):
+        model_hash=HexBytes(model_hash).hex().replace("0x","")
+        if int(model_hash,16)==0:
+            return [],[]
+        with self.lock:
+            if model_hash not in self.models:
+                weights,bias=model_from_blob(self.blob_store.get(model_hash),self.config["DEFAULT"]["OutputDimension"],self.config["DEFAULT"]["InputDimension"])
+                self.models[model_hash]=(weights.tolist(),bias.tolist())
+            return self.models[model_hash]
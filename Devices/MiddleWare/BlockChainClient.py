@@ -2,10 +2,115 @@ import threading
 import time
 
 import numpy as np
+import requests
+from hexbytes import HexBytes
 from web3 import Web3
+from Devices.Analytics.Tracing import tracer
+from Devices.MiddleWare.BlobStore import BlobStore, CommittedModels
+from Devices.MiddleWare.ParameterPacking import model_to_blob, pack_model, unpack_model
+from Devices.MiddleWare.TransactionManager import TransactionManager, TransactionReverted
 from Devices.utils.utils import read_yaml
 import json
 
+# The parts of talking to FederatedModel that do not depend on how requests are sent, shared by
+# BlockChainConnection and AsyncBlockChainConnection.
+
+
+# the random initial model of init_contract, the same in every run
+def initial_model(config_file):
+    np.random.seed(4)
+    weights = np.random.randn(config_file["DEFAULT"]["OutputDimension"],config_file["DEFAULT"]["InputDimension"])*config_file["DEFAULT"]["Precision"]/5
+    bias = np.random.randn(config_file["DEFAULT"]["OutputDimension"],)*config_file["DEFAULT"]["Precision"]/5
+    return np.asarray(weights,dtype=np.int64),np.asarray(bias,dtype=np.int64)
+
+
+# the transactions of init_contract as (function name, arguments) in the order they are sent,
+# account_of maps an account number to its address
+def init_transactions(config_file,account_of,verifier_address=None,batch_verifier_address=None,blob_store=None):
+    weights,bias=initial_model(config_file)
+    if blob_store is not None:
+        calls=[("initModelCommitment",[Web3.toBytes(hexstr=blob_store.put(model_to_blob(weights,bias)))])]
+    else:
+        calls=[("initModel",[pack_model(weights,bias)])]
+    calls.append(("map_temp_to_global",[]))
+    calls.append(("updateVerifier",[verifier_address or config_file["DEFAULT"]["VerifierContractAddress"]]))
+    if config_file["DEFAULT"]["UpdateMode"]=="aggregated":
+        calls.append(("updateBatchVerifier",[batch_verifier_address or config_file["DEFAULT"]["BatchVerifierContractAddress"]]))
+    if config_file["DEFAULT"]["UpdateMode"] in ("aggregated","commitment"):
+        calls.append(("setAggregator",[account_of(config_file["DEFAULT"]["AggregatorAccount"])]))
+    if config_file["DEFAULT"]["RoundClosing"]=="coordinator":
+        calls.append(("setCoordinator",[account_of(config_file["DEFAULT"]["CoordinatorAccount"])]))
+    if config_file["DEFAULT"]["RoundQuorum"]>0:
+        calls.append(("setQuorum",[config_file["DEFAULT"]["RoundQuorum"]]))
+    return calls
+
+
+# function name and arguments of a device update for round plus the hash of the committed model.
+# The contract reverts the update as round_ended once round is over. In commitment mode the model
+# goes to the blob store and only its hash on chain, with a proof the contract derives the hash
+# from the proven model itself.
+def update_call(config_file,round,weights,bias,proof=None,blob_store=None):
+    proof=proof if config_file["DEFAULT"]["PerformProof"] else None
+    if blob_store is not None:
+        model_hash=blob_store.put(model_to_blob(weights,bias))
+        if proof is not None:
+            return "commit_update_with_proof",[round,*proof_calldata(proof)],model_hash
+        return "commit_update",[round,Web3.toBytes(hexstr=model_hash)],model_hash
+    if proof is not None:
+        return "update_with_proof",[round,pack_model(weights,bias),*proof_calldata(proof)],None
+    return "update_without_proof",[round,pack_model(weights,bias)],None
+
+
+def update_message(accountNR,model_hash):
+    if model_hash is not None:
+        return f"AccountNr = {accountNR}: UPDATE {model_hash[:10]} COMMITTED"
+    return f"AccountNr = {accountNR}: UPDATE SUCCESSFUL"
+
+
+# a, b, c and the public inputs of a zokrates proof.json as contract arguments
+def proof_calldata(proof):
+    a=[Web3.toInt(hexstr=x) for x in proof['proof']['a']]
+    b=[[Web3.toInt(hexstr=x) for x in y] for y in proof['proof']['b']]
+    c=[Web3.toInt(hexstr=x) for x in proof['proof']['c']]
+    inputs=[Web3.toInt(hexstr=x) for x in proof['inputs']]
+    return a,b,c,inputs
+
+
+# updateHash of FederatedModel, a device signs it to hand its proven update of round to the aggregator
+def update_hash(contract_address,round,proof):
+    inputs=proof_calldata(proof)[3]
+    return Web3.keccak(HexBytes(contract_address)+round.to_bytes(32,"big")+b"".join(x.to_bytes(32,"big") for x in inputs))
+
+
+# the contract keeps the model packed, see ParameterPacking
+def unpack_global_model(config_file,packed):
+    if len(packed)==0:
+        return [],[]
+    weights,bias=unpack_model(packed,config_file["DEFAULT"]["OutputDimension"],config_file["DEFAULT"]["InputDimension"])
+    return weights.tolist(),bias.tolist()
+
+
+def decode_round_started(codec,log):
+    round,_=codec.decode_abi(["uint256","uint256"],HexBytes(log["data"]))
+    return round
+
+
+def quorum_reached(config_file,participants):
+    quorum=config_file["DEFAULT"]["RoundQuorum"]
+    return quorum>0 and participants>=quorum
+
+
+# whether a round watcher may end the running round, its interval is over or RoundQuorum
+# updates are in. None means only the number of updates of the round can tell.
+def round_due(config_file,interval_end,next_end_attempt):
+    now=time.time()
+    if now<next_end_attempt:
+        return False
+    if now>=interval_end:
+        return True
+    return None if config_file["DEFAULT"]["RoundQuorum"]>0 else False
+
+
 class BlockChainConnection:
     def __init__(self,config_file):
         self.config = config_file
@@ -15,99 +120,244 @@ class BlockChainConnection:
         self.FLcontractAddress=self.config["DEFAULT"]["FLContractAddress"]
         self.lock_newRound=threading.Lock()
         self.precision=None
+        self.accounts=None
+        # values that stay fixed for the whole run and the global model of the latest round read
+        self.lock_cache=threading.Lock()
+        self.constants=None
+        self.global_model_round=None
+        self.global_model=None
+        # state of the round watcher, changes are signalled to all waiting devices at once
+        self.round_changed=threading.Condition()
+        self.round_watcher=None
+        self.current_round=None
+        self.interval_end=None
+        self.model_initialized=False
+        # in commitment mode the chain only holds model hashes, the models are read from the blob
+        # store once and kept by hash
+        self.commitment_mode=self.config["DEFAULT"]["UpdateMode"]=="commitment"
+        self.blob_store=BlobStore(self.config["DEFAULT"]["BlobStorePath"]) if self.commitment_mode else None
+        self.committed_models=CommittedModels(self.blob_store,self.config) if self.commitment_mode else None
+        self.transactions=None
+        # with RoundClosing "coordinator" only the RoundCoordinator ends rounds, devices just watch
+        self.coordinated=self.config["DEFAULT"]["RoundClosing"]=="coordinator"
 
     def connect(self):
         self.web3Connection=Web3(Web3.HTTPProvider(self.config["DEFAULT"]["EtheriumRPCServer"],request_kwargs={'timeout': 60*10}))
         with open(self.config["DEFAULT"]["FLContractABIPAth"]) as f:
             self.FLcontractABI=json.load(f)["abi"]
         self.FLcontractDeployed=self.web3Connection.eth.contract(address=self.FLcontractAddress,abi=self.FLcontractABI)
-
-    def init_contract(self,accountNR):
+        self.accounts=self.web3Connection.eth.accounts
+        self.transactions=TransactionManager(self.web3Connection,self.config)
+
+    def __account(self,accountNR):
+        return self.accounts[accountNR]
+
+    def __contract_call(self,accountNR,fn_name):
+        data=self.FLcontractDeployed.encodeABI(fn_name=fn_name)
+        return "eth_call",[{"from":self.__account(accountNR),"to":self.FLcontractAddress,"data":data},"latest"]
+
+    def __decode_call(self,fn_name,result):
+        output_types=[output["type"] for output in self.FLcontractDeployed.get_function_by_name(fn_name).abi["outputs"]]
+        return self.web3Connection.codec.decode_abi(output_types,HexBytes(result))[0]
+
+    # sends all requests as one JSON-RPC batch and returns the results in request order
+    def __batch_request(self,requests_):
+        payload=[{"jsonrpc":"2.0","id":i,"method":method,"params":params} for i,(method,params) in enumerate(requests_)]
+        response=requests.post(self.config["DEFAULT"]["EtheriumRPCServer"],json=payload,timeout=60*10).json()
+        results={}
+        for entry in response:
+            if "error" in entry:
+                raise ValueError(f"RPC request {requests_[entry['id']][0]} failed: {entry['error']}")
+            results[entry["id"]]=entry["result"]
+        return [results[i] for i in range(len(requests_))]
+
+    def __batch_contract_calls(self,accountNR,fn_names,extra_requests=()):
+        results=self.__batch_request([self.__contract_call(accountNR,fn_name) for fn_name in fn_names]+list(extra_requests))
+        decoded=[self.__decode_call(fn_name,result) for fn_name,result in zip(fn_names,results)]
+        return decoded+results[len(fn_names):]
+
+    # precision, learning rate, batch size and dimensions are read once per run
+    def get_constants(self,accountNR):
+        with self.lock_cache:
+            if self.constants is None:
+                names=["getPrecision","getLearningRate","getBatchSize","getInputDimension","getOutputDimension"]
+                self.constants=dict(zip(names,self.__batch_contract_calls(accountNR,names)))
+                self.precision=self.constants["getPrecision"]
+            return self.constants
+
+    # balance of the account plus the global model of the round, the model is only read
+    # from the chain once per round number and shared by all devices of this connection
+    def get_round_state(self,accountNR,round):
+        balance_request=("eth_getBalance",[self.__account(accountNR),"latest"])
+        with self.lock_cache:
+            cached=self.global_model_round==round and round is not None
+            if not cached:
+                model_call="get_global_commitment" if self.commitment_mode else "get_global_model"
+                round,model,balance=self.__batch_contract_calls(accountNR,["getRoundNumber",model_call],[balance_request])
+                self.global_model_round=round
+                self.global_model=self.get_model_by_hash(model) if self.commitment_mode else unpack_global_model(self.config,model)
+            weights,bias=self.global_model
+        if cached:
+            balance=self.__batch_request([balance_request])[0]
+        return self.web3Connection.fromWei(int(balance,16),"ether"),weights,bias
+
+    def init_contract(self,accountNR,verifier_address=None,batch_verifier_address=None):
         if self.is_connected() and accountNR==0:
-             np.random.seed(4)
-             weights = np.random.randn(self.config["DEFAULT"]["OutputDimension"],self.config["DEFAULT"]["InputDimension"])*self.config["DEFAULT"]["Precision"]/5
-             bias = np.random.randn(self.config["DEFAULT"]["OutputDimension"],)*self.config["DEFAULT"]["Precision"]/5
-             weights = [[int(x) for x in y] for y in weights]
-             bias = [int(x) for x in bias]
-             thxHash= self.FLcontractDeployed.functions.initModel(weights,bias).transact({"from": self.web3Connection.eth.accounts[accountNR]})
-             self.__await_Trainsaction(thxHash)
-             thxHash= self.FLcontractDeployed.functions.map_temp_to_global().transact({"from": self.web3Connection.eth.accounts[accountNR]})
-             self.__await_Trainsaction(thxHash)
-             thxHash = self.FLcontractDeployed.functions.updateVerifier(self.config["DEFAULT"]["VerifierContractAddress"]).transact({"from": self.web3Connection.eth.accounts[0]})
-             self.__await_Trainsaction(thxHash)
-
-    def __check_ZKP(self,proof,accountNR):
-         a=proof['proof']['a']
-         a=[Web3.toInt(hexstr=x) for x in a]
-         b=proof['proof']['b']
-         b=[[Web3.toInt(hexstr=x) for x in y] for y in b ]
-         c=proof['proof']['c']
-         c=[Web3.toInt(hexstr=x) for x in c]
-         inputs = proof['inputs']
-         inputs = [Web3.toInt(hexstr=x) for x in inputs]
-         #istrue= self.FLcontractDeployed.functions.checkZKP(a,b,c, inputs).call({"from": self.web3Connection.eth.accounts[accountNR]})
-         #print(f"AccountNr = {accountNR}: ZKP went through",istrue)
-         return a,b,c,inputs
-
-
-    def __await_Trainsaction(self,thxHash):
-        self.web3Connection.eth.wait_for_transaction_receipt(thxHash)
+             # submitted back to back with consecutive nonces and confirmed together
+             calls=init_transactions(self.config,self.__account,verifier_address,batch_verifier_address,self.blob_store)
+             transactions=[self.__transact(accountNR,self.__function(fn_name,args)) for fn_name,args in calls]
+             for transaction in transactions:
+                 self.transactions.wait(transaction)
+             with self.lock_cache:
+                 self.global_model_round=None
+
+    # starts the single thread per connection that follows the RoundStarted events of the contract
+    def start_round_watcher(self,accountNR):
+        with self.round_changed:
+            if self.round_watcher is not None:
+                return
+            self.round_watcher=threading.Thread(target=self.__watch_rounds,args=[accountNR],daemon=True)
+        self.round_watcher.start()
+
+    # blocks until a round after after_round has started, returns its number or None on timeout
+    def wait_for_round(self,after_round,timeout=None):
+        with self.round_changed:
+            started=self.round_changed.wait_for(lambda: self.model_initialized and self.current_round>after_round,timeout=timeout)
+            return self.current_round if started else None
+
+    def __set_round(self,round,interval_end,initialized):
+        with self.round_changed:
+            if self.current_round is None or round>=self.current_round:
+                self.current_round=round
+                self.interval_end=interval_end
+            self.model_initialized=self.model_initialized or initialized
+            self.round_changed.notify_all()
+
+    def __read_round(self,accountNR):
+        round=self.get_RoundNumber(accountNR)
+        remaining=self.FLcontractDeployed.functions.time_until_next_update_round().call({"from": self.__account(accountNR)})
+        initialized=len(self.get_globalWeights(accountNR))>0
+        self.__set_round(round,time.time()+remaining,initialized)
+
+    def __watch_rounds(self,accountNR):
+        topic=Web3.keccak(text="RoundStarted(uint256,uint256)").hex()
+        round_filter=self.web3Connection.eth.filter({"address":self.FLcontractAddress,"topics":[topic]})
+        self.__read_round(accountNR)
+        next_end_attempt=0
+        while True:
+            try:
+                # one request per poll, independent of the number of waiting devices
+                logs=round_filter.get_new_entries()
+                if logs:
+                    round=decode_round_started(self.web3Connection.codec,logs[-1])
+                    # the event holds the interval end as block timestamp, it is kept on the local
+                    # clock like in __read_round
+                    remaining=self.FLcontractDeployed.functions.time_until_next_update_round().call({"from": self.__account(accountNR)})
+                    self.__set_round(round,time.time()+remaining,True)
+                if not self.coordinated and self.model_initialized and self.__round_due(accountNR,next_end_attempt):
+                    self.end_round(accountNR)
+                    self.__read_round(accountNR)
+                    next_end_attempt=time.time()+self.config["DEFAULT"]["WaitingTime"]
+            except Exception as e:
+                print(f"AccountNr = {accountNR}: Round watcher failed: {e}")
+            time.sleep(self.config["DEFAULT"]["BlockPollInterval"])
+
+    def __round_due(self,accountNR,next_end_attempt):
+        due=round_due(self.config,self.interval_end,next_end_attempt)
+        if due is None:
+            return quorum_reached(self.config,self.get_round_progress(accountNR)[2])
+        return due
+
+    # returns the finished transaction, a revert only means the round was not over yet
+    def end_round(self,accountNR):
+        with self.lock_newRound:
+            transaction=self.__transact(accountNR,self.FLcontractDeployed.functions.end_update_round())
+            try:
+                self.transactions.wait(transaction)
+            except TransactionReverted:
+                print(f"AccountNr = {accountNR}: Update Ending Reverted: {transaction.status}")
+            except Exception as intx:
+                print(f"AccountNr = {accountNR}: Update Ending Failed")
+                print(intx)
+            return transaction
+
+    def __function(self,fn_name,args):
+        return self.FLcontractDeployed.get_function_by_name(fn_name)(*args)
+
+    # submits without waiting for the receipt, see TransactionManager
+    def __transact(self,accountNR,function):
+        return self.transactions.submit(function,self.__account(accountNR))
+
+    def __await_Trainsaction(self,transaction):
+        with tracer.span("tx_receipt"):
+            return self.transactions.wait(transaction)
 
     def is_connected(self):
         return self.web3Connection.isConnected()
 
     def get_LearningRate(self,accountNR):
-        self.precision=self.__get_Precision(accountNR)
-        lr=self.FLcontractDeployed.functions.getLearningRate().call({"from":self.web3Connection.eth.accounts[accountNR]})
-        return lr
+        return self.get_constants(accountNR)["getLearningRate"]
 
     def __get_Precision(self,accountNR):
-        return self.FLcontractDeployed.functions.getPrecision().call({"from":self.web3Connection.eth.accounts[accountNR]})
+        return self.get_constants(accountNR)["getPrecision"]
 
     def get_InputDimension(self,accountNR):
-        return self.FLcontractDeployed.functions.getInputDimension().call({"from":self.web3Connection.eth.accounts[accountNR]})
+        return self.get_constants(accountNR)["getInputDimension"]
 
     def get_Epochs(self,accountNR):
         return self.config["DEFAULT"]["Epochs"]
 
     def get_OutputDimension(self,accountNR):
-        return self.FLcontractDeployed.functions.getOutputDimension().call({"from":self.web3Connection.eth.accounts[accountNR]})
+        return self.get_constants(accountNR)["getOutputDimension"]
 
     def get_globalWeights(self,accountNR):
-
-        we=self.FLcontractDeployed.functions.get_global_weights().call(
-            {"from": self.web3Connection.eth.accounts[accountNR]})
-        return we
+        return self.get_global_model(accountNR)[0]
 
     def get_globalBias(self,accountNR):
-        bias=self.FLcontractDeployed.functions.get_global_bias().call(
-            {"from": self.web3Connection.eth.accounts[accountNR]})
-        return bias
+        return self.get_global_model(accountNR)[1]
+
+    def get_global_model(self,accountNR):
+        if self.commitment_mode:
+            model_hash=self.FLcontractDeployed.functions.get_global_commitment().call(
+                {"from": self.__account(accountNR)})
+            return self.get_model_by_hash(model_hash)
+        packed=self.FLcontractDeployed.functions.get_global_model().call(
+            {"from": self.__account(accountNR)})
+        return unpack_global_model(self.config,packed)
+
+    # weights and bias of a committed model, an all zero hash means nothing was committed yet
+    def get_model_by_hash(self,model_hash):
+        return self.committed_models.get(model_hash)
+
+    # device and model hash of every update committed in the round, in the order they were mined
+    def get_update_commitments(self,round,from_block=0):
+        logs=self.FLcontractDeployed.events.UpdateCommitted.getLogs(fromBlock=from_block,argument_filters={"round":round})
+        return [(log["args"]["device"],HexBytes(log["args"]["modelHash"]).hex().replace("0x","")) for log in logs]
+
+    def commit_global_model(self,weights,bias,round,accountNR):
+        model_hash=self.blob_store.put(model_to_blob(weights,bias))
+        transaction=self.__transact(accountNR,self.FLcontractDeployed.functions.commit_global_model(round,Web3.toBytes(hexstr=model_hash)))
+        receipt=self.__await_Trainsaction(transaction)
+        return model_hash,receipt["gasUsed"]
 
     def get_account_balance(self,accountNR):
-        return self.web3Connection.fromWei(self.web3Connection.eth.getBalance( self.web3Connection.eth.accounts[accountNR]), "ether")
+        return self.web3Connection.fromWei(self.web3Connection.eth.getBalance( self.__account(accountNR)), "ether")
 
 
     def roundUpdateOutstanding(self,accountNR):
         self.lock_newRound.acquire()
-        newround=self.FLcontractDeployed.functions.roundUpdateOutstanding().call({"from": self.web3Connection.eth.accounts[accountNR]})
-        if not newround:
+        newround=self.FLcontractDeployed.functions.roundUpdateOutstanding().call({"from": self.__account(accountNR)})
+        if not newround and not self.coordinated:
+            # a revert is final, another device ended the round or it is not over yet
+            transaction=self.__transact(accountNR,self.FLcontractDeployed.functions.end_update_round())
             try:
-                txhash=self.FLcontractDeployed.functions.end_update_round().transact(
-                    {"from": self.web3Connection.eth.accounts[accountNR]})
-                self.__await_Trainsaction(txhash)
+                self.__await_Trainsaction(transaction)
+            except TransactionReverted:
+                print(f"AccountNr = {accountNR}: Update Ending Reverted: {transaction.status}")
             except Exception as intx:
-                print(f"AccountNr = {accountNR}: Update Ending Reverted")
-                print(f"AccountNr = {accountNR}: Trying end Again")
-                try:
-                    # , a, b, c, inputs
-                    txhash = self.FLcontractDeployed.functions.end_update_round().transact(
-                        {"from": self.web3Connection.eth.accounts[accountNR]})
-                    self.__await_Trainsaction(txhash)
-                except Exception as intx:
-                    print(f"AccountNr = {accountNR}: Update Ending Reverted")
-                    print(intx)
-        newround_refreshed=self.FLcontractDeployed.functions.roundUpdateOutstanding().call({"from": self.web3Connection.eth.accounts[accountNR]})
+                print(f"AccountNr = {accountNR}: Update Ending Failed")
+                print(intx)
+        newround_refreshed=self.FLcontractDeployed.functions.roundUpdateOutstanding().call({"from": self.__account(accountNR)})
         if newround_refreshed and (not newround):
             print(f"AccountNr = {accountNR}: Round is finished starting new round =>")
             self.lock_newRound.release()
@@ -116,56 +366,61 @@ class BlockChainConnection:
             self.lock_newRound.release()
             return newround
 
-    def __update_with_proof(self,weights,bias,accountNR,proof):
-        a,b,c,inputs=self.__check_ZKP(proof,accountNR)
-        weights = [[int(x) for x in y] for y in weights]
-        bias = [int(x) for x in bias]
-        thxHash = self.FLcontractDeployed.functions.update_with_proof(weights, bias,a,b,c,inputs).transact(
-            {"from": self.web3Connection.eth.accounts[accountNR]})
-        self.__await_Trainsaction(thxHash)
-        print(f"AccountNr = {accountNR}: UPDATE SUCCESSFUL")
-
-
-    def __update_without_proof(self,weights,bias,accountNR):
-        weights = [[int(x) for x in y] for y in weights]
-        bias = [int(x) for x in bias]
-        thxHash = self.FLcontractDeployed.functions.update_without_proof(weights, bias).transact(
-            {"from": self.web3Connection.eth.accounts[accountNR]})
-        self.__await_Trainsaction(thxHash)
-        print(f"AccountNr = {accountNR}: UPDATE SUCCESSFUL")
-
-
-    def update(self,weights,bias,accountNR,proof=None):
-        if self.config["DEFAULT"]["PerformProof"]:
-            tries=5
-            while tries>0:
-                try:
-                    self.__update_with_proof(weights,bias,accountNR,proof)
-                    tries=-1
-                except:
-                    time.sleep(self.config["DEFAULT"]["WaitingTime"])
-                    if tries == 1:
-                        print(f"AccountNr = {accountNR}: Update Failed")
-                    tries-=1
-        else:
-            tries = 5
-            while tries > 0:
-                try:
-                    self.__update_without_proof(weights, bias, accountNR)
-                    tries = -1
-                except:
-                    time.sleep(self.config["DEFAULT"]["WaitingTime"])
-                    if tries == 1:
-                        print(f"AccountNr = {accountNR}: Update Failed")
-                    tries -= 1
+    def __submit(self,weights,bias,accountNR,round,proof):
+        fn_name,args,model_hash=update_call(self.config,round,weights,bias,proof,self.blob_store)
+        transaction=self.__transact(accountNR,self.__function(fn_name,args))
+        self.__await_Trainsaction(transaction)
+        print(update_message(accountNR,model_hash))
+        return transaction
+
+    # eth_sign signature of the account over its proven update of round, see update_aggregated
+    def sign_update(self,round,proof,accountNR):
+        return bytes(self.web3Connection.eth.sign(self.__account(accountNR),data=update_hash(self.FLcontractAddress,round,proof)))
+
+    # submits the proven updates of several devices for round with one transaction, returns the gas
+    # used. signatures[i] is the sign_update signature of device i
+    def update_aggregated(self,round,proofs,signatures,deviceAccountNRs,accountNR):
+        a,b,c,inputs=[],[],[],[]
+        for proof in proofs:
+            a_i,b_i,c_i,inputs_i=proof_calldata(proof)
+            a.append(a_i)
+            b.append(b_i)
+            c.append(c_i)
+            inputs.append(inputs_i)
+        devices=[self.__account(nr) for nr in deviceAccountNRs]
+        transaction=self.__transact(accountNR,self.FLcontractDeployed.functions.update_aggregated(round,devices,signatures,a,b,c,inputs))
+        receipt=self.__await_Trainsaction(transaction)
+        print(f"AccountNr = {accountNR}: AGGREGATED UPDATE OF {len(proofs)} DEVICES SUCCESSFUL")
+        return receipt["gasUsed"]
+
+    # sends the update trained in round, returns the last transaction or None. Only failures to
+    # reach the node are retried, a revert would revert again
+    def update(self,weights,bias,accountNR,round,proof=None):
+        tries=5
+        while True:
+            try:
+                return self.__submit(weights,bias,accountNR,round,proof)
+            except TransactionReverted as reverted:
+                print(f"AccountNr = {accountNR}: Update Reverted: {reverted.transaction.status}")
+                return reverted.transaction
+            except Exception:
+                tries-=1
+                if tries == 0:
+                    print(f"AccountNr = {accountNR}: Update Failed")
+                    return None
+                time.sleep(self.config["DEFAULT"]["WaitingTime"])
 
 
     def get_BatchSize(self,accountNR):
-        return  self.FLcontractDeployed.functions.getBatchSize().call({"from":self.web3Connection.eth.accounts[accountNR]})
+        return self.get_constants(accountNR)["getBatchSize"]
+
+    # round number, seconds until the round may be ended and updates received so far, in one request
+    def get_round_progress(self,accountNR):
+        return self.__batch_contract_calls(accountNR,["getRoundNumber","time_until_next_update_round","participantsCount"])
 
     def get_RoundNumber(self, accountNR):
         return self.FLcontractDeployed.functions.getRoundNumber().call(
-            {"from": self.web3Connection.eth.accounts[accountNR]})
+            {"from": self.__account(accountNR)})
 
     def get_Precision(self,accountNR):
         self.precision = self.__get_Precision(accountNR)
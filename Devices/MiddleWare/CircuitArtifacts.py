@@ -0,0 +1,139 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+
+
+class CircuitArtifacts:
+    # Generates root.zok for a (batch size, input dimension, output dimension) shape, compiles
+    # and sets it up once and keeps out, abi.json, the keys and verifier.sol in
+    # VerificationBase/circuits/<sha256 of the generated source>. Later runs with the same
+    # shape reuse the directory instead of compiling again. The verifying key is compiled into
+    # verifier.sol, so Verifier and BatchVerifier have to be deployed from the directory of the
+    # shape and their addresses recorded in its metadata.json, see __main__.
+    def __init__(self,config_file):
+        self.config=config_file
+        self.template=self.config["DEFAULT"]["ZokratesPath"]
+        self.cache_base=os.path.join(self.config["DEFAULT"]["VerificationBase"],"circuits")
+
+    def generate_source(self,batch_size,input_dimension,output_dimension):
+        with open(self.template,"r") as f:
+            source=f.read()
+        constants={"bs":("u32",batch_size),"fe":("u32",input_dimension),"ac":("u32",output_dimension),"ac_f":("field",output_dimension)}
+        for name,(type_,value) in constants.items():
+            source,count=re.subn(rf"(const\s+{type_}\s+{name}\s*=\s*)\d+",rf"\g<1>{value}",source)
+            if count!=1:
+                raise ValueError(f"{self.template} does not define the constant {name}")
+        return source
+
+    def path(self,source):
+        return os.path.join(self.cache_base,hashlib.sha256(source.encode()).hexdigest())
+
+    # returns the artifact directory of the shape, building it if it is not cached yet
+    def ensure(self,batch_size,input_dimension,output_dimension):
+        source=self.generate_source(batch_size,input_dimension,output_dimension)
+        path=self.path(source)
+        if os.path.exists(os.path.join(path,"metadata.json")):
+            return path
+        os.makedirs(self.cache_base,exist_ok=True)
+        build=tempfile.mkdtemp(dir=self.cache_base)
+        try:
+            with open(os.path.join(build,"root.zok"),"w") as f:
+                f.write(source)
+            zokrates="zokrates"
+            commands=[
+                [zokrates,"compile","-i","root.zok","-o","out","-s","abi.json","--allow-unconstrained-variables"],
+                [zokrates,"setup","-i","out","-p","proving.key","-v","verification.key"],
+                [zokrates,"export-verifier","-i","verification.key","-o","verifier.sol"],
+            ]
+            for command in commands:
+                g=subprocess.run(command,capture_output=True,cwd=build)
+                if g.returncode!=0:
+                    raise RuntimeError(f"{' '.join(command[:2])} failed for batch size {batch_size}: {g.stderr.decode()}")
+            metadata={"BatchSize":batch_size,"InputDimension":input_dimension,"OutputDimension":output_dimension,
+                      "SourceHash":os.path.basename(path),"VerifierContractAddress":None,"BatchVerifierContractAddress":None}
+            with open(os.path.join(build,"metadata.json"),"w") as f:
+                json.dump(metadata,f)
+            os.rename(build,path)
+        except OSError:
+            # another process finished the same shape first
+            shutil.rmtree(build,ignore_errors=True)
+            if not os.path.exists(os.path.join(path,"metadata.json")):
+                raise
+        except Exception:
+            shutil.rmtree(build,ignore_errors=True)
+            raise
+        return path
+
+    def read_metadata(self,path):
+        with open(os.path.join(path,"metadata.json"),"r") as f:
+            return json.load(f)
+
+    # addresses of the Verifier and BatchVerifier deployed from this directory's verifier.sol
+    def record_verifier_address(self,path,address,batch_address=None):
+        metadata=self.read_metadata(path)
+        metadata["VerifierContractAddress"]=address
+        if batch_address is not None:
+            metadata["BatchVerifierContractAddress"]=batch_address
+        with open(os.path.join(path,"metadata.json"),"w") as f:
+            json.dump(metadata,f)
+
+    # a verifier of another shape rejects every proof, so a missing address is an error
+    def verifier_address(self,path,key="VerifierContractAddress"):
+        address=self.read_metadata(path).get(key)
+        if address is None:
+            raise RuntimeError(f"No {key} is recorded for the circuit in {path}, deploy its verifier.sol and record "
+                               f"the address with python -m Devices.MiddleWare.CircuitArtifacts")
+        return address
+
+
+class Circuit:
+    def __init__(self,base,zok_path,verifier_address,batch_verifier_address):
+        self.base=base
+        self.zok_path=zok_path
+        self.verifier_address=verifier_address
+        self.batch_verifier_address=batch_verifier_address
+
+
+circuit=None
+circuit_lock=threading.Lock()
+
+# the circuit of the configured shape, resolved once per process. Without CircuitCache the
+# hand compiled artifacts in VerificationBase are used as before.
+def get_circuit(config_file):
+    global circuit
+    with circuit_lock:
+        if circuit is None:
+            if config_file["DEFAULT"]["CircuitCache"]:
+                artifacts=CircuitArtifacts(config_file)
+                path=artifacts.ensure(config_file["DEFAULT"]["BatchSize"],config_file["DEFAULT"]["InputDimension"],config_file["DEFAULT"]["OutputDimension"])
+                # the batch verifier is only used by UpdateMode aggregated
+                batch_verifier_address=None
+                if config_file["DEFAULT"]["UpdateMode"]=="aggregated":
+                    batch_verifier_address=artifacts.verifier_address(path,"BatchVerifierContractAddress")
+                circuit=Circuit(os.path.join(path,""),os.path.join(path,"root.zok"),artifacts.verifier_address(path),batch_verifier_address)
+            else:
+                circuit=Circuit(config_file["DEFAULT"]["VerificationBase"],config_file["DEFAULT"]["ZokratesPath"],
+                                config_file["DEFAULT"]["VerifierContractAddress"],config_file["DEFAULT"]["BatchVerifierContractAddress"])
+        return circuit
+
+
+# compiles the circuit of the configured shape if needed and records the addresses of the
+# Verifier and BatchVerifier deployed from its verifier.sol
+if __name__ == '__main__':
+    from Devices.utils.utils import read_yaml
+    parser=argparse.ArgumentParser(description="Record the verifier contracts of the configured circuit shape")
+    parser.add_argument("--config",default="CONFIG.yaml")
+    parser.add_argument("--verifier",required=True,help="address of the Verifier deployed from the shape's verifier.sol")
+    parser.add_argument("--batch-verifier",default=None,help="address of the BatchVerifier deployed with the same verifier.sol")
+    args=parser.parse_args()
+    config_file=read_yaml(args.config)
+    artifacts=CircuitArtifacts(config_file)
+    path=artifacts.ensure(config_file["DEFAULT"]["BatchSize"],config_file["DEFAULT"]["InputDimension"],config_file["DEFAULT"]["OutputDimension"])
+    artifacts.record_verifier_address(path,args.verifier,args.batch_verifier)
+    print(f"Recorded the verifiers of {path}")
@@ -0,0 +1,68 @@
+import threading
+
+import numpy as np
+
+# order of the scalar field of BN254, the field ZoKrates circuits are compiled for
+FIELD_MODULUS = 21888242871839275222246405745257275088548364400416034343698204186575808495617
+
+
+class FieldEncoded:
+    # signed integers as (field element, sign bit) pairs in the convention of root.zok:
+    # negative values are stored as FIELD_MODULUS + m and the sign bit is 1 for m <= 0.
+    # Only the int64 magnitudes and the sign mask are kept, the field elements are
+    # turned into decimal strings when the witness is encoded.
+    def __init__(self, m):
+        m = np.asarray(m, dtype=np.int64)
+        self.magnitude = np.abs(m)
+        self.negative = m <= 0
+        self.shape = m.shape
+
+    @property
+    def sign(self):
+        return self.negative.astype(np.int8)
+
+    def field_elements(self):
+        elements = self.magnitude.astype(object)
+        negative = self.negative & (self.magnitude > 0)
+        elements[negative] = FIELD_MODULUS - elements[negative]
+        return elements
+
+    def decimal_strings(self):
+        # only negative entries need python big ints, the rest is formatted straight from int64
+        strings = self.magnitude.astype(str).astype(object)
+        negative = self.negative & (self.magnitude > 0)
+        strings[negative] = [str(FIELD_MODULUS - int(value)) for value in self.magnitude[negative]]
+        return strings
+
+
+# inverse of FieldEncoded.field_elements for values read back from public inputs,
+# which may also be given as hex or decimal strings
+def decode_field_elements(values):
+    shape = np.shape(values)
+    values = np.asarray([int(value, 0) if isinstance(value, str) else int(value) for value in np.ravel(values)], dtype=object)
+    decoded = np.where(values > FIELD_MODULUS // 2, values - FIELD_MODULUS, values)
+    return decoded.astype(np.int64).reshape(shape)
+
+
+class EncodingCache:
+    # keeps the encoding of the latest key, used for the global model that is the same for
+    # every device of a round
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.key = None
+        self.value = None
+
+    def get(self, key, encode):
+        with self.lock:
+            if self.value is None or self.key != key:
+                self.value = encode()
+                self.key = key
+            return self.value
+
+    def clear(self):
+        with self.lock:
+            self.key = None
+            self.value = None
+
+
+global_model_encodings = EncodingCache()
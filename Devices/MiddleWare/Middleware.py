@@ -12,80 +12,161 @@ from sklearn.metrics import classification_report, accuracy_score
 import pandas as pd
 
 from Devices.Analytics.Analytics import Analytics
+from Devices.Analytics.Tracing import tracer
+from Devices.MessageBroker.Codec import decode_message
 from Devices.MessageBroker.Consumer import Consumer
 from Devices.MiddleWare.BlockChainClient import BlockChainConnection
+from Devices.MiddleWare.CircuitArtifacts import get_circuit
+from Devices.MiddleWare.FieldEncoding import FieldEncoded, global_model_encodings
 from Devices.MiddleWare.NeuralNet import Network, FCLayer, mse_prime, mse
+from Devices.MiddleWare.Prover import get_prover
+from Devices.MiddleWare.Witness import parse_main_signature, check_args
+from Devices.MiddleWare.SampleBuffer import SampleBuffer
+from Devices.MiddleWare.TestSet import get_test_set
 from Devices.utils.utils import read_yaml
 
 
 def print_report(device,model,X_test,y_test):
     print(f"{device}",classification_report(y_test,model.predict(X_test),zero_division=0))
 
+
+# witness arguments of root.zok for the update from (w,b) to (w_new,b_new), checked against the
+# signature of the circuit
+def proof_args(config_file,signature,round,precision,w,b,w_new,b_new,x_train,y_train,learning_rate):
+    x_train=x_train*precision
+    b_new=b_new.reshape(config_file["DEFAULT"]["OutputDimension"],)
+    x_train = x_train.astype(int)
+
+    # the global model is the same for every device of a round and only encoded once
+    weights, bias = global_model_encodings.get(round,lambda: (FieldEncoded(w),FieldEncoded(b)))
+    weights_new = FieldEncoded(w_new)
+    bias_new = FieldEncoded(b_new)
+    x = FieldEncoded(x_train)
+    args = [weights, weights.sign, bias, bias.sign, x, x.sign, y_train, learning_rate, precision,
+            weights_new, bias_new]
+    check_args(args,signature)
+    return args
+
+
+def record_proof_job(analytics,job):
+    # the prover reports durations, the spans are laid out from the moment the job was picked up
+    tracer.record("proof_queue",job.submitted,job.started)
+    tracer.record("witness",job.started,job.started+job.witness_time)
+    tracer.record("proof",job.started+job.witness_time,job.started+job.witness_time+job.proof_time)
+    analytics.add_round_proof_queue(job.round,job.queue_depth,job.wait_time)
+    analytics.add_round_witness_time(job.round,job.witness_time)
+    analytics.add_round_generate_proof_time(job.round,job.proof_time)
+
+
+# The round bookkeeping below is shared by MiddleWare and AsyncMiddleWare, they only differ in
+# how they wait for the chain, the samples and the prover.
+
+
+# sets the global model and the constants read for the round
+def prepare_round(model,global_weights,global_bias,learning_rate,precision):
+    model.set_precision(precision=precision)
+    model.set_learning_rate(learning_rate)
+    model.set_weights(global_weights)
+    model.set_bias(global_bias)
+
+
+# trains on the received batch and evaluates the new model, returns its weights and bias
+def train_round(model,analytics,deviceName,round):
+    tt=time.perf_counter()
+    model.process_Batch()
+    analytics.add_round_training_local_time(round,time.perf_counter()-tt)
+    with tracer.span("evaluate"):
+        score,report=model.evaluate_model()
+    print(f"{deviceName}:Score :",score)
+    analytics.add_round_score(round,score)
+    analytics.add_round_classification_report(round,report)
+    return model.get_weights(),model.get_bias()
+
+
+# With a quorum the round can end while an update is still being trained or proven. Such an update
+# is not sent, the contract would revert it as round_ended, as it does for an update that is mined
+# after its round ended.
+def drop_late_update(analytics,deviceName,r,current_round):
+    if current_round==r:
+        return False
+    print(f"{deviceName}: Round {r} ended before its update was sent, dropping it")
+    analytics.add_round_transaction(r,"update",None,"dropped_late")
+    return True
+
+
+def record_update(analytics,r,seconds,transaction,gas):
+    analytics.add_round_update_blockchain_time(r,seconds)
+    if transaction is not None:
+        analytics.add_round_transaction(r,transaction.function,transaction.latency,transaction.status)
+    analytics.add_round_gas(r,gas)
+
+
+def record_round(analytics,round,t):
+    analytics.add_round_time(round,time.perf_counter()-t)
+    tracer.record("round",t,time.perf_counter())
+
+
 class FederatedLearningModel:
 
     def __init__(self,config_file,deviceName):
         self.deviceName=deviceName
         self.config =config_file
-        self.consumer = Consumer()
         self.scaler = StandardScaler()
         self.net = Network(self.config["DEFAULT"]["OutputDimension"],self.config["DEFAULT"]["InputDimension"],self.config["DEFAULT"]["Precision"] )
         self.net.add(FCLayer(self.config["DEFAULT"]["InputDimension"], self.config["DEFAULT"]["OutputDimension"]))
         self.epochs=self.config["DEFAULT"]["Epochs"]
+        # proofs are only valid for the per-sample SGD replayed by root.zok
+        self.bit_exact=self.config["DEFAULT"]["BitExactTraining"] or self.config["DEFAULT"]["PerformProof"]
         self.net.use(mse, mse_prime)
         self.learning_rate=None
-        self.curr_batch=None
+        self.curr_batch=SampleBuffer(self.config["DEFAULT"]["SampleBufferCapacity"],self.config["DEFAULT"]["InputDimension"],policy=self.config["DEFAULT"]["SampleRetentionPolicy"])
+        print(f"{self.deviceName}: Sample buffer holds {self.curr_batch.capacity} samples using {self.curr_batch.nbytes()} bytes")
+        self.batch_ready=threading.Condition()
         self.batchSize=None
         self.x_train=None
         self.y_train=None
-        datasource = self.config["DEFAULT"]["TestFilePath"]
-        testdata = pd.read_csv(
-            datasource, names=
-            ["T_xacc", "T_yacc", "T_zacc", "T_xgyro", "T_ygyro", "T_zgyro", "T_xmag", "T_ymag", "T_zmag",
-             "RA_xacc", "RA_yacc", "RA_zacc", "RA_xgyro", "RA_ygyro", "RA_zgyro", "RA_xmag", "RA_ymag", "RA_zmag",
-             "LA_xacc", "LA_yacc", "LA_zacc", "LA_xgyro", "LA_ygyro", "LA_zgyro", "LA_xmag", "LA_ymag", "LA_zmag",
-             "RL_xacc", "RL_yacc", "RL_zacc", "RL_xgyro", "RL_ygyro", "RL_zgyro", "RL_xmag", "RL_ymag", "RL_zmag",
-             "LL_xacc", "LL_yacc", "LL_zacc", "LL_xgyro", "LL_ygyro", "LL_zgyro", "LL_xmag", "LL_ymag", "LL_zmag",
-             "Activity"]
-
-        )
-        testdata.fillna(inplace=True, method='backfill')
-        testdata.dropna(inplace=True)
-        testdata.drop(columns= ["T_xacc", "T_yacc", "T_zacc", "T_xgyro","T_ygyro","T_zgyro","T_xmag", "T_ymag", "T_zmag","RA_xacc", "RA_yacc", "RA_zacc", "RA_xgyro","RA_ygyro","RA_zgyro","RA_xmag", "RA_ymag", "RA_zmag","RL_xacc", "RL_yacc", "RL_zacc", "RL_xgyro","RL_ygyro","RL_zgyro" ,"RL_xmag", "RL_ymag", "RL_zmag","LL_xacc", "LL_yacc", "LL_zacc", "LL_xgyro","LL_ygyro","LL_zgyro" ,"LL_xmag", "LL_ymag", "LL_zmag"],inplace=True)
-        activity_mapping = self.config["DEFAULT"]["ActivityMappings"]
-        filtered_activities = self.config["DEFAULT"]["Activities"]
-        activity_encoding = self.config["DEFAULT"]["ActivityEncoding"]
-        for key in activity_mapping.keys():
-            testdata.loc[testdata['Activity'] == key,'Activity'] = activity_mapping[key]
-        testdata = testdata[testdata['Activity'].isin(filtered_activities)]
-        for key in activity_encoding.keys():
-            testdata.loc[testdata['Activity'] == key, 'Activity'] = activity_encoding[key]
-        self.x_test = testdata.drop(columns="Activity")
-        self.y_test = testdata["Activity"]
+        self.scaler_fitted=False
+        self.x_test_quantized=None
+        # the test set is read once per process and shared by its devices
+        self.x_test,self.y_test=get_test_set(self.config)
+
+    def fit_scaler(self):
+        if not self.scaler_fitted:
+            self.scaler.fit(self.x_test)
+            self.scaler_fitted=True
+            self.x_test_quantized=None
+
+    def get_quantized_test_set(self):
+        # the scaled integer test matrix only depends on the scaler and the precision
+        if self.x_test_quantized is None:
+            x_test=self.scaler.transform(self.x_test)
+            self.x_test_quantized=(x_test*self.net.precision).astype(int)
+        return self.x_test_quantized
+
+    def evaluate_model(self):
+        pred=self.net.predict_quantized(self.get_quantized_test_set())
+        score=accuracy_score(self.y_test,pred)
+        report=classification_report(self.y_test,pred,zero_division=0,output_dict=True)
+        return score,report
 
     def test_model(self):
-        x_test=self.scaler.transform(self.x_test.to_numpy())
-        pred=self.net.predict(x_test)
-        return accuracy_score(self.y_test,self.net.predict(x_test))
+        return self.evaluate_model()[0]
 
     def get_classification_report(self):
-        x_test=self.scaler.transform(self.x_test.to_numpy())
-        return classification_report(self.y_test,self.net.predict(x_test),zero_division=0,output_dict=True)
+        return self.evaluate_model()[1]
 
     def process_Batch(self):
-        self.curr_batch.dropna(inplace=True)
-        batch=self.curr_batch.sample(self.batchSize)
-        self.x_train = batch.drop(columns=self.config["DEFAULT"]["ResponseVariable"])
-        self.y_train = batch[self.config["DEFAULT"]["ResponseVariable"]]
-        self.x_train = self.x_train.to_numpy()
-        self.y_train = self.y_train.to_numpy()
-        self.scaler.fit(self.x_test.to_numpy())
-        self.x_train=self.scaler.transform(self.x_train)
-        self.net.fit(self.x_train, self.y_train, epochs=self.epochs, learning_rate=self.learning_rate)
-        score=self.test_model()
-        print(f"{self.deviceName}:Score :",score)
+        with self.batch_ready:
+            self.x_train,self.y_train=self.curr_batch.sample(self.batchSize)
+        with tracer.span("scaling"):
+            self.fit_scaler()
+            self.x_train=self.scaler.transform(self.x_train)
+        with tracer.span("fit"):
+            self.net.fit(self.x_train, self.y_train, epochs=self.epochs, learning_rate=self.learning_rate,bit_exact=self.bit_exact)
 
     def reset_batch(self):
-        self.curr_batch=None
+        with self.batch_ready:
+            self.curr_batch.clear()
         self.x_train=None
         self.y_train=None
 
@@ -108,81 +189,56 @@ class FederatedLearningModel:
         self.batchSize=batchSize
 
     def set_precision(self,precision):
+        if precision!=self.net.precision:
+            self.x_test_quantized=None
         self.net.set_precision(precision)
 
-    def add_data_to_current_batch(self,data):
-        if self.curr_batch is None:
-            self.curr_batch = data
-        else:
-            self.curr_batch=pd.concat([self.curr_batch,data])
+    def add_data_to_current_batch(self,x,y):
+        with self.batch_ready:
+            self.curr_batch.add(x,y)
+            self.batch_ready.notify_all()
+
+    # a batch larger than the sample buffer could never be filled
+    def batch_available(self,batchSize):
+        if batchSize>self.curr_batch.capacity:
+            raise ValueError(f"{self.deviceName}: BatchSize {batchSize} of the contract exceeds SampleBufferCapacity {self.curr_batch.capacity}")
+        return len(self.curr_batch) >= batchSize
+
+    # blocks until batchSize samples were received or the timeout ran out
+    def wait_for_batch(self,batchSize,timeout=None):
+        with self.batch_ready:
+            return self.batch_ready.wait_for(lambda: self.batch_available(batchSize),timeout=timeout)
 
 
 
 class MiddleWare:
 
-    def __init__(self,blockchain_connection,deviceName,accountNR,configFile):
+    def __init__(self,blockchain_connection,deviceName,accountNR,configFile,connection_manager=None,aggregator=None):
         self.accountNR=accountNR
+        self.aggregator=aggregator
         self.consumer_thread=None
         self.analytics=Analytics(deviceName=deviceName,config_file=configFile)
         self.blockChainConnection=blockchain_connection
         self.deviceName=deviceName
         self.model=FederatedLearningModel(config_file=configFile,deviceName=self.deviceName)
         self.config = configFile
-        self.consumer = Consumer()
+        self.consumer = Consumer(connection_manager=connection_manager)
         self.__init_Consumer(deviceName,callback)
         self.proof=None
+        # the circuit is only compiled and set up when proofs are generated, see start_Middleware
+        self.prover=None
+        self.signature=None
         self.precision=None
         self.batchSize=None
         self.round=0
 
     def __generate_Proof(self,w,b,w_new,b_new,x_train,y_train,learning_rate):
-        x_train=x_train*self.precision
-        b_new=b_new.reshape(self.config["DEFAULT"]["OutputDimension"],)
-        x_train = x_train.astype(int)
-        def args_parser(args):
-            res = ""
-            for arg in range(len(args)):
-                entry = args[arg]
-                if isinstance(entry, (list, np.ndarray)):
-                    for i in range(len(entry)):
-                        row_i = entry[i]
-                        if isinstance(row_i, (list, np.ndarray)):
-                            for j in range(len(row_i)):
-                                val = row_i[j]
-                                res += str(val) + " "
-                        else:
-                            res += str(row_i) + " "
-                else:
-                    res += str(args[arg]) + " "
-            res = res[:-1]
-            return res
-
-        def convert_matrix(m):
-            max_field = 21888242871839275222246405745257275088548364400416034343698204186575808495617
-            m=np.array(m)
-            return np.where(m < 0, max_field + m, m), np.where(m > 0, 0, 1)
-
-        zokrates = "zokrates"
-        verification_base=self.config["DEFAULT"]["VerificationBase"]
-        weights, weights_sign = convert_matrix(w)
-        bias, bias_sign = convert_matrix(b)
-        weights_new, _ = convert_matrix(w_new)
-        bias_new, _ = convert_matrix(b_new)
-        x, x_sign = convert_matrix(x_train)
-        args = [weights, weights_sign, bias, bias_sign, x, x_sign, y_train, learning_rate, self.precision,
-                weights_new, bias_new]
-        out_path=verification_base+"out"
-        abi_path=verification_base+"abi.json"
-        witness_path=verification_base+"witness_"+self.deviceName
-        zokrates_compute_witness = [zokrates, "compute-witness", "-o",witness_path,'-i',out_path,'-s',abi_path,"-a"]
-        zokrates_compute_witness.extend(args_parser(args).split(" "))
-        g = subprocess.run(zokrates_compute_witness, capture_output=True)
-        proof_path=verification_base+"proof_"+self.deviceName
-        proving_key_path=verification_base+"proving.key"
-        zokrates_generate_proof = [zokrates, "generate-proof",'-w',witness_path,'-p',proving_key_path,'-i',out_path,'-j',proof_path]
-        g = subprocess.run(zokrates_generate_proof, capture_output=True)
-        with open(proof_path,'r+') as f:
-            self.proof=json.load(f)
+        if self.signature is None:
+            self.signature=parse_main_signature(get_circuit(self.config).zok_path)
+        args=proof_args(self.config,self.signature,self.round,self.precision,w,b,w_new,b_new,x_train,y_train,learning_rate)
+        job=self.prover.prove(args,self.deviceName,self.round)
+        self.proof=job.proof
+        record_proof_job(self.analytics,job)
 
 
     def __init_Consumer(self,DeviceName,callBackFunction):
@@ -195,55 +251,78 @@ class MiddleWare:
         self.consumer_thread=threading.Thread(target=self.consumer.start_consuming)
         self.consumer_thread.start()
 
+    # runs on its own thread while the device already waits for the next round, so everything is
+    # attributed to the round r the update belongs to
     def update(self,w,b,p,r,balance):
-        tu = time.time()
-        self.blockChainConnection.update(w, b, self.accountNR, p)
-        self.analytics.add_round_update_blockchain_time(r, time.time() - tu)
-        self.analytics.add_round_gas(self.round,balance - self.blockChainConnection.get_account_balance(self.accountNR))
+        if drop_late_update(self.analytics,self.deviceName,r,self.blockChainConnection.get_RoundNumber(self.accountNR)):
+            return
+        if self.aggregator is not None and p is not None:
+            # the aggregator submits the proofs of all devices of the round with one transaction,
+            # the signature binds the proof to this device
+            self.aggregator.submit(r,self.accountNR,p,self.blockChainConnection.sign_update(r,p,self.accountNR))
+            return
+        with tracer.context(self.deviceName,r):
+            tu = time.perf_counter()
+            with tracer.span("update"):
+                transaction=self.blockChainConnection.update(w, b, self.accountNR, r, p)
+            record_update(self.analytics,r,time.perf_counter()-tu,transaction,balance-self.blockChainConnection.get_account_balance(self.accountNR))
 
     def start_Middleware(self):
         self.__start_Consuming()
-        self.blockChainConnection.init_contract(self.accountNR)
+        verifier_address=self.config["DEFAULT"]["VerifierContractAddress"]
+        batch_verifier_address=None
+        if self.config["DEFAULT"]["PerformProof"]:
+            # compiles the circuit of the configured batch size unless it is cached already
+            circuit=get_circuit(self.config)
+            verifier_address=circuit.verifier_address
+            batch_verifier_address=circuit.batch_verifier_address
+            self.prover=get_prover(self.config)
+        self.blockChainConnection.init_contract(self.accountNR,verifier_address,batch_verifier_address)
         self.round=self.blockChainConnection.get_RoundNumber(self.accountNR)
+        # with RoundDetection "events" one watcher per connection follows the rounds and ends them
+        events=self.config["DEFAULT"]["RoundDetection"]=="events"
+        if events:
+            self.blockChainConnection.start_round_watcher(self.accountNR)
+        last_round=0
         while self.config["DEFAULT"]["Rounds"]>self.round:
-            outstanding_update=self.blockChainConnection.roundUpdateOutstanding(self.accountNR)
-            self.round = self.blockChainConnection.get_RoundNumber(self.accountNR)
+            if events:
+                new_round=self.blockChainConnection.wait_for_round(last_round,timeout=self.config["DEFAULT"]["WaitingTime"])
+                outstanding_update=new_round is not None
+                if outstanding_update:
+                    self.round=new_round
+            else:
+                outstanding_update=self.blockChainConnection.roundUpdateOutstanding(self.accountNR)
+                self.round = self.blockChainConnection.get_RoundNumber(self.accountNR)
             print(f"{self.deviceName}: Round {self.round} Has update outstanding: ",outstanding_update)
             if(outstanding_update):
-                t=time.time()
-                balance=self.blockChainConnection.get_account_balance(self.accountNR)
-                global_weights=self.blockChainConnection.get_globalWeights(self.accountNR)
-                global_bias=self.blockChainConnection.get_globalBias(self.accountNR)
-                lr=self.blockChainConnection.get_LearningRate(self.accountNR)
-                self.precision=self.blockChainConnection.get_Precision(self.accountNR)
-                self.model.set_precision(precision=self.precision)
-                self.model.set_learning_rate(lr)
-                self.model.set_weights(global_weights)
-                self.model.set_bias(global_bias)
-                self.batchSize=self.blockChainConnection.get_BatchSize(self.accountNR)
-                while(self.model.curr_batch is None):
-                    pass
-                while(self.model.curr_batch.size < self.batchSize):
-                    pass
-                self.model.set_batchSize(self.batchSize)
-                tt=time.time()
-                self.model.process_Batch()
-                self.analytics.add_round_training_local_time(self.round,time.time()-tt)
-                self.analytics.add_round_score(self.round,self.model.test_model())
-                self.analytics.add_round_classification_report(self.round,self.model.get_classification_report())
-                w=self.model.get_weights()
-                b=self.model.get_bias()
-                if self.config["DEFAULT"]["PerformProof"]:
-                    tp=time.time()
-                    self.__generate_Proof(global_weights,global_bias,w,b,self.model.x_train,self.model.y_train,lr)
-                    self.analytics.add_round_proof_times(self.round, time.time() - tp)
-                self.model.reset_batch()
-                thread=threading.Thread(target=self.update,args=[w,b,self.proof,self.round,balance])
-                thread.start()
-                print(f"{self.deviceName}:Round {self.round} update took {time.time()-t} seconds")
-                self.round+=1
-                self.analytics.add_round_time(self.round,time.time()-t)
-            time.sleep(self.config["DEFAULT"]["WaitingTime"])
+                with tracer.context(self.deviceName,self.round):
+                    t=time.perf_counter()
+                    with tracer.span("rpc_read"):
+                        balance,global_weights,global_bias=self.blockChainConnection.get_round_state(self.accountNR,self.round)
+                        lr=self.blockChainConnection.get_LearningRate(self.accountNR)
+                        self.precision=self.blockChainConnection.get_Precision(self.accountNR)
+                        self.batchSize=self.blockChainConnection.get_BatchSize(self.accountNR)
+                    prepare_round(self.model,global_weights,global_bias,lr,self.precision)
+                    tw=time.perf_counter()
+                    with tracer.span("data_wait"):
+                        while not self.model.wait_for_batch(self.batchSize,timeout=self.config["DEFAULT"]["WaitingTime"]):
+                            print(f"{self.deviceName}: Waiting for {self.batchSize} samples")
+                    self.analytics.add_round_data_wait_time(self.round,time.perf_counter()-tw)
+                    self.model.set_batchSize(self.batchSize)
+                    w,b=train_round(self.model,self.analytics,self.deviceName,self.round)
+                    if self.config["DEFAULT"]["PerformProof"]:
+                        tp=time.perf_counter()
+                        self.__generate_Proof(global_weights,global_bias,w,b,self.model.x_train,self.model.y_train,lr)
+                        self.analytics.add_round_proof_times(self.round, time.perf_counter() - tp)
+                    self.model.reset_batch()
+                    thread=threading.Thread(target=self.update,args=[w,b,self.proof,self.round,balance])
+                    thread.start()
+                    print(f"{self.deviceName}:Round {self.round} update took {time.perf_counter()-t} seconds")
+                    last_round=self.round
+                    self.round+=1
+                    record_round(self.analytics,self.round,t)
+            if not events:
+                time.sleep(self.config["DEFAULT"]["WaitingTime"])
             #self.__sleep_call(10)
         self.analytics.write_data()
 
@@ -259,7 +338,7 @@ class MiddleWare:
 def callback(ch, method, properties, body,args):
     model=args
     if isinstance(model,FederatedLearningModel):
-        batch=pd.read_csv(io.BytesIO(body),header=0,index_col=0)
-        model.add_data_to_current_batch(batch)
+        x,y=decode_message(properties,body)
+        model.add_data_to_current_batch(x,y)
 
 
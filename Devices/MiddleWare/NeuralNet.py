@@ -33,6 +33,14 @@ class Layer:
     def backward_propagation(self, output_error, learning_rate):
         raise NotImplementedError
 
+    # computes the outputs for a whole (batch, input_size) matrix
+    def forward_propagation_batch(self, input):
+        raise NotImplementedError
+
+    # computes dE/dX for a whole (batch, output_size) error matrix (and update parameters if any)
+    def backward_propagation_batch(self, output_error, learning_rate):
+        raise NotImplementedError
+
     def set_precision(self,precision):
         self.precision=precision
 
@@ -81,6 +89,26 @@ class FCLayer(Layer):
         self.bias -= (output_error/learning_rate).astype(int)
         return input_error
 
+    def forward_propagation_batch(self, input_data):
+        self.input = input_data
+        self.output = np.dot(self.input, self.weights)/self.precision + self.bias
+        self.output=self.output.astype(int)
+        return self.output
+
+    # gradients of the batch are accumulated (not averaged) so one batched step moves
+    # the parameters about as far as the per-sample loop does over the same batch
+    def backward_propagation_batch(self, output_error, learning_rate):
+        input_error = np.dot(output_error, self.weights.T)/self.precision
+        input_error=input_error.astype(int)
+        weights_error = np.dot(self.input.T, output_error)/self.precision
+        weights_error=weights_error.astype(int)
+        bias_error = np.sum(output_error,axis=0).reshape(1,-1)
+
+        # update parameters
+        self.weights -= (weights_error/learning_rate).astype(int)
+        self.bias -= (bias_error/learning_rate).astype(int)
+        return input_error
+
 class ActivationLayer(Layer):
     def __init__(self, activation, activation_prime):
         self.activation = activation
@@ -97,6 +125,12 @@ class ActivationLayer(Layer):
     def backward_propagation(self, output_error, learning_rate):
         return self.activation_prime(self.input) * output_error
 
+    def forward_propagation_batch(self, input_data):
+        return self.forward_propagation(input_data)
+
+    def backward_propagation_batch(self, output_error, learning_rate):
+        return self.backward_propagation(output_error, learning_rate)
+
 
 class Network:
     def __init__(self,outputdimension,inputdimension,precision):
@@ -124,20 +158,16 @@ class Network:
 
     # predict output for given input
     def predict(self, input_data):
-        # sample dimension first
-        samples = len(input_data)
         input_data = input_data*self.precision
         input_data=input_data.astype(int)
-        result = []
-        # run network over all samples
-        for i in range(samples):
-            # forward propagation
-            output = input_data[i]
-            for layer in self.layers:
-                output = layer.forward_propagation(output)
-            output=np.argmax(output)+1
-            result.append(output)
-        return result
+        return self.predict_quantized(input_data)
+
+    # predict output for an input that is already scaled by the precision and cast to int
+    def predict_quantized(self, input_data):
+        output = input_data
+        for layer in self.layers:
+            output = layer.forward_propagation_batch(output)
+        return np.argmax(output,axis=1)+1
 
     def set_weights(self,weights):
         for layer in self.layers:
@@ -164,25 +194,37 @@ class Network:
         for layer in self.layers:
             if isinstance(layer, FCLayer):
                 return layer.set_precision(precision)
+    def one_hot(self, y_train):
+        y_true=np.zeros((len(y_train),self.output_dimension))
+        y_true[np.arange(len(y_train)),np.asarray(y_train).astype(int)-1]=self.precision
+        return y_true
+
     # train the network
-    def fit(self, x_train, y_train, epochs, learning_rate):
+    # bit_exact=True replays the per-sample SGD of root.zok sample by sample so the resulting
+    # integer weights can be proven, otherwise the whole batch is processed in one step per epoch
+    def fit(self, x_train, y_train, epochs, learning_rate, bit_exact=False):
+        if bit_exact:
+            self.fit_sequential(x_train, y_train, epochs, learning_rate)
+        else:
+            self.fit_batch(x_train, y_train, epochs, learning_rate)
+
+    def fit_sequential(self, x_train, y_train, epochs, learning_rate):
         # sample dimension first
         samples = len(x_train)
+        x_scaled = (x_train*self.precision).astype(int)
+        y_true = self.one_hot(y_train)
         # training loop
         for i in range(epochs):
             err = 0
             for j in range(samples):
                 # forward propagation
-                output = x_train[j]*self.precision
-                output=output.astype(int)
-                y_true=np.zeros(self.output_dimension)
-                y_true[y_train[j]-1]=self.precision
+                output = x_scaled[j]
                 for layer in self.layers:
                     output = layer.forward_propagation(output)
                 # compute loss (for display purpose only)
-                err += self.loss(y_true, output,precision=self.precision)
+                err += self.loss(y_true[j], output,precision=self.precision)
                 # backward propagation
-                error = self.loss_prime(y_true, output).astype(int)
+                error = self.loss_prime(y_true[j], output).astype(int)
                 for layer in reversed(self.layers):
                     error = layer.backward_propagation(error, learning_rate)
 
@@ -190,3 +232,19 @@ class Network:
             err /= samples
             #print('epoch %d/%d   error=%f' % (i+1, epochs, err))
 
+    def fit_batch(self, x_train, y_train, epochs, learning_rate):
+        x_scaled = (x_train*self.precision).astype(int)
+        y_true = self.one_hot(y_train)
+        # training loop
+        for i in range(epochs):
+            # forward propagation
+            output = x_scaled
+            for layer in self.layers:
+                output = layer.forward_propagation_batch(output)
+            # compute loss (for display purpose only)
+            err = self.loss(y_true, output,precision=self.precision)
+            # backward propagation, mse_prime is taken per sample
+            error = (2*(output-y_true)/self.output_dimension).astype(int)
+            for layer in reversed(self.layers):
+                error = layer.backward_propagation_batch(error, learning_rate)
+            #print('epoch %d/%d   error=%f' % (i+1, epochs, err))
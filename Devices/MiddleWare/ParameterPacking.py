@@ -0,0 +1,32 @@
+import numpy as np
+
+# Layout of the model in FederatedModel: weights row by row followed by the bias, four int64
+# values per uint256 with value v in bits 64*(v%4) of word v//4. On a little endian buffer of
+# int64 values every 32 bytes are exactly one word.
+LANES = 4
+
+
+def pack_model(weights, bias):
+    values = np.concatenate([np.ravel(weights), np.ravel(bias)]).astype("<i8")
+    values = np.concatenate([values, np.zeros(-len(values) % LANES, dtype="<i8")])
+    words = values.tobytes()
+    return [int.from_bytes(words[i:i + 8 * LANES], "little") for i in range(0, len(words), 8 * LANES)]
+
+
+def unpack_model(packed, output_dimension, input_dimension):
+    words = b"".join(int(word).to_bytes(8 * LANES, "little") for word in packed)
+    values = np.frombuffer(words, dtype="<i8").astype(np.int64)
+    weights = values[:output_dimension * input_dimension].reshape(output_dimension, input_dimension)
+    bias = values[output_dimension * input_dimension:output_dimension * input_dimension + output_dimension]
+    return weights, bias
+
+
+# the packed words as 32 byte big endian values, the byte string FederatedModel hashes for a
+# model commitment and the format models are kept in the blob store
+def model_to_blob(weights, bias):
+    return b"".join(word.to_bytes(8 * LANES, "big") for word in pack_model(weights, bias))
+
+
+def model_from_blob(blob, output_dimension, input_dimension):
+    packed = [int.from_bytes(blob[i:i + 8 * LANES], "big") for i in range(0, len(blob), 8 * LANES)]
+    return unpack_model(packed, output_dimension, input_dimension)
@@ -0,0 +1,223 @@
+import itertools
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+
+from Devices.MiddleWare.CircuitArtifacts import get_circuit
+from Devices.MiddleWare.Witness import abi_args, encode_abi_json
+
+
+class SubprocessProver:
+    # runs zokrates compute-witness and generate-proof as fresh processes for every proof
+    def __init__(self,config_file,base=None):
+        self.config=config_file
+        self.verification_base=base or self.config["DEFAULT"]["VerificationBase"]
+
+    # witness and proof files of a device never collide with those of other devices
+    def scratch_dir(self,deviceName):
+        path=os.path.join(self.verification_base,"scratch",deviceName)
+        os.makedirs(path,exist_ok=True)
+        return path
+
+    def prove(self,args,deviceName):
+        zokrates = "zokrates"
+        out_path=self.verification_base+"out"
+        abi_path=self.verification_base+"abi.json"
+        scratch=self.scratch_dir(deviceName)
+        witness_path=os.path.join(scratch,"witness")
+        # arguments are streamed as abi json over stdin instead of argv to stay clear of ARG_MAX
+        zokrates_compute_witness = [zokrates, "compute-witness", "-o",witness_path,'-i',out_path,'-s',abi_path,"--abi","--stdin"]
+        tw=time.perf_counter()
+        g = subprocess.run(zokrates_compute_witness, input=encode_abi_json(args).encode(), capture_output=True, cwd=scratch)
+        witness_time=time.perf_counter()-tw
+        if g.returncode!=0:
+            raise RuntimeError(f"{deviceName}: zokrates compute-witness failed: {g.stderr.decode()}")
+        proof_path=os.path.join(scratch,"proof.json")
+        proving_key_path=self.verification_base+"proving.key"
+        zokrates_generate_proof = [zokrates, "generate-proof",'-w',witness_path,'-p',proving_key_path,'-i',out_path,'-j',proof_path]
+        tp=time.perf_counter()
+        g = subprocess.run(zokrates_generate_proof, capture_output=True, cwd=scratch)
+        proof_time=time.perf_counter()-tp
+        if g.returncode!=0:
+            raise RuntimeError(f"{deviceName}: zokrates generate-proof failed: {g.stderr.decode()}")
+        with open(proof_path,'r+') as f:
+            proof=json.load(f)
+        return proof,witness_time,proof_time
+
+    def close(self):
+        pass
+
+
+class WorkerProver:
+    # keeps one node process running proving_worker.js that reads the circuit and the proving key
+    # once and proves on threads worker threads. Requests and responses on its stdin/stdout carry
+    # an id, so any number of threads can prove through it at the same time. Falls back to the
+    # subprocess prover whenever the worker can not be started or fails.
+    def __init__(self,config_file,base=None,threads=1):
+        self.config=config_file
+        self.verification_base=base or self.config["DEFAULT"]["VerificationBase"]
+        self.threads=threads
+        self.fallback=SubprocessProver(config_file,base=base)
+        self.lock=threading.Lock()
+        self.process=None
+        self.request_id=0
+        # request id -> [event, response] of the requests sent to the running process
+        self.waiting={}
+
+    def __start(self):
+        worker=["node",self.config["DEFAULT"]["ProvingWorkerPath"],self.verification_base+"out",self.verification_base+"abi.json",self.verification_base+"proving.key",str(self.threads)]
+        self.process=subprocess.Popen(worker,stdin=subprocess.PIPE,stdout=subprocess.PIPE,text=True,bufsize=1)
+        # the first line is sent once the proving key is loaded
+        if not json.loads(self.process.stdout.readline()).get("ready"):
+            raise RuntimeError("Proving worker did not start")
+        self.waiting={}
+        threading.Thread(target=self.__read,args=[self.process,self.waiting],daemon=True).start()
+
+    # hands every response to the request waiting for it, fails the rest once the process exited
+    def __read(self,process,waiting):
+        for line in process.stdout:
+            response=json.loads(line)
+            with self.lock:
+                request=waiting.pop(response["id"],None)
+            if request is not None:
+                request[1]=response
+                request[0].set()
+        with self.lock:
+            requests=list(waiting.values())
+            waiting.clear()
+        for request in requests:
+            request[1]={"error":"Proving worker exited"}
+            request[0].set()
+
+    def __send(self,args):
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self.__start()
+            self.request_id+=1
+            request=[threading.Event(),None]
+            self.waiting[self.request_id]=request
+            self.process.stdin.write(json.dumps({"id":self.request_id,"args":abi_args(args)})+"\n")
+            self.process.stdin.flush()
+        return request
+
+    def prove(self,args,deviceName):
+        try:
+            request=self.__send(args)
+        except Exception as e:
+            print(f"{deviceName}: Proving worker failed ({e}), falling back to zokrates subprocess")
+            self.close()
+            return self.fallback.prove(args,deviceName)
+        request[0].wait()
+        response=request[1]
+        # a failed request leaves the worker running for the others, an exited one is restarted
+        if "error" in response:
+            print(f"{deviceName}: Proving worker failed ({response['error']}), falling back to zokrates subprocess")
+            return self.fallback.prove(args,deviceName)
+        return response["proof"],response["witness_time"],response["proof_time"]
+
+    def close(self):
+        with self.lock:
+            process,self.process=self.process,None
+        if process is not None:
+            process.kill()
+            process.wait()
+
+
+class ProofJob:
+    def __init__(self,args,deviceName,round):
+        self.args=args
+        self.deviceName=deviceName
+        self.round=round
+        # perf_counter values, the durations below are in seconds
+        self.submitted=time.perf_counter()
+        self.started=None
+        self.done=threading.Event()
+        self.queue_depth=None
+        self.wait_time=None
+        self.witness_time=None
+        self.proof_time=None
+        self.proof=None
+        self.error=None
+        self.lock=threading.Lock()
+        self.callbacks=[]
+
+    # calls callback(job) on the prover thread once the job is done, right away if it already is
+    def add_done_callback(self,callback):
+        with self.lock:
+            if not self.done.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def finish(self):
+        with self.lock:
+            self.done.set()
+            callbacks,self.callbacks=self.callbacks,[]
+        for callback in callbacks:
+            callback(self)
+
+
+class ProofScheduler:
+    # Bounded pool of dispatcher threads, jobs of older rounds are proven first. Threads are enough
+    # since witness and proof are computed in child processes, a dispatcher only waits for its
+    # zokrates process or for the node worker, so at most workers proofs use the cores at once.
+    # All dispatchers share one prover of the circuit, with ProvingBackend "worker" a single node
+    # process that reads the proving key once and proves on workers threads.
+    def __init__(self,config_file,workers=None,base=None):
+        self.config=config_file
+        self.jobs=queue.PriorityQueue()
+        self.sequence=itertools.count()
+        self.workers=workers or os.cpu_count()
+        if self.config["DEFAULT"]["ProvingBackend"]=="worker":
+            self.prover=WorkerProver(config_file,base=base,threads=self.workers)
+        else:
+            self.prover=SubprocessProver(config_file,base=base)
+        for i in range(self.workers):
+            threading.Thread(target=self.__work,daemon=True).start()
+
+    def queue_depth(self):
+        return self.jobs.qsize()
+
+    # queues the job and returns it right away, job.done is set once the proof is generated
+    def submit(self,args,deviceName,round):
+        job=ProofJob(args,deviceName,round)
+        job.queue_depth=self.jobs.qsize()
+        self.jobs.put((round,next(self.sequence),job))
+        return job
+
+    # blocks until the proof is generated and returns the finished job with its timings
+    def prove(self,args,deviceName,round):
+        job=self.submit(args,deviceName,round)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job
+
+    def __work(self):
+        while True:
+            _,_,job=self.jobs.get()
+            job.started=time.perf_counter()
+            job.wait_time=job.started-job.submitted
+            try:
+                job.proof,job.witness_time,job.proof_time=self.prover.prove(job.args,job.deviceName)
+            except Exception as e:
+                job.error=e
+            job.finish()
+
+    def close(self):
+        self.prover.close()
+
+
+scheduler=None
+scheduler_lock=threading.Lock()
+
+# one scheduler per process, shared by all devices, ProofWorkers=0 uses one prover per core
+def get_prover(config_file):
+    global scheduler
+    with scheduler_lock:
+        if scheduler is None:
+            scheduler=ProofScheduler(config_file,workers=config_file["DEFAULT"]["ProofWorkers"],base=get_circuit(config_file).base)
+        return scheduler
@@ -0,0 +1,61 @@
+import threading
+import time
+
+from Devices.Analytics.Analytics import Analytics
+from Devices.MiddleWare.BlockChainClient import quorum_reached
+
+
+class RoundCoordinator:
+    # RoundClosing "coordinator": the only component that ends rounds, the contract rejects
+    # end_update_round from every other account and the devices only follow the round state.
+    # Polls the progress of the round every BlockPollInterval and ends it once its update interval
+    # is over or RoundQuorum updates are in. Per round the gas and submit to receipt time of closing
+    # are recorded, round_time holds how long after the end of the update interval the round was
+    # closed, negative for rounds closed early by the quorum.
+    def __init__(self,blockchain_connection,config_file,accountNR=None):
+        self.config=config_file
+        self.blockChainConnection=blockchain_connection
+        self.accountNR=self.config["DEFAULT"]["CoordinatorAccount"] if accountNR is None else accountNR
+        self.analytics=Analytics(deviceName="Coordinator",config_file=config_file)
+        self.interval_ends={}
+        self.model_initialized=False
+        self.stopped=threading.Event()
+        self.thread=threading.Thread(target=self.__run,daemon=True)
+        self.thread.start()
+
+    def __run(self):
+        while not self.stopped.wait(self.config["DEFAULT"]["BlockPollInterval"]):
+            try:
+                self.__poll()
+            except Exception as e:
+                print(f"Coordinator: Polling round state failed: {e}")
+
+    def due(self,remaining,participants):
+        return remaining<=0 or quorum_reached(self.config,participants)
+
+    def __poll(self):
+        # until init_contract set the global model and the coordinator, any account could end rounds
+        if not self.model_initialized:
+            self.model_initialized=len(self.blockChainConnection.get_globalWeights(self.accountNR))>0
+            if not self.model_initialized:
+                return
+        round,remaining,participants=self.blockChainConnection.get_round_progress(self.accountNR)
+        interval_end=self.interval_ends.setdefault(round,time.time()+remaining)
+        if not self.due(remaining,participants):
+            return
+        t=time.time()
+        balance=self.blockChainConnection.get_account_balance(self.accountNR)
+        transaction=self.blockChainConnection.end_round(self.accountNR)
+        self.analytics.add_round_transaction(round,transaction.function,transaction.latency,transaction.status)
+        if transaction.status!="mined":
+            return
+        self.analytics.add_round_update_blockchain_time(round,time.time()-t)
+        self.analytics.add_round_gas(round,balance-self.blockChainConnection.get_account_balance(self.accountNR))
+        self.analytics.add_round_time(round,time.time()-interval_end)
+        self.interval_ends.pop(round,None)
+        print(f"Coordinator: Round {round} closed with {participants} updates using {transaction.receipt['gasUsed']} gas")
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.analytics.write_data()
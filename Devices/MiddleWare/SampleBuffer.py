@@ -0,0 +1,57 @@
+import numpy as np
+
+
+class SampleBuffer:
+    # fixed capacity store of (features, label) rows
+    # policy "newest" keeps the newest capacity rows, "reservoir" keeps a uniform sample of all rows seen
+    def __init__(self,capacity,n_features,policy="newest",seed=None):
+        if policy not in ("newest","reservoir"):
+            raise ValueError(f"Unknown retention policy {policy}")
+        self.capacity=capacity
+        self.n_features=n_features
+        self.policy=policy
+        self.features=np.zeros((capacity,n_features),dtype=np.float64)
+        self.labels=np.zeros(capacity,dtype=np.int64)
+        self.rng=np.random.default_rng(seed)
+        self.seen=0
+
+    def __len__(self):
+        return min(self.seen,self.capacity)
+
+    def nbytes(self):
+        return self.features.nbytes+self.labels.nbytes
+
+    def clear(self):
+        self.seen=0
+
+    def add(self,features,labels):
+        features=np.asarray(features,dtype=np.float64).reshape(-1,self.n_features)
+        labels=np.asarray(labels,dtype=np.int64).reshape(-1)
+        n=len(labels)
+        if self.policy=="newest":
+            # only the last capacity rows of the message can survive
+            if n>self.capacity:
+                features=features[-self.capacity:]
+                labels=labels[-self.capacity:]
+                self.seen+=n-self.capacity
+                n=self.capacity
+            idx=(self.seen+np.arange(n))%self.capacity
+            self.features[idx]=features
+            self.labels[idx]=labels
+            self.seen+=n
+        else:
+            free=max(0,min(n,self.capacity-self.seen))
+            self.features[self.seen:self.seen+free]=features[:free]
+            self.labels[self.seen:self.seen+free]=labels[:free]
+            self.seen+=free
+            for i in range(free,n):
+                j=self.rng.integers(0,self.seen+1)
+                if j<self.capacity:
+                    self.features[j]=features[i]
+                    self.labels[j]=labels[i]
+                self.seen+=1
+
+    # draws n distinct rows, returns copies so the buffer can keep filling
+    def sample(self,n):
+        idx=self.rng.choice(len(self),size=n,replace=False)
+        return self.features[idx],self.labels[idx]
@@ -0,0 +1,99 @@
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["T_xacc", "T_yacc", "T_zacc", "T_xgyro", "T_ygyro", "T_zgyro", "T_xmag", "T_ymag", "T_zmag",
+           "RA_xacc", "RA_yacc", "RA_zacc", "RA_xgyro", "RA_ygyro", "RA_zgyro", "RA_xmag", "RA_ymag", "RA_zmag",
+           "LA_xacc", "LA_yacc", "LA_zacc", "LA_xgyro", "LA_ygyro", "LA_zgyro", "LA_xmag", "LA_ymag", "LA_zmag",
+           "RL_xacc", "RL_yacc", "RL_zacc", "RL_xgyro", "RL_ygyro", "RL_zgyro", "RL_xmag", "RL_ymag", "RL_zmag",
+           "LL_xacc", "LL_yacc", "LL_zacc", "LL_xgyro", "LL_ygyro", "LL_zgyro", "LL_xmag", "LL_ymag", "LL_zmag",
+           "Activity"]
+
+DROPPED = ["T_xacc", "T_yacc", "T_zacc", "T_xgyro", "T_ygyro", "T_zgyro", "T_xmag", "T_ymag", "T_zmag",
+           "RA_xacc", "RA_yacc", "RA_zacc", "RA_xgyro", "RA_ygyro", "RA_zgyro", "RA_xmag", "RA_ymag", "RA_zmag",
+           "RL_xacc", "RL_yacc", "RL_zacc", "RL_xgyro", "RL_ygyro", "RL_zgyro", "RL_xmag", "RL_ymag", "RL_zmag",
+           "LL_xacc", "LL_yacc", "LL_zacc", "LL_xgyro", "LL_ygyro", "LL_zgyro", "LL_xmag", "LL_ymag", "LL_zmag"]
+
+
+# features and encoded labels of TestFilePath, the same preprocessing EdgeDevice applies to the training data
+def read_test_set(config_file):
+    testdata = pd.read_csv(config_file["DEFAULT"]["TestFilePath"], names=COLUMNS)
+    testdata.bfill(inplace=True)
+    testdata.dropna(inplace=True)
+    testdata.drop(columns=DROPPED, inplace=True)
+    activity_mapping = config_file["DEFAULT"]["ActivityMappings"]
+    filtered_activities = config_file["DEFAULT"]["Activities"]
+    activity_encoding = config_file["DEFAULT"]["ActivityEncoding"]
+    for key in activity_mapping.keys():
+        testdata.loc[testdata['Activity'] == key, 'Activity'] = activity_mapping[key]
+    testdata = testdata[testdata['Activity'].isin(filtered_activities)]
+    for key in activity_encoding.keys():
+        testdata.loc[testdata['Activity'] == key, 'Activity'] = activity_encoding[key]
+    x_test = testdata.drop(columns="Activity").to_numpy(dtype=np.float64)
+    y_test = testdata["Activity"].to_numpy(dtype=np.int64)
+    return x_test, y_test
+
+
+class SharedTestSet:
+    # The test set in two shared memory blocks, created once by the supervisor and attached
+    # read-only by every worker process instead of each device parsing the csv again
+    def __init__(self, blocks, arrays, owner):
+        self.blocks = blocks
+        self.arrays = arrays
+        self.owner = owner
+
+    @classmethod
+    def create(cls, x_test, y_test):
+        blocks, arrays = [], []
+        for array in (x_test, y_test):
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared[...] = array
+            blocks.append(block)
+            arrays.append(shared)
+        return cls(blocks, arrays, owner=True)
+
+    # what a worker needs to attach, small enough to pass as a process argument
+    def spec(self):
+        return [(block.name, array.shape, array.dtype.str) for block, array in zip(self.blocks, self.arrays)]
+
+    @classmethod
+    def attach(cls, spec):
+        blocks, arrays = [], []
+        for name, shape, dtype in spec:
+            block = shared_memory.SharedMemory(name=name)
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+            array.flags.writeable = False
+            blocks.append(block)
+            arrays.append(array)
+        return cls(blocks, arrays, owner=False)
+
+    def close(self):
+        self.arrays = []
+        for block in self.blocks:
+            block.close()
+            if self.owner:
+                block.unlink()
+
+
+test_sets = {}
+test_sets_lock = threading.Lock()
+
+
+# the test set of this process, read once per file and shared by all devices of the process
+def get_test_set(config_file):
+    path = config_file["DEFAULT"]["TestFilePath"]
+    with test_sets_lock:
+        if path not in test_sets:
+            test_sets[path] = read_test_set(config_file)
+        return test_sets[path]
+
+
+# makes get_test_set return the supervisor's shared copy instead of reading the file
+def use_shared_test_set(config_file, spec):
+    shared = SharedTestSet.attach(spec)
+    with test_sets_lock:
+        test_sets[config_file["DEFAULT"]["TestFilePath"]] = tuple(shared.arrays)
+    return shared
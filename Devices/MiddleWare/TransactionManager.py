@@ -0,0 +1,204 @@
+import threading
+import time
+
+import requests
+from hexbytes import HexBytes
+
+from Devices.Analytics.Tracing import tracer
+
+# revert reasons of FederatedModel.sol and the status they are reported with
+REVERT_REASONS={
+    "already participated":"already_participated",
+    "round not over":"round_not_over",
+    "round ended":"round_ended",
+    "not training":"not_training",
+    "invalid proof":"invalid_proof",
+    "invalid model":"invalid_model",
+    "invalid input":"invalid_input",
+    "invalid signature":"invalid_signature",
+    "only admin":"only_admin",
+    "only coordinator":"only_coordinator",
+    "only aggregator":"only_aggregator",
+}
+
+
+# status of a revert message, None if the error is not a revert
+def classify_revert(message):
+    message=str(message)
+    for reason,status in REVERT_REASONS.items():
+        if reason in message:
+            return status
+    if "revert" in message.lower():
+        return "reverted"
+    return None
+
+
+class TransactionReverted(Exception):
+    def __init__(self,transaction):
+        super().__init__(f"{transaction.function} reverted: {transaction.status} ({transaction.error})")
+        self.transaction=transaction
+
+
+class PendingTransaction:
+    def __init__(self,function,account,transaction):
+        self.function=function
+        self.account=account
+        self.transaction=transaction
+        self.nonce=transaction.get("nonce")
+        self.hash=None
+        # device and round of the submitting thread, the receipt arrives on the confirmation thread
+        self.context=tracer.current.get()
+        # perf_counter values
+        self.submitted=time.perf_counter()
+        self.confirmed=None
+        self.receipt=None
+        self.status="pending"
+        self.error=None
+        self.done=threading.Event()
+        self.lock=threading.Lock()
+        self.callbacks=[]
+
+    @property
+    def latency(self):
+        return None if self.confirmed is None else self.confirmed-self.submitted
+
+    def reverted(self):
+        return self.status not in ("pending","mined","failed")
+
+    # calls callback(transaction) on the finishing thread once the outcome is known, right away if
+    # it already is
+    def add_done_callback(self,callback):
+        with self.lock:
+            if not self.done.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    # blocks until the receipt arrived, raises TransactionReverted for a revert
+    def result(self,timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"{self.function} {self.hash} not mined after {timeout} seconds")
+        if self.reverted():
+            raise TransactionReverted(self)
+        if self.status=="failed":
+            raise self.error
+        return self.receipt
+
+
+# records the outcome of the transaction and wakes up everyone waiting for it
+def finish_transaction(pending,status,receipt=None,error=None):
+    pending.confirmed=time.perf_counter()
+    pending.status=status
+    pending.receipt=receipt
+    pending.error=error
+    device,round=pending.context
+    tracer.record("tx_confirm",pending.submitted,pending.confirmed,device=device,round=round,function=pending.function,status=status)
+    with pending.lock:
+        pending.done.set()
+        callbacks,pending.callbacks=pending.callbacks,[]
+    for callback in callbacks:
+        callback(pending)
+    return pending
+
+
+class TransactionManager:
+    # Submits contract transactions without waiting for them to be mined. Nonces are counted
+    # locally per account, so the transactions of one account can be in flight at the same time,
+    # and a single thread confirms the receipts of all pending transactions with one JSON-RPC
+    # batch per BlockPollInterval. Reverts are caught when the gas is estimated or from a failed
+    # receipt and classified by their reason instead of being retried. A transaction that is not
+    # mined within TransactionTimeout seconds is failed, so callers can retry it.
+    def __init__(self,web3Connection,config_file):
+        self.web3Connection=web3Connection
+        self.config=config_file
+        self.timeout=self.config["DEFAULT"]["TransactionTimeout"]
+        self.lock=threading.Lock()
+        self.nonces={}
+        self.pending={}
+        self.pending_changed=threading.Condition()
+        self.thread=threading.Thread(target=self.__confirm,daemon=True)
+        self.thread.start()
+
+    # function is a bound contract function, e.g. contract.functions.update_without_proof(model)
+    def submit(self,function,account):
+        transaction={"from":account,"to":function.address,"data":function._encode_transaction_data()}
+        pending=PendingTransaction(function.fn_name,account,transaction)
+        with tracer.span("tx_submit"):
+            try:
+                transaction["gas"]=self.web3Connection.eth.estimate_gas(transaction)
+            except Exception as e:
+                return finish_transaction(pending,classify_revert(e) or "failed",error=e)
+            with self.lock:
+                try:
+                    if account not in self.nonces:
+                        self.nonces[account]=self.web3Connection.eth.get_transaction_count(account,"pending")
+                    transaction["nonce"]=self.nonces[account]
+                    pending.nonce=transaction["nonce"]
+                    pending.hash="0x"+HexBytes(self.web3Connection.eth.send_transaction(transaction)).hex().replace("0x","")
+                    self.nonces[account]+=1
+                except Exception as e:
+                    # the node decides the next nonce again after a failed submission
+                    self.nonces.pop(account,None)
+                    return finish_transaction(pending,classify_revert(e) or "failed",error=e)
+        with self.pending_changed:
+            self.pending[pending.hash]=pending
+            self.pending_changed.notify_all()
+        return pending
+
+    # blocks until the transaction is mined or timed out, see PendingTransaction.result
+    def wait(self,pending):
+        if not pending.done.wait(self.timeout):
+            self.expire(pending)
+        return pending.result()
+
+    # fails a transaction that was not mined within TransactionTimeout seconds
+    def expire(self,pending):
+        with self.pending_changed:
+            # the receipt arrived in the meantime
+            if self.pending.pop(pending.hash,None) is None:
+                return
+        with self.lock:
+            # a transaction that is never mined leaves a nonce gap, the node decides the next nonce again
+            self.nonces.pop(pending.account,None)
+        finish_transaction(pending,"failed",error=TimeoutError(f"{pending.function} {pending.hash} not mined after {self.timeout} seconds"))
+
+    def __batch_receipts(self,hashes):
+        payload=[{"jsonrpc":"2.0","id":i,"method":"eth_getTransactionReceipt","params":[h]} for i,h in enumerate(hashes)]
+        response=requests.post(self.config["DEFAULT"]["EtheriumRPCServer"],json=payload,timeout=60*10).json()
+        return {hashes[entry["id"]]:entry.get("result") for entry in response}
+
+    # the revert reason of a mined transaction is only known by replaying it
+    def __revert_reason(self,pending,block_number):
+        try:
+            call={key:value for key,value in pending.transaction.items() if key!="nonce"}
+            self.web3Connection.eth.call(call,block_number-1)
+        except Exception as e:
+            return classify_revert(e) or "reverted",e
+        return "reverted",None
+
+    def __confirm(self):
+        while True:
+            with self.pending_changed:
+                self.pending_changed.wait_for(lambda: len(self.pending)>0)
+                hashes=list(self.pending)
+            try:
+                receipts=self.__batch_receipts(hashes)
+            except Exception as e:
+                print(f"Confirming {len(hashes)} transactions failed: {e}")
+                receipts={}
+            for txhash,raw in receipts.items():
+                if raw is None:
+                    continue
+                with self.pending_changed:
+                    pending=self.pending.pop(txhash,None)
+                # expired while the receipts were requested
+                if pending is None:
+                    continue
+                receipt={"transactionHash":txhash,"blockNumber":int(raw["blockNumber"],16),"gasUsed":int(raw["gasUsed"],16),
+                         "status":int(raw["status"],16),"logs":raw["logs"]}
+                if receipt["status"]==1:
+                    finish_transaction(pending,"mined",receipt=receipt)
+                else:
+                    status,error=self.__revert_reason(pending,receipt["blockNumber"])
+                    finish_transaction(pending,status,receipt=receipt,error=error)
+            time.sleep(self.config["DEFAULT"]["BlockPollInterval"])
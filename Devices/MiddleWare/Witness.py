@@ -0,0 +1,70 @@
+import json
+import re
+
+import numpy as np
+
+from Devices.MiddleWare.FieldEncoding import FieldEncoded
+
+# Encoding of the arguments of the main function of a ZoKrates program. Arguments are
+# FieldEncoded values, numpy arrays (int64 or object arrays holding field elements beyond
+# 64 bit), lists or scalars.
+
+
+def decimal_strings(arg):
+    if isinstance(arg, FieldEncoded):
+        return arg.decimal_strings()
+    # astype(str) calls str on every element in C, which also covers python ints of object arrays
+    return np.asarray(arg, dtype=object).astype(str)
+
+
+def shape_of(arg):
+    return arg.shape if isinstance(arg, FieldEncoded) else np.shape(arg)
+
+
+# all arguments as one flat list of decimal strings, the order zokrates compute-witness -a expects
+def flatten_args(args):
+    return np.concatenate([decimal_strings(arg).ravel() for arg in args]).tolist()
+
+
+# arguments as nested lists of decimal strings, the abi input format of zokrates and zokrates-js
+def abi_args(args):
+    return [decimal_strings(arg).tolist() for arg in args]
+
+
+def encode_abi_json(args):
+    return json.dumps(abi_args(args))
+
+
+# names and shapes of the parameters of main in a .zok file, array sizes may be constants
+def parse_main_signature(zok_path):
+    with open(zok_path, "r") as f:
+        source = f.read()
+    constants = {name: int(value) for name, value in re.findall(r"const\s+\w+\s+(\w+)\s*=\s*(\d+)", source)}
+    params = re.search(r"def\s+main\s*\((.*?)\)\s*->", source, re.S).group(1)
+    signature = []
+    for dims, name in re.findall(r"(?:private\s+)?field((?:\[\w+\])*)\s+(\w+)", params):
+        shape = tuple(int(dim) if dim.isdigit() else constants[dim] for dim in re.findall(r"\[(\w+)\]", dims))
+        signature.append((name, shape))
+    return signature
+
+
+def check_args(args, signature):
+    if len(args) != len(signature):
+        raise ValueError(f"main takes {len(signature)} arguments, got {len(args)}")
+    for arg, (name, shape) in zip(args, signature):
+        if shape_of(arg) != shape:
+            raise ValueError(f"Argument {name} has shape {shape_of(arg)}, main expects {shape}")
+
+
+# inverse of flatten_args, splits the flat list back into arguments of the signature's shapes
+def unflatten_args(flat, signature):
+    args = []
+    offset = 0
+    for name, shape in signature:
+        size = int(np.prod(shape, dtype=np.int64))
+        values = np.array([int(value) for value in flat[offset:offset + size]], dtype=object)
+        args.append(values.reshape(shape) if shape else values[0])
+        offset += size
+    if offset != len(flat):
+        raise ValueError(f"{len(flat) - offset} values left over after decoding all arguments")
+    return args
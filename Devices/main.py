@@ -1,25 +1,66 @@
 import sys
 import threading
 import time
+from Devices.MessageBroker.ConnectionManager import ConnectionManager
+from Devices.Analytics.Tracing import tracer
+from Devices.DeviceRunner import run_processes
+from Devices.MiddleWare.Aggregator import ModelAggregator, ProofAggregator
 from Devices.MiddleWare.BlockChainClient import BlockChainConnection
+from Devices.MiddleWare.RoundCoordinator import RoundCoordinator
 from Devices.utils.utils import read_yaml
 from Edge_Device.EdgeDevice import EdgeDevice
 from MiddleWare.Middleware import MiddleWare
 
-def start_Device(deviceName,accountNr,blockchain_connection,config_file):
-    edgeDevice = EdgeDevice(deviceName, config_file=config_file)
+def start_Device(deviceName,accountNr,blockchain_connection,config_file,connection_manager=None,aggregator=None):
+    edgeDevice = EdgeDevice(deviceName, config_file=config_file,connection_manager=connection_manager)
     thread = threading.Thread(target=edgeDevice.start_EdgeDevice)
     thread.start()
-    middleware = MiddleWare(blockchain_connection=blockchain_connection,deviceName=deviceName, accountNR=accountNr,configFile=config_file)
+    middleware = MiddleWare(blockchain_connection=blockchain_connection,deviceName=deviceName, accountNR=accountNr,configFile=config_file,connection_manager=connection_manager,aggregator=aggregator)
     middleware.start_Middleware()
 
 
 if __name__ == '__main__':
     config_file = read_yaml("/home/nikolas/MEGA/Workplace/Informatik/Masterarbeit/Implementation/PythonProject/MasterThesis_SoftwareEngineering/CONFIG.yaml")
+    if config_file["DEFAULT"]["DeviceRunner"]=="processes":
+        run_processes(config_file)
+        sys.exit(0)
+    if config_file["DEFAULT"]["DeviceRunner"]=="asyncio":
+        # aio_pika is only needed by this runner
+        from Devices.AsyncRuntime import run_asyncio
+        tracer.configure(config_file)
+        run_asyncio(config_file)
+        tracer.write()
+        sys.exit(0)
+    tracer.configure(config_file)
     blockchain_connection=BlockChainConnection(config_file=config_file)
     blockchain_connection.connect()
+    # BrokerConnections=0 keeps one blocking connection per publisher and consumer
+    connection_manager=None
+    if config_file["DEFAULT"]["BrokerConnections"]>0:
+        connection_manager=ConnectionManager(config_file["DEFAULT"]["MessageBrokerHost"],connections=config_file["DEFAULT"]["BrokerConnections"])
+        connection_manager.start()
+    aggregator=None
+    model_aggregator=None
+    if config_file["DEFAULT"]["UpdateMode"]=="aggregated" and config_file["DEFAULT"]["PerformProof"]:
+        aggregator=ProofAggregator(blockchain_connection,config_file)
+    elif config_file["DEFAULT"]["UpdateMode"]=="commitment":
+        model_aggregator=ModelAggregator(blockchain_connection,config_file)
+    coordinator=None
+    if config_file["DEFAULT"]["RoundClosing"]=="coordinator":
+        coordinator=RoundCoordinator(blockchain_connection,config_file)
+    threads=[]
     for i in range(config_file["DEFAULT"]["NumberOfParticipants"]):
-        thread=threading.Thread(target= start_Device,args=["Device_"+str(i+1),i,blockchain_connection,config_file])
+        thread=threading.Thread(target= start_Device,args=["Device_"+str(i+1),i,blockchain_connection,config_file,connection_manager,aggregator])
         thread.start()
+        threads.append(thread)
         time.sleep(1)
+    for thread in threads:
+        thread.join()
+    if aggregator is not None:
+        aggregator.close()
+    if model_aggregator is not None:
+        model_aggregator.close()
+    if coordinator is not None:
+        coordinator.close()
+    tracer.write()
 
@@ -0,0 +1,95 @@
+const fs = require("fs");
+const readline = require("readline");
+const { Worker, isMainThread, parentPort, workerData } = require("worker_threads");
+const { initialize } = require("zokrates-js");
+
+// Long lived prover: loads the compiled circuit, its abi and the proving key once and then
+// answers one JSON request per line on stdin with one JSON response per line on stdout.
+// request:  {"id": 1, "args": [...]}   arguments of main as nested arrays of decimal strings
+// response: {"id": 1, "proof": {...}, "witness_time": s, "proof_time": s} or {"id": 1, "error": "..."}
+// Requests are proven on `threads` worker threads that share the files read by the main thread,
+// so responses can arrive in a different order than the requests.
+//   node proving_worker.js out abi.json proving.key [threads]
+
+function seconds(start, end) {
+  return Number(end - start) / 1e9;
+}
+
+function prove(zokratesProvider, artifacts, provingKey, request) {
+  try {
+    const t0 = process.hrtime.bigint();
+    const { witness } = zokratesProvider.computeWitness(artifacts, request.args);
+    const t1 = process.hrtime.bigint();
+    const proof = zokratesProvider.generateProof(artifacts.program, witness, provingKey);
+    const t2 = process.hrtime.bigint();
+    return { id: request.id, proof: proof, witness_time: seconds(t0, t1), proof_time: seconds(t1, t2) };
+  } catch (e) {
+    return { id: request.id, error: String(e) };
+  }
+}
+
+function shared(path) {
+  const data = fs.readFileSync(path);
+  const buffer = new SharedArrayBuffer(data.length);
+  new Uint8Array(buffer).set(data);
+  return buffer;
+}
+
+if (isMainThread) {
+  const [outPath, abiPath, provingKeyPath, threadsArg] = process.argv.slice(2);
+  const threads = Math.max(1, parseInt(threadsArg || "1", 10));
+  const files = { program: shared(outPath), abi: fs.readFileSync(abiPath, "utf8"), provingKey: shared(provingKeyPath) };
+  const respond = (response) => process.stdout.write(JSON.stringify(response) + "\n");
+  const idle = [];
+  const queued = [];
+  let started = 0;
+
+  const dispatch = () => {
+    while (idle.length > 0 && queued.length > 0) {
+      idle.pop().postMessage(queued.shift());
+    }
+  };
+
+  for (let i = 0; i < threads; i++) {
+    const worker = new Worker(__filename, { workerData: files });
+    worker.on("message", (message) => {
+      if (message.ready) {
+        started++;
+        if (started === threads) {
+          respond({ ready: true });
+        }
+      } else {
+        respond(message);
+      }
+      idle.push(worker);
+      dispatch();
+    });
+    worker.on("error", (e) => {
+      process.stderr.write(String(e) + "\n");
+      process.exit(1);
+    });
+  }
+
+  const lines = readline.createInterface({ input: process.stdin });
+  lines.on("line", (line) => {
+    try {
+      queued.push(JSON.parse(line));
+    } catch (e) {
+      respond({ id: null, error: String(e) });
+    }
+    dispatch();
+  });
+  lines.on("close", () => process.exit(0));
+} else {
+  initialize().then((zokratesProvider) => {
+    const artifacts = {
+      program: new Uint8Array(workerData.program),
+      abi: JSON.parse(workerData.abi),
+    };
+    const provingKey = new Uint8Array(workerData.provingKey);
+    parentPort.on("message", (request) => {
+      parentPort.postMessage(prove(zokratesProvider, artifacts, provingKey, request));
+    });
+    parentPort.postMessage({ ready: true });
+  });
+}
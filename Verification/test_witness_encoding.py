@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+
+from Devices.MiddleWare.FieldEncoding import FieldEncoded
+from Devices.MiddleWare.Witness import check_args, flatten_args, parse_main_signature, unflatten_args
+
+# round trip of the witness encoding against the signature of main in root.zok, runs without zokrates
+ZOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ZoKrates", "root.zok")
+
+
+def random_args(signature, seed=0):
+    rng = np.random.default_rng(seed)
+    shapes = dict(signature)
+    precision = 1000
+    w = rng.integers(-5 * precision, 5 * precision, size=shapes["w"])
+    b = rng.integers(-5 * precision, 5 * precision, size=shapes["b"])
+    x = rng.integers(-5 * precision, 5 * precision, size=shapes["x_train"])
+    y = rng.integers(1, shapes["b"][0] + 1, size=shapes["y_train"])
+    weights, bias, x_train = FieldEncoded(w), FieldEncoded(b), FieldEncoded(x)
+    return [weights, weights.sign, bias, bias.sign, x_train, x_train.sign, y, 10, precision,
+            FieldEncoded(w - 1), FieldEncoded(b + 1)]
+
+
+def test_signature_of_root():
+    signature = parse_main_signature(ZOK_PATH)
+    assert [name for name, _ in signature] == ["w", "w_sign", "b", "b_sign", "x_train", "x_train_sign", "y_train",
+                                               "learning_rate", "pr", "w_new", "b_new"]
+    assert dict(signature)["w"] == (6, 9)
+    assert dict(signature)["x_train"] == (10, 9)
+    assert dict(signature)["learning_rate"] == ()
+
+
+def test_flatten_round_trip():
+    signature = parse_main_signature(ZOK_PATH)
+    args = random_args(signature)
+    check_args(args, signature)
+    flat = flatten_args(args)
+    decoded = unflatten_args(flat, signature)
+    assert flatten_args(decoded) == flat
+    # negative values come back as field elements
+    np.testing.assert_array_equal(decoded[0], args[0].field_elements())
+    assert decoded[7] == 10
+
+
+def test_unflatten_rejects_left_over_values():
+    signature = parse_main_signature(ZOK_PATH)
+    flat = flatten_args(random_args(signature))
+    with pytest.raises(ValueError):
+        unflatten_args(flat + ["1"], signature)
+
+
+def test_check_args_rejects_wrong_shape():
+    signature = parse_main_signature(ZOK_PATH)
+    args = random_args(signature)
+    args[4] = FieldEncoded(np.zeros((3, 9), dtype=np.int64))
+    with pytest.raises(ValueError):
+        check_args(args, signature)
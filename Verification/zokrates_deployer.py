@@ -3,35 +3,17 @@ import time
 
 import numpy as np
 
+from Devices.MiddleWare.FieldEncoding import FieldEncoded
 from Devices.MiddleWare.NeuralNet import  mse_prime
+from Devices.MiddleWare.Witness import encode_abi_json, parse_main_signature, check_args
 import numpy as np
 
-def convert_matrix(m):
-    max_field=21888242871839275222246405745257275088548364400416034343698204186575808495617
-    return np.where(m<0,max_field+m,m),np.where(m>0,0,1)
-
-def args_parser(args):
-    res=""
-    for arg in range(len(args)):
-        entry=args[arg]
-        if isinstance(entry, (list, np.ndarray)):
-            for i in range(len(entry)):
-                row_i=entry[i]
-                if isinstance(row_i, (list, np.ndarray)):
-                    for j in range(len(row_i)):
-                        val = row_i[j]
-                        res += str(val) + " "
-                else:
-                    res += str(row_i) + " "
-        else:
-            res += str(args[arg]) + " "
-    res=res[:-1]
-    return res
 zokrates="zokrates"
 batchsize=10
+zok_path="/home/nikolas/MEGA/Workplace/Informatik/Masterarbeit/Implementation/PythonProject/MasterThesis_SoftwareEngineering/Verification/ZoKrates/root.zok"
 
 t1=time.time()
-zokrates_compile=[zokrates,"compile","-i","/home/nikolas/MEGA/Workplace/Informatik/Masterarbeit/Implementation/PythonProject/MasterThesis_SoftwareEngineering/Verification/ZoKrates/root.zok",'--allow-unconstrained-variables']
+zokrates_compile=[zokrates,"compile","-i",zok_path,'--allow-unconstrained-variables']
 g= subprocess.run(zokrates_compile, capture_output=True)
 t2=time.time()
 print(f"Compilation for {batchsize} samples took {t2-t1} seconds")
@@ -50,13 +32,13 @@ weights = np.random.randn(ac, fe)*precision
 weights = np.array([[int(x) for x in y] for y in weights])
 bias = np.array([int(x) for x in bias])
 w=weights
-weights,weights_sign=convert_matrix(weights)
+weights=FieldEncoded(weights)
 b=bias
-bias,bias_sign=convert_matrix(bias)
+bias=FieldEncoded(bias)
 x_train=np.random.randn(batchsize, fe)*precision
 x_train = np.array([[int(x) for x in y] for y in x_train])
 x=x_train
-x_train,x_train_sign=convert_matrix(x_train)
+x_train=FieldEncoded(x_train)
 learning_rate=10
 Y=[]
 out=None
@@ -72,13 +54,13 @@ for X in x:
     b = b - (error / learning_rate).astype(int)
 #,bias,bias_sign,x,x_sign,1,learning_rate,precision
 out=out_layer
-args=[weights,weights_sign,bias,bias_sign,x_train,x_train_sign,Y,learning_rate,precision,convert_matrix(w)[0],convert_matrix(b)[0]]
-zokrates_compute_witness=[zokrates,"compute-witness","-a"]
-
-zokrates_compute_witness.extend(args_parser(args).split(" "))
+args=[weights,weights.sign,bias,bias.sign,x_train,x_train.sign,Y,learning_rate,precision,FieldEncoded(w),FieldEncoded(b)]
+# the encoding round trip is covered by test_witness_encoding.py
+check_args(args,parse_main_signature(zok_path))
+zokrates_compute_witness=[zokrates,"compute-witness","--abi","--stdin"]
 
 t1=time.time()
-g= subprocess.run(zokrates_compute_witness, capture_output=True)
+g= subprocess.run(zokrates_compute_witness, input=encode_abi_json(args).encode(), capture_output=True)
 t2=time.time()
 print(f"Computing witness for {batchsize} samples took {t2-t1} seconds")
 
@@ -94,5 +76,5 @@ t1=time.time()
 g= subprocess.run(zokrates_export_verifier, capture_output=True)
 t2=time.time()
 print(f"Exporting Verifier for {batchsize} samples took {t2-t1} seconds")
-conv = convert_matrix(out)
-print(conv)
\ No newline at end of file
+conv = FieldEncoded(out)
+print(conv.field_elements(),conv.sign)
\ No newline at end of file